@@ -16,8 +16,23 @@ from controllers.user_controller import user_bp
 from controllers.admin_controller import admin_bp
 from controllers.file_controller import file_bp
 from controllers.video_controller import video_bp
-from auth.auth_middleware import authenticate_jwt, authorize_admin
+from auth.auth_middleware import auth_middleware, authenticate_jwt, authorize_admin
 from models.video_model import db
+from models.schema import upgrade_schema
+from models.database import engine_options, is_sqlite_file, sqlite_pragmas, install_pragmas
+from services.media_cache import media_cache
+from services.block_cache import block_cache
+from services.stream_backend import stream_backend
+from services.upload_stream import StreamingUploadRequest
+from services.usage_ledger import usage_ledger
+from services.search_index import search_index
+from services.catalog_service import catalog_service
+from services.db_maintenance import database_maintenance
+from services.password_hasher import password_hasher
+from services.job_queue import job_queue
+from services.static_assets import StaticAssets
+from services.page_cache import page_cache
+from commands import register_commands
 
 # Load environment variables
 load_dotenv()
@@ -33,6 +48,9 @@ def create_app(config=None):
         static_url_path='/media/static'
     )
 
+    # Multipart file parts are written straight into the upload folder
+    app.request_class = StreamingUploadRequest
+
     # Enable CORS
     CORS(app)
     app.wsgi_app = ProxyFix(app.wsgi_app)
@@ -46,25 +64,158 @@ def create_app(config=None):
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev_key_change_in_production'),
         UPLOAD_FOLDER=os.environ.get('UPLOAD_FOLDER', default_uploads_path),
         MAX_CONTENT_LENGTH=100 * 1024 * 1024,
-        SQLALCHEMY_DATABASE_URI=os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///media.db'),
-        JWT_SECRET_KEY=os.environ.get('JWT_SECRET_KEY', 'jwt_secret_change_in_production')
+        # Total bytes of file and video storage; resumable uploads may exceed MAX_CONTENT_LENGTH
+        MAX_STORAGE_BYTES=int(os.environ.get('MAX_STORAGE_BYTES', 100 * 1024 * 1024)),
+        # Bytes each uploader may store; 0 means only the total limit applies
+        USER_QUOTA_BYTES=int(os.environ.get('USER_QUOTA_BYTES', 0)),
+        # Move the index of uploaded MP4s in front of their media data (see services/mp4_faststart.py)
+        VIDEO_FASTSTART=os.environ.get('VIDEO_FASTSTART', '1') != '0',
+        # Threads per process running post-upload jobs; 0 processes videos inside the upload request
+        JOB_WORKERS=int(os.environ.get('JOB_WORKERS', 1)),
+        # Seconds idle job threads wait between checks, and the retry policy of failed jobs
+        JOB_POLL_INTERVAL=int(os.environ.get('JOB_POLL_INTERVAL', 5)),
+        JOB_MAX_ATTEMPTS=int(os.environ.get('JOB_MAX_ATTEMPTS', 3)),
+        JOB_RETRY_DELAY=int(os.environ.get('JOB_RETRY_DELAY', 30)),
+        # DATABASE_URL is the older name of this setting, once read only by the user model
+        SQLALCHEMY_DATABASE_URI=os.environ.get('SQLALCHEMY_DATABASE_URI',
+                                               os.environ.get('DATABASE_URL', 'sqlite:///media.db')),
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # One pool shared by every model
+        DB_POOL_SIZE=int(os.environ.get('DB_POOL_SIZE', 5)),
+        DB_MAX_OVERFLOW=int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        DB_POOL_TIMEOUT=int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        # Pragmas applied to each SQLite connection (see models/database.py)
+        SQLITE_JOURNAL_MODE=os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        SQLITE_SYNCHRONOUS=os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        SQLITE_MMAP_SIZE=int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        SQLITE_CACHE_SIZE=int(os.environ.get('SQLITE_CACHE_SIZE', -8000)),
+        SQLITE_BUSY_TIMEOUT=int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        SQLITE_TEMP_STORE=os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+        # Seconds between background WAL checkpoints; 0 disables them
+        DB_MAINTENANCE_INTERVAL=int(os.environ.get('DB_MAINTENANCE_INTERVAL', 300)),
+        JWT_SECRET_KEY=os.environ.get('JWT_SECRET_KEY', 'jwt_secret_change_in_production'),
+        # Resolved media descriptors kept for Range-heavy playback. Deletes only clear the
+        # cache of the worker handling them, so the TTL bounds how long others may still serve
+        MEDIA_CACHE_SIZE=int(os.environ.get('MEDIA_CACHE_SIZE', 1024)),
+        MEDIA_CACHE_TTL=int(os.environ.get('MEDIA_CACHE_TTL', 30)),
+        # Bytes per process of media head blocks kept in memory (0 disables), the block size,
+        # and how far into each file blocks are cached (see services/block_cache.py)
+        BLOCK_CACHE_BYTES=int(os.environ.get('BLOCK_CACHE_BYTES', 32 * 1024 * 1024)),
+        BLOCK_CACHE_BLOCK_SIZE=int(os.environ.get('BLOCK_CACHE_BLOCK_SIZE', 256 * 1024)),
+        BLOCK_CACHE_HEAD_BYTES=int(os.environ.get('BLOCK_CACHE_HEAD_BYTES', 4 * 1024 * 1024)),
+        # How streamed ranges are read: 'sendfile', or 'mmap' with read-ahead and drop-behind
+        # page cache hints over a window of STREAM_READAHEAD_BYTES (see services/stream_backend.py)
+        STREAM_BACKEND=os.environ.get('STREAM_BACKEND', 'sendfile'),
+        STREAM_READAHEAD_BYTES=int(os.environ.get('STREAM_READAHEAD_BYTES', 4 * 1024 * 1024)),
+        STREAM_DROP_BEHIND=os.environ.get('STREAM_DROP_BEHIND', '1') != '0',
+        # Verified JWTs kept so repeated requests skip signature checks
+        TOKEN_CACHE_SIZE=int(os.environ.get('TOKEN_CACHE_SIZE', 4096)),
+        TOKEN_CACHE_TTL=int(os.environ.get('TOKEN_CACHE_TTL', 300)),
+        # bcrypt cost for new hashes; older hashes are upgraded at login
+        BCRYPT_LOG_ROUNDS=int(os.environ.get('BCRYPT_LOG_ROUNDS', 12)),
+        # Threads hashing passwords, and logins allowed to queue before 503. Each waiting login
+        # holds a request thread, so admissions are also capped at half of GUNICORN_THREADS
+        PASSWORD_HASH_WORKERS=int(os.environ.get('PASSWORD_HASH_WORKERS', 1)),
+        PASSWORD_HASH_QUEUE=int(os.environ.get('PASSWORD_HASH_QUEUE', 2)),
+        REQUEST_THREADS=int(os.environ.get('GUNICORN_THREADS', 8)),
+        # ASGI server (asgi.py): threads reading media, and threads running other Flask routes
+        ASGI_READ_THREADS=int(os.environ.get('ASGI_READ_THREADS', 4)),
+        ASGI_WSGI_THREADS=int(os.environ.get('ASGI_WSGI_THREADS', 8)),
+        # Link and serve the fingerprinted assets written by `flask build-assets` (see services/static_assets.py)
+        STATIC_FINGERPRINTS=os.environ.get('STATIC_FINGERPRINTS', '1') != '0',
+        # Render each /media page once per process and answer revalidations with 304 (see services/page_cache.py)
+        PAGE_CACHE=os.environ.get('PAGE_CACHE', '1') != '0'
     )
     if config:
         app.config.update(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(
+        app.config['SQLALCHEMY_DATABASE_URI'],
+        pool_size=app.config['DB_POOL_SIZE'],
+        max_overflow=app.config['DB_MAX_OVERFLOW'],
+        pool_timeout=app.config['DB_POOL_TIMEOUT']
+    ))
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    media_cache.configure(
+        maxsize=app.config['MEDIA_CACHE_SIZE'],
+        ttl=app.config['MEDIA_CACHE_TTL']
+    )
+    block_cache.configure(
+        max_bytes=app.config['BLOCK_CACHE_BYTES'],
+        block_size=app.config['BLOCK_CACHE_BLOCK_SIZE'],
+        head_bytes=app.config['BLOCK_CACHE_HEAD_BYTES']
+    )
+    # The cached head is read by every viewer, so it is never dropped from the page cache
+    stream_backend.configure(
+        name=app.config['STREAM_BACKEND'],
+        readahead_bytes=app.config['STREAM_READAHEAD_BYTES'],
+        drop_behind=app.config['STREAM_DROP_BEHIND'],
+        keep_head=app.config['BLOCK_CACHE_HEAD_BYTES']
+    )
+    auth_middleware.configure_cache(
+        maxsize=app.config['TOKEN_CACHE_SIZE'],
+        ttl=app.config['TOKEN_CACHE_TTL']
+    )
+    password_hasher.configure(
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_limit=app.config['PASSWORD_HASH_QUEUE'],
+        rounds=app.config['BCRYPT_LOG_ROUNDS'],
+        request_threads=app.config['REQUEST_THREADS']
+    )
 
     # Register API blueprints (unchanged)
     app.register_blueprint(auth_bp,  url_prefix='/api/auth')
     app.register_blueprint(user_bp,  url_prefix='/api/users')
     app.register_blueprint(file_bp,  url_prefix='/api/files')
     app.register_blueprint(video_bp, url_prefix='/api/videos')
-    admin_bp.before_request(authenticate_jwt)
-    admin_bp.before_request(authorize_admin)
+    # Wrap no-op views so the decorators run as before_request hooks
+    admin_bp.before_request(authenticate_jwt(lambda: None))
+    admin_bp.before_request(authorize_admin(lambda: None))
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
 
     db.init_app(app)
     with app.app_context():
+        # Before create_all so every pooled connection gets the profile
+        install_pragmas(db.engine, sqlite_pragmas(
+            journal_mode=app.config['SQLITE_JOURNAL_MODE'],
+            synchronous=app.config['SQLITE_SYNCHRONOUS'],
+            mmap_size=app.config['SQLITE_MMAP_SIZE'],
+            cache_size=app.config['SQLITE_CACHE_SIZE'],
+            busy_timeout=app.config['SQLITE_BUSY_TIMEOUT'],
+            temp_store=app.config['SQLITE_TEMP_STORE']
+        ))
         db.create_all()
+        upgrade_schema(db)
+        usage_ledger.initialize()
+        catalog_service.initialize_counters()
+        search_index.install()
+    register_commands(app)
+
+    # Job threads started per worker process by its first request. Each thread
+    # of an in-memory SQLite database would see its own empty database, so
+    # those process videos inline
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    shared_database = is_sqlite_file(uri) or not uri.startswith('sqlite')
+    job_queue.configure(
+        workers=app.config['JOB_WORKERS'] if shared_database else 0,
+        poll_interval=app.config['JOB_POLL_INTERVAL'],
+        max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+        retry_delay=app.config['JOB_RETRY_DELAY']
+    )
+    if job_queue.workers > 0:
+        @app.before_request
+        def start_job_workers():
+            job_queue.start(app)
+
+    # Checkpoint thread started per worker process by its first request
+    database_maintenance.configure(interval=app.config['DB_MAINTENANCE_INTERVAL'])
+    if is_sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']):
+        @app.before_request
+        def start_database_maintenance():
+            database_maintenance.start(app)
+
+    # Templates link static files by their fingerprinted names once assets are built
+    if app.config['STATIC_FINGERPRINTS']:
+        StaticAssets(app.static_folder).init_app(app)
 
     # Group all UI routes into a blueprint mounted at /media
     ui_bp = Blueprint(
@@ -73,40 +224,35 @@ def create_app(config=None):
         template_folder='templates'
     )
 
+    def render_page(template_name):
+        # The pages take no per-request context, so they are rendered once and served with an ETag
+        if app.config['PAGE_CACHE']:
+            return page_cache.send(template_name)
+        return render_template(template_name)
+
     @ui_bp.route('/')
     def home_page():
         # Home page for /media, shows a landing or welcome page
-        return render_template('index.html')
+        return render_page('index.html')
 
     @ui_bp.route('/login')
     def login_page():
-        return render_template('login.html')
+        return render_page('login.html')
 
     @ui_bp.route('/register')
     def register_page():
-        return render_template('register.html')
+        return render_page('register.html')
 
     @ui_bp.route('/player')
     def player_page():
-        return render_template('video_player.html')
+        return render_page('video_player.html')
 
     @ui_bp.route('/files')
     def files_page():
-        return render_template('files.html')
+        return render_page('files.html')
 
     app.register_blueprint(ui_bp, url_prefix='/media')
 
-    # JWT protections (unchanged)
-    @user_bp.before_request
-    def protect_profile():
-        if request.endpoint == 'user.profile':
-            return authenticate_jwt(lambda: None)()
-    @file_bp.before_request
-    def protect_file_routes():
-        public_endpoints = {'file.search'}
-        if request.endpoint not in public_endpoints:
-            return authenticate_jwt(lambda: None)()
-
     # Health check (unchanged)
     @app.route('/health')
     def health_check():
@@ -0,0 +1,18 @@
+"""
+ASGI Entry Point
+
+Serves the app from an asyncio server so that many slow viewers fit in one
+process: media streams are sent by coroutines instead of holding a thread
+each (see services/media_server.py), and every other route runs in the
+Flask app.
+
+Run it with uvicorn, directly or as Gunicorn workers:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8081
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:application
+"""
+from app import app
+from services.media_server import MediaServer
+
+# The application served by uvicorn
+application = MediaServer(app)
@@ -1,27 +1,102 @@
 """
 Authentication Middleware Module
 
-Contains functions critical to user authentication and authorization
+Contains functions critical to user authentication and authorization.
+
+Verified tokens are cached by digest until they expire, so the repeated
+requests of one client (such as the Range requests of a video playback)
+skip the signature check and payload decode after the first one.
 """
+import time
+import hashlib
 from functools import wraps
 from flask import request, jsonify, g
 from services.jwt_service import JWTService
+from services.cache import TTLCache
 import jwt
 
+# Verified tokens kept, and the longest time one is trusted without re-verification
+TOKEN_CACHE_SIZE = 4096
+TOKEN_CACHE_TTL = 300
+
 class AuthMiddleware:
     """
     Middleware for handling authentication and authorization.
     Uses object-oriented approach for better organization.
     """
     
-    def __init__(self, jwt_service=None):
+    def __init__(self, jwt_service=None, token_cache=None):
         """
         Initialize with dependency injection for better testability.
         
         Args:
             jwt_service: JWT service instance for token verification
+            token_cache: Cache of verified token payloads (defaults to a new TTLCache)
         """
         self.jwt_service = jwt_service or JWTService()
+        # An empty cache is falsy, so test for None explicitly
+        self.token_cache = token_cache if token_cache is not None else \
+            TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+    
+    def configure_cache(self, maxsize=None, ttl=None):
+        """Apply verified-token cache settings from the application config."""
+        self.token_cache.configure(maxsize=maxsize, ttl=ttl)
+    
+    def cache_stats(self):
+        """Report the size and hit ratio of the verified-token cache."""
+        return self.token_cache.stats()
+    
+    def verify_token(self, token):
+        """
+        Verify a token, reusing the result of an earlier verification.
+        
+        Only valid tokens are cached, keyed by their SHA-256 digest, and an
+        entry never outlives the token's exp claim.
+        
+        Args:
+            token: JWT token string
+            
+        Returns:
+            Token payload as dictionary (a copy the caller may modify)
+            
+        Raises:
+            jwt.ExpiredSignatureError: If token has expired
+            jwt.InvalidTokenError: If token is invalid
+        """
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        payload = self.token_cache.get(key)
+        if payload is None:
+            payload = self.jwt_service.verify_token(token)
+            lifetime = self.token_cache.ttl
+            if 'exp' in payload:
+                remaining = payload['exp'] - time.time()
+                lifetime = remaining if lifetime is None else min(lifetime, remaining)
+            if lifetime is None or lifetime > 0:
+                self.token_cache.set(key, payload, ttl=lifetime)
+        return dict(payload)
+    
+    def authenticate_header(self, auth_header):
+        """
+        Verify the bearer token of an Authorization header.
+        
+        Shared by ``authenticate_jwt`` and the ASGI media server, so both
+        accept the same tokens and refuse them with the same errors.
+        
+        Args:
+            auth_header: Value of the Authorization header, or None
+            
+        Returns:
+            (payload, None) for a valid token, or (None, (error message, status))
+        """
+        if not auth_header:
+            return None, ('No token provided', 401)
+        try:
+            token = auth_header.split(' ')[1] if ' ' in auth_header else auth_header
+            return self.verify_token(token), None
+        except jwt.ExpiredSignatureError:
+            return None, ('Token has expired', 401)
+        except (jwt.InvalidTokenError, IndexError):
+            return None, ('Invalid token', 403)
     
     def authenticate_jwt(self, f):
         """
@@ -35,29 +110,41 @@ class AuthMiddleware:
         """
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            auth_header = request.headers.get('Authorization')
-            
-            if not auth_header:
-                return jsonify({'error': 'No token provided'}), 401
+            user, error = self.authenticate_header(request.headers.get('Authorization'))
+            if error:
+                message, status = error
+                return jsonify({'error': message}), status
                 
-            try:
-                token = auth_header.split(' ')[1] if ' ' in auth_header else auth_header
-                user = self.jwt_service.verify_token(token)
-                
-                # Store user info in request for controllers to access
-                request.user = user
-                
-                # Also store in Flask's g object for access in the current request context
-                g.user = user
-                
-                return f(*args, **kwargs)
-            except jwt.ExpiredSignatureError:
-                return jsonify({'error': 'Token has expired'}), 401
-            except (jwt.InvalidTokenError, IndexError):
-                return jsonify({'error': 'Invalid token'}), 403
+            # Store user info in request for controllers to access
+            request.user = user
+            
+            # Also store in Flask's g object for access in the current request context
+            g.user = user
+            
+            return f(*args, **kwargs)
                 
         return decorated_function
         
+    def identify_user(self):
+        """
+        Return the user of an optional bearer token.
+        
+        For endpoints that accept anonymous requests but attribute the work to
+        the caller when a token is sent. A missing, expired or invalid token
+        is treated as anonymous.
+        
+        Returns:
+            Token payload as dictionary, or None
+        """
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return None
+        try:
+            token = auth_header.split(' ')[1] if ' ' in auth_header else auth_header
+            return self.verify_token(token)
+        except (jwt.InvalidTokenError, IndexError):
+            return None
+        
     def authorize_admin(self, f):
         """
         Decorator to check if authenticated user is an admin.
@@ -85,4 +172,5 @@ auth_middleware = AuthMiddleware()
 
 # Convenience exports for route decorators
 authenticate_jwt = auth_middleware.authenticate_jwt
-authorize_admin = auth_middleware.authorize_admin
\ No newline at end of file
+authorize_admin = auth_middleware.authorize_admin
+identify_user = auth_middleware.identify_user
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+Stream Backend Benchmark
+
+Compares the sendfile and mmap stream backends on one file streamed through
+``stream_file``, the way the WSGI endpoints serve it, with the response body
+consumed in the server's chunks. For each backend it reports throughput
+with the file already in the page cache (warm) and after dropping it
+(cold), and how much of the file is still in the page cache after a cold
+full download.
+
+The test client has no wsgi.file_wrapper, so the sendfile backend runs its
+read() fallback here. Under gunicorn it sends with os.sendfile, which does
+not go through Python at all.
+
+Run from the python/ directory; the file is created in the given directory
+(default: the current one), which should be on the storage media is served
+from. tmpfs is never evicted, so the cold numbers would mean nothing there.
+
+    python benchmarks/bench_stream_backend.py [size_mb] [runs] [directory]
+"""
+import os
+import sys
+import mmap
+import time
+import ctypes
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from services.media_stream import stream_file  # noqa: E402
+from services.stream_backend import StreamBackend  # noqa: E402
+
+
+def drop_page_cache(path):
+    """Write back and drop a file's pages from the page cache."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def resident_fraction(path):
+    """Return the fraction of a file's pages in the page cache, or None without mincore."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            # A private mapping is writable from Python's side, which ctypes needs for the address
+            mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY)
+        try:
+            pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+            vector = (ctypes.c_ubyte * pages)()
+            anchor = ctypes.c_char.from_buffer(mapped)
+            result = libc.mincore(ctypes.c_void_p(ctypes.addressof(anchor)), ctypes.c_size_t(size), vector)
+            del anchor
+            if result != 0:
+                return None
+            return sum(byte & 1 for byte in vector) / pages
+        finally:
+            mapped.close()
+    except (OSError, AttributeError):
+        return None
+
+
+def stream_once(client):
+    """Stream the whole file once and return the bytes received."""
+    response = client.get('/stream', buffered=False)
+    received = 0
+    for chunk in response.response:
+        received += len(chunk)
+    response.close()
+    return received
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    directory = sys.argv[3] if len(sys.argv) > 3 else '.'
+
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.bench')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+        size = os.path.getsize(path)
+
+        app = Flask(__name__)
+        backends = {
+            'sendfile': StreamBackend('sendfile'),
+            'mmap': StreamBackend('mmap'),
+        }
+        selected = {}
+
+        @app.route('/stream')
+        def stream():
+            return stream_file(path, 'video/mp4', backend=selected['backend'])
+
+        client = app.test_client()
+        print(f'{size_mb} MiB file in {os.path.abspath(directory)}, best of {runs} runs')
+        for name, backend in backends.items():
+            selected['backend'] = backend
+            results = {}
+            for mode in ('cold', 'warm'):
+                times = []
+                for _ in range(runs):
+                    if mode == 'cold':
+                        drop_page_cache(path)
+                    else:
+                        stream_once(client)
+                    started = time.perf_counter()
+                    assert stream_once(client) == size
+                    times.append(time.perf_counter() - started)
+                results[mode] = size / min(times) / 1e6
+            drop_page_cache(path)
+            stream_once(client)
+            resident = resident_fraction(path)
+            resident_text = f'{resident:6.1%}' if resident is not None else '   n/a'
+            print(f'{name:9} cold {results["cold"]:8.1f} MB/s   warm {results["warm"]:8.1f} MB/s   '
+                  f'cached after a cold download {resident_text}')
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Token Cache Benchmark
+
+Measures the per-request cost of authenticating a bearer token with and
+without the verified-token cache in AuthMiddleware.
+
+Run from the python/ directory:
+
+    python benchmarks/bench_token_cache.py [iterations]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth.auth_middleware import AuthMiddleware  # noqa: E402
+from services.jwt_service import JWTService  # noqa: E402
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    jwt_service = JWTService(secret_key='benchmark-secret')
+    middleware = AuthMiddleware(jwt_service)
+    token = jwt_service.generate_token({'username': 'benchmark', 'is_admin': 0, 'user_id': 1})
+    middleware.verify_token(token)
+
+    uncached = min(timeit.repeat(lambda: jwt_service.verify_token(token), number=iterations, repeat=5))
+    cached = min(timeit.repeat(lambda: middleware.verify_token(token), number=iterations, repeat=5))
+
+    per_uncached = uncached / iterations * 1e6
+    per_cached = cached / iterations * 1e6
+    print(f'verify_token (no cache): {per_uncached:8.2f} us/request')
+    print(f'verify_token (cached):   {per_cached:8.2f} us/request')
+    print(f'saving:                  {per_uncached - per_cached:8.2f} us/request ({per_uncached / per_cached:.1f}x)')
+    print(f'cache stats: {middleware.cache_stats()}')
+
+
+if __name__ == '__main__':
+    main()
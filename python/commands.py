@@ -0,0 +1,111 @@
+"""
+Commands Module
+
+Maintenance commands registered on the Flask CLI, e.g.:
+
+    flask reconcile-usage
+    flask reconcile-counters
+    flask rebuild-search-index
+    flask db-maintenance
+    flask run-jobs
+    flask backfill-metadata
+    flask build-assets
+"""
+import click
+from services.usage_ledger import usage_ledger
+from services.search_index import search_index
+from services.catalog_service import catalog_service
+from services.db_maintenance import database_maintenance
+from services.job_queue import job_queue
+from services.video_service import configured_video_service, METADATA_BATCH_SIZE
+from services import static_assets
+from models.job_model import JOB_DONE
+
+
+def register_commands(app):
+    """
+    Register the maintenance commands on an application.
+
+    Args:
+        app: Flask application
+    """
+
+    @app.cli.command('reconcile-usage')
+    def reconcile_usage():
+        """Rebuild the storage usage counters from the stored records."""
+        changes = usage_ledger.reconcile()
+        if not changes:
+            click.echo('Storage usage counters are consistent.')
+            return
+        for scope, ((old_used, old_reserved), (new_used, new_reserved)) in sorted(changes.items()):
+            click.echo(f'{scope}: used {old_used} -> {new_used}, reserved {old_reserved} -> {new_reserved}')
+
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters():
+        """Rebuild the catalog item counters from the files and videos tables."""
+        changes = catalog_service.reconcile_counters()
+        if not changes:
+            click.echo('Catalog counters are consistent.')
+            return
+        for (kind, dimension, value), (old, new) in sorted(changes.items()):
+            label = f'{kind} {dimension}' + (f' {value}' if value else '')
+            click.echo(f'{label}: {old} -> {new}')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        """Refill the full-text search index from the videos and files tables."""
+        if not search_index.available():
+            click.echo('Full-text search is not available on this database.')
+            return
+        click.echo(f'Indexed {search_index.rebuild()} titles.')
+
+    @app.cli.command('db-maintenance')
+    def db_maintenance():
+        """Checkpoint the SQLite write-ahead log and refresh planner statistics."""
+        result = database_maintenance.run_once()
+        if result is None:
+            click.echo('Database maintenance only applies to SQLite.')
+            return
+        click.echo(f"Checkpointed {result['checkpointedPages']} of {result['walPages']} WAL pages"
+                   + (' (busy)' if result['busy'] else '') + '.')
+
+    @app.cli.command('run-jobs')
+    def run_jobs():
+        """Run queued background jobs in the foreground until none is due."""
+        job_queue.requeue_stale()
+        finished = failed = 0
+        while True:
+            job = job_queue.run_next()
+            if job is None:
+                break
+            if job.status == JOB_DONE:
+                finished += 1
+            else:
+                failed += 1
+        click.echo(f'Ran {finished + failed} jobs ({failed} failed or deferred).')
+        counts = job_queue.counts()
+        if counts:
+            click.echo(', '.join(f'{status}: {count}' for status, count in sorted(counts.items())))
+
+    @app.cli.command('backfill-metadata')
+    @click.option('--batch-size', default=METADATA_BATCH_SIZE, show_default=True,
+                  help='Videos read and updated per transaction.')
+    @click.option('--workers', type=int, default=None,
+                  help='Processes parsing files (default: one per CPU, 0: no pool).')
+    @click.option('--all', 'everything', is_flag=True,
+                  help='Examine videos that already have metadata too.')
+    def backfill_metadata(batch_size, workers, everything):
+        """Read duration, resolution, bitrate and codecs of stored videos from their files."""
+        examined, unreadable = configured_video_service().backfill_metadata(
+            batch_size=max(1, batch_size), workers=workers, everything=everything,
+            progress=lambda count: click.echo(f'{count} videos examined...')
+        )
+        click.echo(f'Examined {examined} videos ({unreadable} files could not be read).')
+
+    @app.cli.command('build-assets')
+    def build_static_assets():
+        """Write fingerprinted, precompressed copies of the static files and their manifest."""
+        manifest = static_assets.build_assets(app.static_folder)
+        click.echo(f'Fingerprinted {len(manifest)} assets into {static_assets.DIST_DIR}/.')
+        if static_assets.brotli is None:
+            click.echo('Brotli is not installed; only .gz variants were written.')
@@ -8,9 +8,21 @@ Operations include:
 - (De)promoting users to/from admin status
 - Managing user approvals
 - User management operations
+- Storage usage and catalog statistics
+- Cache and database maintenance metrics
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from models.user_model import UserModel
+from services.usage_ledger import usage_ledger as shared_usage_ledger
+from services.catalog_service import catalog_service as shared_catalog_service
+from services.media_cache import media_cache
+from services.block_cache import block_cache
+from services.stream_backend import stream_backend
+from services.db_maintenance import database_maintenance
+from services.password_hasher import password_hasher
+from services.job_queue import job_queue
+from services.page_cache import page_cache
+from auth.auth_middleware import auth_middleware
 
 class AdminController:
     """
@@ -18,14 +30,18 @@ class AdminController:
     Uses a class-based approach for better organization and OOP principles.
     """
     
-    def __init__(self, user_model=None):
+    def __init__(self, user_model=None, usage_ledger=None, catalog_service=None):
         """
         Initialize with dependency injection for better testability.
         
         Args:
             user_model: The user model to use (defaults to UserModel if None)
+            usage_ledger: Storage usage ledger (defaults to the shared ledger)
+            catalog_service: Catalog service holding the item counters (defaults to the shared one)
         """
         self.user_model = user_model or UserModel()
+        self.usage_ledger = usage_ledger or shared_usage_ledger
+        self.catalog_service = catalog_service or shared_catalog_service
     
     def approve_new_user(self, user_id):
         """
@@ -125,6 +141,65 @@ class AdminController:
             print(f"Error fetching user: {err}")
             return jsonify({'error': 'Internal server error'}), 500
 
+    def get_storage_usage(self):
+        """
+        Reports stored and reserved bytes in total and per uploader.
+        
+        Returns:
+            JSON response with usage counters and limits or error
+        """
+        try:
+            total = self.usage_ledger.get_usage()
+            return jsonify({
+                'total': total.to_dict(),
+                'users': [usage.to_dict() for usage in self.usage_ledger.get_all_usage()],
+                'limits': {
+                    'totalBytes': current_app.config.get('MAX_STORAGE_BYTES'),
+                    'userBytes': current_app.config.get('USER_QUOTA_BYTES') or None
+                }
+            }), 200
+        except Exception as err:
+            print(f"Error fetching storage usage: {err}")
+            return jsonify({'error': 'Internal server error'}), 500
+
+    def get_catalog_stats(self):
+        """
+        Reports the number of videos and files in total, per MIME class and per uploader.
+        
+        Returns:
+            JSON response with catalog counters or error
+        """
+        try:
+            stats = self.catalog_service.stats()
+            return jsonify({'videos': stats['video'], 'files': stats['file']}), 200
+        except Exception as err:
+            print(f"Error fetching catalog stats: {err}")
+            return jsonify({'error': 'Internal server error'}), 500
+
+    def get_cache_metrics(self):
+        """
+        Reports size, hits and misses of the in-process caches.
+        
+        Counters are per worker process and reset when it restarts.
+        
+        Returns:
+            JSON response with cache statistics or error
+        """
+        try:
+            return jsonify({
+                'tokenCache': auth_middleware.cache_stats(),
+                'mediaCache': media_cache.stats(),
+                'blockCache': block_cache.stats(),
+                'streamBackend': stream_backend.stats(),
+                'databaseMaintenance': database_maintenance.stats(),
+                'passwordHasher': password_hasher.stats(),
+                'pageCache': page_cache.stats(),
+                'jobQueue': dict(job_queue.stats(), jobs=job_queue.counts())
+            }), 200
+        except Exception as err:
+            print(f"Error fetching cache metrics: {err}")
+            return jsonify({'error': 'Internal server error'}), 500
+
 # Create a Flask blueprint for admin routes
 admin_bp = Blueprint('admin', __name__)
 
@@ -160,4 +235,19 @@ def get_registered_users():
 @admin_bp.route('/user/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     """Route to get a specific user"""
-    return admin_controller.get_user_by_id(user_id)
\ No newline at end of file
+    return admin_controller.get_user_by_id(user_id)
+
+@admin_bp.route('/storage', methods=['GET'])
+def get_storage_usage():
+    """Route to get storage usage"""
+    return admin_controller.get_storage_usage()
+
+@admin_bp.route('/stats', methods=['GET'])
+def get_catalog_stats():
+    """Route to get catalog statistics"""
+    return admin_controller.get_catalog_stats()
+
+@admin_bp.route('/metrics', methods=['GET'])
+def get_cache_metrics():
+    """Route to get cache metrics"""
+    return admin_controller.get_cache_metrics()
\ No newline at end of file
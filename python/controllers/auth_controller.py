@@ -4,9 +4,9 @@ Authentication Controller Module
 Responsible for defining the server's response to requests and responses
 related to authentication (logging in/out)
 """
-import bcrypt
 from flask import Blueprint, request, jsonify
 from services.jwt_service import JWTService
+from services.password_hasher import HasherBusy, password_hasher as shared_password_hasher
 from models.user_model import UserModel
 
 class AuthController:
@@ -15,16 +15,18 @@ class AuthController:
     Uses a class-based approach for better organization and OOP principles.
     """
     
-    def __init__(self, user_model=None, jwt_service=None):
+    def __init__(self, user_model=None, jwt_service=None, password_hasher=None):
         """
         Initialize with dependency injection for better testability.
         
         Args:
             user_model: The user model to use (defaults to UserModel if None)
             jwt_service: The JWT service to use (defaults to JWTService if None)
+            password_hasher: Bounded bcrypt executor (defaults to the shared one)
         """
         self.user_model = user_model or UserModel()
         self.jwt_service = jwt_service or JWTService()
+        self.password_hasher = password_hasher or shared_password_hasher
     
     def login_user(self):
         """
@@ -46,15 +48,14 @@ class AuthController:
             if user.is_approved == 0:
                 return jsonify({'error': 'Your account is awaiting approval.'}), 403
                 
-            # Verify the entered password
-            # We need to encode both the input password and stored hash for bcrypt
-            valid_password = bcrypt.checkpw(
-                password.encode('utf-8'), 
-                user.password.encode('utf-8')
-            )
+            # Verify the entered password on the bcrypt pool, off the request thread
+            valid_password = self.password_hasher.verify(password, user.password)
             
             if not valid_password:
                 return jsonify({'error': 'Invalid username or password'}), 400
+
+            if self.password_hasher.needs_rehash(user.password):
+                self._rehash(user, password)
                 
             token = self.jwt_service.generate_token({
                 'username': user.username,
@@ -63,10 +64,19 @@ class AuthController:
             
             return jsonify({'token': token})
             
+        except HasherBusy as busy:
+            return jsonify({'error': str(busy)}), 503, {'Retry-After': str(busy.retry_after)}
         except Exception as err:
             print(f"Error logging in: {err}")
             return jsonify({'error': 'Server error'}), 500
             
+    def _rehash(self, user, password):
+        """Upgrade a stored hash to the configured cost; skipped while the pool is busy."""
+        try:
+            self.user_model.update_password(user.id, self.password_hasher.hash(password))
+        except HasherBusy:
+            pass
+            
     def logout_user(self):
         """
         Handles user logout.
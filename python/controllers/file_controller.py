@@ -6,10 +6,19 @@ Implements robust video streaming with byte range support and appropriate handli
 different file types (streaming vs. download).
 """
 import os
-import mimetypes
-from flask import Blueprint, request, jsonify, send_file, Response, current_app, g
+from flask import Blueprint, request, jsonify, g, current_app
 from werkzeug.utils import secure_filename
 from models.file_model import FileModel
+from services.media_stream import stream_file
+from services.block_cache import block_cache
+from services.stream_backend import stream_backend
+from services.media_cache import media_cache as shared_media_cache, upload_folder_path
+from services.upload_stream import stage_upload, staging_dir
+from services.blob_store import BlobStore
+from services.catalog_service import catalog_response
+from services.usage_ledger import usage_ledger as shared_usage_ledger, QuotaExceeded
+from models.video_model import db
+from auth.auth_middleware import authenticate_jwt
 
 class FileController:
     """
@@ -17,14 +26,18 @@ class FileController:
     Uses a class-based approach for better organization and OOP principles.
     """
     
-    def __init__(self, file_model=None):
+    def __init__(self, file_model=None, media_cache=None, usage_ledger=None):
         """
         Initialize with dependency injection for better testability.
         
         Args:
             file_model: The file model to use (defaults to FileModel if None)
+            media_cache: Descriptor cache used for streaming (defaults to the shared cache)
+            usage_ledger: Storage usage ledger (defaults to the shared ledger)
         """
         self.file_model = file_model or FileModel()
+        self.media_cache = media_cache or shared_media_cache
+        self.usage_ledger = usage_ledger or shared_usage_ledger
         
     def upload_file(self):
         """
@@ -48,26 +61,52 @@ class FileController:
             # Secure the filename to prevent any malicious file paths
             filename = secure_filename(file.filename)
             
-            # Determine file path
-            upload_folder = current_app.config['UPLOAD_FOLDER']
-            filepath = os.path.join(upload_folder, filename)
+            # Reject name clashes instead of overwriting another upload
+            if self.file_model.get_file_by_key(filename):
+                return jsonify({'error': 'A file with this name already exists'}), 409
             
-            # Save the file
-            file.save(filepath)
+            # Store the streamed body by content; size and digest were computed while it arrived
+            upload_folder = upload_folder_path()
+            blob_store = BlobStore(upload_folder)
+            staged = stage_upload(file, staging_dir(upload_folder))
+            size = staged.size
             
-            # Store file information in database
-            file_info = self.file_model.create_file_record(
-                filename=filename,
-                filepath=filepath,
-                mimetype=file.mimetype,
-                size=os.path.getsize(filepath),
-                uploaded_by=username
-            )
+            # Hold room for the upload in the total and per-user quotas
+            try:
+                self.usage_ledger.reserve(
+                    size, username,
+                    max_total=current_app.config.get('MAX_STORAGE_BYTES'),
+                    max_user=current_app.config.get('USER_QUOTA_BYTES') or None
+                )
+            except QuotaExceeded as err:
+                staged.close()
+                return jsonify({'error': str(err)}), 507
+            
+            try:
+                digest = blob_store.ingest_staged(staged)
+                
+                # Store file information in database; the commit also records the blob
+                # reference and turns the reservation into usage
+                self.usage_ledger.release(size, username)
+                file_info = self.file_model.create_file_record(
+                    filename=filename,
+                    filepath=blob_store.path_for(digest),
+                    mimetype=file.mimetype,
+                    size=size,
+                    uploaded_by=username,
+                    blob_sha256=digest
+                )
+            except Exception:
+                db.session.rollback()
+                self.usage_ledger.release(size, username)
+                db.session.commit()
+                raise
             
             return jsonify({
                 'message': 'File uploaded successfully',
                 'fileId': file_info.id,
-                'filename': file_info.filename
+                'filename': file_info.key,
+                'sha256': digest
             }), 201
             
         except Exception as err:
@@ -76,7 +115,8 @@ class FileController:
     
     def get_file_list(self):
         """
-        Gets a list of all files available to the user.
+        Gets a list of all files available to the user, newest first.
+        Supports per_page/cursor pagination and NDJSON streaming.
         
         Returns:
             JSON response with file list or error
@@ -85,12 +125,9 @@ class FileController:
             # No longer require authenticated user for file listing 
             # username = g.user.get('username')  # removed to avoid missing user error
             
-            # Get files (could filter by user permissions in a more complex implementation)
-            files = self.file_model.get_all_files()
-            
-            return jsonify({
-                'files': [file.to_dict() for file in files]
-            }), 200
+            # Get files (could filter by user permissions in a more complex implementation);
+            # read in keyset batches rather than loading every row
+            return catalog_response(('file',), 'files')
             
         except Exception as err:
             print(f"Error getting file list: {err}")
@@ -107,96 +144,42 @@ class FileController:
             File content with appropriate headers or error response
         """
         try:
-            file_info = self.file_model.get_file_by_id(file_id)
+            try:
+                media = self.media_cache.get_file(file_id)
+            except FileNotFoundError:
+                return jsonify({'error': 'File not found on server'}), 404
             
-            if not file_info:
+            if not media:
                 return jsonify({'error': 'File not found'}), 404
                 
-            filepath = file_info.filepath
-            
-            if not os.path.exists(filepath):
-                return jsonify({'error': 'File not found on server'}), 404
-                
             # Only allow video files
-            mimetype = file_info.mimetype or mimetypes.guess_type(filepath)[0]
-            if not mimetype or not mimetype.startswith('video/'):
+            if not media.mimetype or not media.mimetype.startswith('video/'):
                 return jsonify({'error': 'Only video files can be streamed or downloaded.'}), 403
                 
             # Handle streaming for video content
-            return self._stream_file(filepath, mimetype)
+            try:
+                return self._stream_file(media)
+            except FileNotFoundError:
+                # The blob vanished since it was cached
+                self.media_cache.invalidate_file(file_id)
+                return jsonify({'error': 'File not found on server'}), 404
                 
         except Exception as err:
             print(f"Error retrieving file: {err}")
             return jsonify({'error': 'An error occurred while retrieving the file'}), 500
     
-    def _stream_file(self, filepath, mimetype):
+    def _stream_file(self, media):
         """
         Streams a file with byte range support.
         
         Args:
-            filepath: Path to the file to stream
-            mimetype: MIME type of the file
+            media: MediaDescriptor of the file to stream
             
         Returns:
             Response object with appropriate headers for streaming
         """
-        file_size = os.path.getsize(filepath)
-        
-        # Handle range requests for video/audio streaming
-        range_header = request.headers.get('Range', None)
-        
-        if range_header:
-            # Parse the range header
-            byte_start, byte_end = 0, None
-            if range_header.startswith('bytes='):
-                range_str = range_header[6:].split('-')
-                if range_str[0]:
-                    byte_start = int(range_str[0])
-                if len(range_str) > 1 and range_str[1]:
-                    byte_end = int(range_str[1])
-            
-            if byte_end is None:
-                byte_end = file_size - 1
-                
-            # Make sure we don't exceed the file size
-            byte_end = min(byte_end, file_size - 1)
-            
-            # Calculate the content length
-            content_length = byte_end - byte_start + 1
-            
-            # Create response headers
-            headers = {
-                'Content-Range': f'bytes {byte_start}-{byte_end}/{file_size}',
-                'Accept-Ranges': 'bytes',
-                'Content-Length': str(content_length),
-                'Content-Type': mimetype
-            }
-            
-            # Open the file at the specified position
-            def generate():
-                with open(filepath, 'rb') as f:
-                    f.seek(byte_start)
-                    data = f.read(content_length)
-                    yield data
-            
-            return Response(generate(), 206, headers)
-        else:
-            # If no range header, return the entire file
-            def generate():
-                with open(filepath, 'rb') as f:
-                    while True:
-                        chunk = f.read(8192)  # Read in 8KB chunks
-                        if not chunk:
-                            break
-                        yield chunk
-            
-            headers = {
-                'Accept-Ranges': 'bytes',
-                'Content-Length': str(file_size),
-                'Content-Type': mimetype
-            }
-            
-            return Response(generate(), 200, headers)
+        return stream_file(media.path, media.mimetype, media.size, media.mtime, media.etag,
+                           block_cache=block_cache, backend=stream_backend)
     
     def delete_file(self, file_id):
         """
@@ -222,12 +205,22 @@ class FileController:
             if not is_admin and file_info.uploaded_by != username:
                 return jsonify({'error': 'Permission denied'}), 403
                 
-            # Delete the file from storage
-            if os.path.exists(file_info.filepath):
+            # Drop the blob reference together with the record
+            digest = file_info.blob_sha256
+            blob_store = BlobStore(upload_folder_path())
+            if digest:
+                blob_store.release(digest)
+            elif os.path.exists(file_info.filepath):
+                # Legacy files are stored by name and owned by a single record
                 os.remove(file_info.filepath)
                 
             # Delete the file record from the database
             self.file_model.delete_file(file_id)
+            self.media_cache.invalidate_file(file_id)
+            
+            # The blob file goes only once no other record references it
+            if digest:
+                blob_store.purge(digest)
             
             return jsonify({'message': 'File deleted successfully'}), 200
             
@@ -237,18 +230,23 @@ class FileController:
 
     def search_files(self):
         """
-        Searches for files based on query parameters.
+        Searches file names; accepts query, page and per_page parameters.
         
         Returns:
             JSON response with search results or error
         """
         try:
             query = request.args.get('query', '')
+            page = request.args.get('page', 1, type=int)
+            per_page = min(request.args.get('per_page', 20, type=int), 100)
             
-            files = self.file_model.search_files(query)
+            results = self.file_model.search_files(query, page=page, per_page=per_page)
             
             return jsonify({
-                'results': [file.to_dict() for file in files]
+                'results': [file.to_dict() for file in results.items],
+                'page': results.page,
+                'per_page': results.per_page,
+                'total': results.total
             }), 200
             
         except Exception as err:
@@ -262,6 +260,15 @@ file_bp = Blueprint('file', __name__)
 # Create controller instance
 file_controller = FileController()
 
+# Endpoints served without a token
+PUBLIC_ENDPOINTS = {'file.search'}
+
+@file_bp.before_request
+def protect_file_routes():
+    """Require a token for every file route except search"""
+    if request.endpoint not in PUBLIC_ENDPOINTS:
+        return authenticate_jwt(lambda: None)()
+
 # Define routes
 @file_bp.route('/upload', methods=['POST'])
 def upload():
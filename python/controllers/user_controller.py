@@ -6,9 +6,10 @@ user registration and profile management.
 """
 import os
 from flask import Blueprint, request, jsonify
-import bcrypt
 from dotenv import load_dotenv
 from models.user_model import UserModel
+from auth.auth_middleware import authenticate_jwt
+from services.password_hasher import HasherBusy, password_hasher as shared_password_hasher
 
 # Load environment variables
 load_dotenv()
@@ -19,14 +20,16 @@ class UserController:
     Uses a class-based approach for better organization and OOP principles.
     """
     
-    def __init__(self, user_model=None):
+    def __init__(self, user_model=None, password_hasher=None):
         """
         Initialize with dependency injection for better testability.
         
         Args:
             user_model: The user model to use (defaults to UserModel if None)
+            password_hasher: Bounded bcrypt executor (defaults to the shared one)
         """
         self.user_model = user_model or UserModel()
+        self.password_hasher = password_hasher or shared_password_hasher
         
     def register_user(self):
         """
@@ -59,8 +62,8 @@ class UserController:
                 # Standard users require approval
                 is_approved = 0
                 
-            # Hash the password
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            # Hash the password on the bcrypt pool, off the request thread
+            hashed_password = self.password_hasher.hash(password)
             
             # Create the user
             user = self.user_model.create(username, email, hashed_password, is_admin, is_approved)
@@ -76,6 +79,8 @@ class UserController:
                 }
             }), 201
             
+        except HasherBusy as busy:
+            return jsonify({'error': str(busy)}), 503, {'Retry-After': str(busy.retry_after)}
         except Exception as err:
             # Handle database constraint violations
             if hasattr(err, 'orig') and getattr(err.orig, 'sqlite_errorcode', None) == 19:  # SQLITE_CONSTRAINT
@@ -115,6 +120,12 @@ user_bp = Blueprint('user', __name__)
 # Create controller instance
 user_controller = UserController()
 
+@user_bp.before_request
+def protect_profile():
+    """Require a token for the profile route"""
+    if request.endpoint == 'user.profile':
+        return authenticate_jwt(lambda: None)()
+
 # Define routes
 @user_bp.route('/register', methods=['POST'])
 def register():
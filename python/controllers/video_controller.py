@@ -4,11 +4,22 @@ Video Controller Module
 Handles video-specific upload logic using VideoService and Video model.
 """
 import os
-from flask import Blueprint, request, jsonify, current_app, g
+import mimetypes
+from flask import Blueprint, request, jsonify, current_app, g, url_for
+from werkzeug.http import parse_content_range_header
 from werkzeug.utils import secure_filename
-from services.video_service import VideoService
+from services.video_service import configured_video_service
+from services.media_stream import stream_file, prewarm_range
+from services.block_cache import block_cache
+from services.stream_backend import stream_backend
+from services.mp4_index import KeyframeIndex
+from services.media_cache import media_cache
+from services.usage_ledger import QuotaExceeded
+from services.catalog_service import catalog_service, catalog_response, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from auth.auth_middleware import authenticate_jwt, authorize_admin, identify_user
 from models.file_model import File  # Import File model
-from models.video_model import Video  # Import Video model
+from models.video_model import db, Video  # Import Video model
+from models.job_model import Job
 from flask_sqlalchemy import SQLAlchemy
 
 class VideoController:
@@ -30,23 +41,246 @@ class VideoController:
             return jsonify({'error': 'Only video files are allowed.'}), 400
         title = request.form.get('title', file.filename)
         try:
-            upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-            max_storage = current_app.config.get('MAX_CONTENT_LENGTH', 100 * 1024 * 1024)
-            video_service = VideoService(upload_folder, max_storage)
-            video = video_service.upload_video(file, file.filename, title)
+            video = self._video_service().upload_video(file, file.filename, title, self._uploader())
             return jsonify({
                 'message': 'Video uploaded successfully',
                 'videoId': video.id,
                 'filename': video.key,
-                'title': video.title
+                'title': video.title,
+                'processingStatus': video.processing_status
             }), 201
         except ValueError as ve:
             # Duplicate video error
             return jsonify({'error': str(ve)}), 409
+        except QuotaExceeded as qe:
+            return jsonify({'error': str(qe)}), 507
         except Exception as err:
             print(f"Error uploading video: {err}")
             return jsonify({'error': 'An error occurred during video upload'}), 500
 
+    def create_upload(self):
+        """
+        Starts a resumable upload session.
+        Expects JSON with filename, size and optionally title and mimetype.
+        """
+        data = request.get_json(silent=True) or {}
+        filename = secure_filename(data.get('filename') or '')
+        mimetype = data.get('mimetype') or mimetypes.guess_type(filename)[0]
+        try:
+            size = int(data.get('size'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'A numeric size is required'}), 400
+        if not filename:
+            return jsonify({'error': 'No filename given'}), 400
+        if not mimetype or not mimetype.startswith('video/'):
+            return jsonify({'error': 'Only video files are allowed.'}), 400
+        title = data.get('title') or filename
+        try:
+            session = self._video_service().create_upload_session(filename, title, mimetype, size,
+                                                                  self._uploader())
+            response = jsonify(session.to_dict())
+            response.headers['Location'] = url_for('video.upload_session', upload_id=session.id)
+            response.headers['Upload-Offset'] = '0'
+            return response, 201
+        except ValueError as ve:
+            return jsonify({'error': str(ve)}), 409
+        except IOError as ioe:
+            return jsonify({'error': str(ioe)}), 507
+        except Exception as err:
+            print(f"Error creating upload session: {err}")
+            return jsonify({'error': 'An error occurred while creating the upload'}), 500
+
+    def upload_chunk(self, upload_id):
+        """
+        Writes the request body into a resumable upload at a given offset.
+        The offset comes from an Upload-Offset header or a
+        Content-Range: bytes start-end/total header.
+        """
+        length = request.content_length
+        if length is None:
+            return jsonify({'error': 'Content-Length is required'}), 411
+        offset = self._chunk_offset(length)
+        if offset is None:
+            return jsonify({'error': 'Upload-Offset or Content-Range header is required'}), 400
+        try:
+            session = self._video_service().write_upload_chunk(upload_id, offset, request.stream, length)
+            return self._session_response(session)
+        except LookupError as le:
+            return jsonify({'error': str(le)}), 404
+        except ValueError as ve:
+            return jsonify({'error': str(ve)}), 400
+        except Exception as err:
+            print(f"Error writing upload chunk: {err}")
+            return jsonify({'error': 'An error occurred while writing the chunk'}), 500
+
+    def upload_status(self, upload_id):
+        """Reports the received offset and byte ranges of a resumable upload."""
+        try:
+            session = self._video_service().get_upload_session(upload_id)
+            return self._session_response(session)
+        except LookupError as le:
+            return jsonify({'error': str(le)}), 404
+
+    def finalize_upload(self, upload_id):
+        """Completes a resumable upload and creates the video record."""
+        try:
+            video = self._video_service().finalize_upload(upload_id)
+            return jsonify({
+                'message': 'Video uploaded successfully',
+                'videoId': video.id,
+                'filename': video.key,
+                'title': video.title,
+                'processingStatus': video.processing_status
+            }), 201
+        except LookupError as le:
+            return jsonify({'error': str(le)}), 404
+        except ValueError as ve:
+            return jsonify({'error': str(ve)}), 409
+        except IOError as ioe:
+            return jsonify({'error': str(ioe)}), 507
+        except Exception as err:
+            print(f"Error finalizing upload: {err}")
+            return jsonify({'error': 'An error occurred while finalizing the upload'}), 500
+
+    def abort_upload(self, upload_id):
+        """Discards a resumable upload."""
+        try:
+            self._video_service().abort_upload(upload_id)
+            return jsonify({'message': 'Upload aborted'}), 200
+        except LookupError as le:
+            return jsonify({'error': str(le)}), 404
+
+    def delete_video(self, video_id):
+        """Deletes a video and releases its blob reference."""
+        try:
+            if not self._video_service().delete_video(video_id):
+                return jsonify({'error': 'Video not found'}), 404
+            return jsonify({'message': 'Video deleted successfully'}), 200
+        except Exception as err:
+            print(f"Error deleting video: {err}")
+            return jsonify({'error': 'An error occurred while deleting the video'}), 500
+
+    def keyframes(self, video_id):
+        """
+        Returns the keyframe table of an MP4 video. With a t parameter
+        (seconds) returns only the byte range to request for a seek to t,
+        and starts reading that range into the page cache.
+        """
+        try:
+            media = media_cache.get_video(video_id)
+        except FileNotFoundError:
+            return jsonify({'error': 'File not found on disk'}), 404
+        if not media:
+            return jsonify({'error': 'Video not found'}), 404
+        try:
+            video = Video.query.get(video_id)
+            if not video:
+                # Deleted through another worker, whose cache invalidation does not reach this one
+                media_cache.invalidate_video(video_id)
+                return jsonify({'error': 'Video not found'}), 404
+            if video.keyframe_index is None:
+                # Stored before indexing existed; index once and keep the result
+                index = self._video_service().index_keyframes(video)
+                db.session.commit()
+            else:
+                index = KeyframeIndex.from_bytes(video.keyframe_index) if video.keyframe_index else None
+            if not index:
+                return jsonify({'error': 'Video has no keyframe index'}), 404
+
+            seconds = request.args.get('t', type=float)
+            if seconds is None:
+                body = {'videoId': video_id, 'size': media.size, 'keyframes': index.to_list()}
+            else:
+                position = index.find(seconds)
+                start, end = index.byte_range(position, media.size)
+                prewarm_range(media.path, start, end - start + 1)
+                body = {
+                    'videoId': video_id,
+                    'time': round(index.seconds(position), 3),
+                    'offset': start,
+                    'range': f'bytes={start}-{end}'
+                }
+            # The table changes only with the content, which the stream ETag identifies
+            response = jsonify(body)
+            response.set_etag(media.etag)
+            return response.make_conditional(request)
+        except Exception as err:
+            print(f"Error reading keyframe index: {err}")
+            return jsonify({'error': 'An error occurred while reading the keyframe index'}), 500
+
+    def processing_status(self, video_id):
+        """Reports the post-upload processing state of a video and its jobs."""
+        video = Video.query.get(video_id)
+        if not video:
+            return jsonify({'error': 'Video not found'}), 404
+        jobs = Job.query.filter_by(video_id=video_id).order_by(Job.id).all()
+        response = jsonify({
+            'videoId': video.id,
+            # Videos stored before processing existed are served as they are
+            'processingStatus': video.processing_status or 'ready',
+            'jobs': [job.to_dict() for job in jobs]
+        })
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    def search_videos(self):
+        """Searches video titles; accepts query, page and per_page parameters."""
+        try:
+            page = request.args.get('page', 1, type=int)
+            per_page = min(request.args.get('per_page', 20, type=int), 100)
+            results = self._video_service().search_videos(request.args.get('query', ''), page, per_page)
+            return jsonify({
+                'items': [
+                    {
+                        'id': v.id,
+                        'filename': v.key,
+                        'originalName': v.title,
+                        'mimetype': v.mime_type,
+                        'size': v.size_bytes,
+                        'duration': v.duration_seconds,
+                        'width': v.width,
+                        'height': v.height,
+                        'videoCodec': v.video_codec,
+                        'type': 'video'
+                    } for v in results.items
+                ],
+                'page': results.page,
+                'per_page': results.per_page,
+                'total': results.total
+            }), 200
+        except Exception as err:
+            print(f"Error searching videos: {err}")
+            return jsonify({'error': 'An error occurred during video search'}), 500
+
+    def _video_service(self):
+        return configured_video_service()
+
+    def _uploader(self):
+        # Video uploads are open to anonymous clients; a token attributes the bytes
+        user = identify_user()
+        return user.get('username') if user else None
+
+    def _chunk_offset(self, length):
+        # Prefer the explicit offset header, fall back to Content-Range
+        if 'Upload-Offset' in request.headers:
+            try:
+                return int(request.headers['Upload-Offset'])
+            except ValueError:
+                return None
+        content_range = parse_content_range_header(request.headers.get('Content-Range'))
+        if content_range is None or content_range.start is None:
+            return None
+        if content_range.stop - content_range.start != length:
+            return None
+        return content_range.start
+
+    def _session_response(self, session):
+        response = jsonify(session.to_dict())
+        response.headers['Upload-Offset'] = str(session.received_offset())
+        response.headers['Upload-Length'] = str(session.size_bytes)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
 # Create a Flask blueprint for video routes
 video_bp = Blueprint('video', __name__)
 video_controller = VideoController()
@@ -56,102 +290,96 @@ def upload_video():
     """Route for video upload using VideoService"""
     return video_controller.upload_video()
 
+@video_bp.route('/uploads', methods=['POST'])
+def create_upload():
+    """Route to start a resumable video upload"""
+    return video_controller.create_upload()
+
+@video_bp.route('/uploads/<upload_id>', methods=['GET'])
+def upload_session(upload_id):
+    """Route to query the progress of a resumable upload"""
+    return video_controller.upload_status(upload_id)
+
+@video_bp.route('/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+def upload_chunk(upload_id):
+    """Route to send one chunk of a resumable upload"""
+    return video_controller.upload_chunk(upload_id)
+
+@video_bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Route to complete a resumable upload"""
+    return video_controller.finalize_upload(upload_id)
+
+@video_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    """Route to discard a resumable upload"""
+    return video_controller.abort_upload(upload_id)
+
+@video_bp.route('/<int:video_id>', methods=['DELETE'])
+@authenticate_jwt
+@authorize_admin
+def delete_video(video_id):
+    """Route to delete a video (admin only; videos have no owner)"""
+    return video_controller.delete_video(video_id)
+
+@video_bp.route('/keyframes/<int:video_id>', methods=['GET'])
+def video_keyframes(video_id):
+    """Route to get the keyframe byte offsets of a video, or the range for one seek"""
+    return video_controller.keyframes(video_id)
+
+@video_bp.route('/status/<int:video_id>', methods=['GET'])
+def video_processing_status(video_id):
+    """Route to get the post-upload processing state of a video"""
+    return video_controller.processing_status(video_id)
+
+@video_bp.route('/search', methods=['GET'])
+def search_videos():
+    """Route to search videos by title"""
+    return video_controller.search_videos()
+
 # Unified file and video listing endpoint
 @video_bp.route('/list_all', methods=['GET'])
 def list_all_files_and_videos():
-    """Return a unified paginated list of files and videos for the frontend browser."""
-    db = current_app.extensions['sqlalchemy'].db
-    # Get pagination params
+    """Return a cursor-paginated, newest-first list of files and videos for the frontend browser."""
+    per_page = max(1, min(request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
     try:
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 20))
-    except ValueError:
-        page = 1
-        per_page = 20
-
-    # Paginate files and videos separately, then merge
-    files_query = db.session.query(File)
-    videos_query = db.session.query(Video)
-    files_pagination = files_query.order_by(File.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
-    videos_pagination = videos_query.order_by(Video.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
-
-    file_items = [
-        {
-            'id': f.id,
-            'filename': f.key,
-            'originalName': getattr(f, 'original_name', f.key),
-            'mimetype': getattr(f, 'mimetype', None),
-            'size': getattr(f, 'size', None),
-            'type': 'file'
-        } for f in files_pagination.items
-    ]
-    video_items = [
-        {
-            'id': v.id,
-            'filename': v.key,
-            'originalName': v.title,
-            'mimetype': v.mime_type,
-            'size': v.size_bytes,
-            'type': 'video'
-        } for v in videos_pagination.items
-    ]
-    # Merge and sort by id desc (most recent first)
-    merged_items = sorted(file_items + video_items, key=lambda x: x['id'], reverse=True)
+        items, next_cursor = catalog_service.list_page(per_page, request.args.get('cursor'))
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+
+    totals = catalog_service.totals()
     return jsonify({
-        'items': merged_items,
-        'page': page,
+        'items': items,
         'per_page': per_page,
-        'total_files': files_pagination.total,
-        'total_videos': videos_pagination.total,
-        'total_items': files_pagination.total + videos_pagination.total
+        'next_cursor': next_cursor,
+        'total_files': totals['file'],
+        'total_videos': totals['video'],
+        'total_items': totals['file'] + totals['video']
     })
 
 @video_bp.route('/list', methods=['GET'])
 def list_videos():
-    """Return a list of all videos (API completeness)."""
-    db = current_app.extensions['sqlalchemy'].db
-    videos = db.session.query(Video).all()
-    video_items = [
-        {
-            'id': v.id,
-            'filename': v.key,
-            'originalName': v.title,
-            'mimetype': getattr(v, 'mime_type', 'video/*'),
-            'size': getattr(v, 'size_bytes', None),
-            'type': 'video'
-        } for v in videos
-    ]
-    return jsonify({'videos': video_items})
+    """Return the videos, newest first: all at once, one cursor page, or streamed as NDJSON."""
+    return catalog_response(('video',), 'videos')
 
 @video_bp.route('/stream/<int:video_id>', methods=['GET'])
 def stream_video(video_id):
     """Stream a video file by its video ID."""
-    db = current_app.extensions['sqlalchemy'].db
-    video = db.session.query(Video).filter_by(id=video_id).first()
-    
-    if not video:
-        print(f"DEBUG: Video ID {video_id} not found in database")
-        return jsonify({'error': 'Video not found'}), 404
-    
-    upload_folder = current_app.config.get('UPLOAD_FOLDER')
-    if not os.path.isabs(upload_folder):
-        # Convert relative path to absolute if needed
-        upload_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), upload_folder)
-    file_path = os.path.join(upload_folder, video.key)
-    
-    print(f"DEBUG: Stream request for video ID {video_id}")
-    print(f"DEBUG: Video record: key={video.key}, mime_type={video.mime_type}, size={video.size_bytes}")
-    print(f"DEBUG: Looking for file at: {file_path}")
-    
-    if not os.path.exists(file_path):
-        print(f"DEBUG: File not found at path: {file_path}")
-        return jsonify({'error': 'File not found on disk'}), 404
-    
-    # Check if the file is actually a valid video file
-    file_size = os.path.getsize(file_path)
-    print(f"DEBUG: Found file at {file_path}, size: {file_size} bytes")
-    
-    from flask import send_file
-    # Always use the correct MIME type from the Video model
-    print(f"DEBUG: Streaming file with MIME type: {video.mime_type}")
-    return send_file(file_path, mimetype=video.mime_type, as_attachment=False)
+    # A cached blob may have been replaced (faststart rewrite) since; resolve once more
+    for _ in range(2):
+        try:
+            media = media_cache.get_video(video_id)
+        except FileNotFoundError:
+            return jsonify({'error': 'File not found on disk'}), 404
+
+        if not media:
+            return jsonify({'error': 'Video not found'}), 404
+
+        # Always use the correct MIME type from the Video model
+        try:
+            return stream_file(media.path, media.mimetype, media.size, media.mtime, media.etag,
+                               block_cache=block_cache, backend=stream_backend)
+        except FileNotFoundError:
+            # The blob vanished since it was cached
+            media_cache.invalidate_video(video_id)
+    return jsonify({'error': 'File not found on disk'}), 404
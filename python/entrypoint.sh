@@ -1,5 +1,5 @@
 #!/bin/sh
-# entrypoint.sh — shape network then launch Flask
+# entrypoint.sh — shape network then launch the server
 
 # ---- network shaping ----
 # limit egress bandwidth to 150Mbps, 32KB burst, 100ms latency
@@ -0,0 +1,61 @@
+"""
+Gunicorn Configuration
+
+Production server settings, loaded automatically by ``gunicorn`` from the
+working directory:
+
+    gunicorn
+
+Video playback keeps a connection busy for minutes, so each worker serves
+requests on a pool of threads (gthread): a long stream holds one thread,
+not a whole process, and the worker's heartbeat keeps running beside it.
+Idle keep-alive connections wait in the worker's poller without a thread.
+
+Every setting can be overridden through the environment variables below or
+GUNICORN_CMD_ARGS.
+"""
+import os
+
+# The application object built by create_app, imported once in the master
+wsgi_app = 'app:app'
+preload_app = True
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8081)}"
+
+# Processes; the container may be limited to a fraction of a CPU, so keep this small
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+# Concurrent requests (streams) per process
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# Connections accepted at once, including idle keep-alive ones. A gthread
+# worker holding this many stops polling them, so keep it well above the
+# number of viewers a worker may have open
+worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 1000))
+
+# Seconds an idle client connection stays open between Range requests
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 30))
+# Seconds without a heartbeat before a worker is restarted; with gthread this
+# is not a per-request limit, so long streams are not cut off
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+# Seconds a stopping or recycled worker gets to finish the streams it serves
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 120))
+
+# Recycle workers after this many requests, staggered so they restart one at a time
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# Heartbeat files on tmpfs; a disk-backed /tmp can stall heartbeats under I/O load
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def pre_fork(server, worker):
+    """Close the master's pooled database connections so no worker inherits them."""
+    # The Flask app, also when serving asgi:application with uvicorn workers
+    from app import app
+    from models.video_model import db
+    db.get_engine(app).dispose()
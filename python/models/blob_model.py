@@ -0,0 +1,12 @@
+from datetime import datetime
+from models.video_model import db
+
+class Blob(db.Model):
+    __tablename__ = 'blobs'
+    # hex SHA-256 of the content; also names the file in the blob store
+    sha256 = db.Column(db.String(64), primary_key=True)
+    # byte-size on disk
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    # number of files/videos rows pointing at this blob
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,69 @@
+from sqlalchemy import event, inspect
+from models.video_model import db, Video
+from models.file_model import File
+
+# dimensions counted for each kind; 'all' has the empty value
+DIMENSION_ALL = 'all'
+DIMENSION_MIME = 'mime'
+DIMENSION_UPLOADER = 'uploader'
+
+class CatalogCounter(db.Model):
+    __tablename__ = 'catalog_counters'
+    # 'video' or 'file'
+    kind = db.Column(db.String(10), primary_key=True)
+    # 'all', 'mime' (major MIME type) or 'uploader'
+    dimension = db.Column(db.String(10), primary_key=True)
+    value = db.Column(db.String(100), primary_key=True, default='')
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+def mime_class(mimetype):
+    """Return the major type of a MIME type ('video' for video/mp4), or 'unknown'."""
+    if not mimetype or '/' not in mimetype:
+        return 'unknown'
+    return mimetype.split('/', 1)[0].lower()
+
+def counter_keys(kind, mimetype, uploaded_by):
+    """Return the (kind, dimension, value) counters a row contributes to."""
+    keys = [(kind, DIMENSION_ALL, ''), (kind, DIMENSION_MIME, mime_class(mimetype))]
+    if uploaded_by:
+        keys.append((kind, DIMENSION_UPLOADER, uploaded_by))
+    return keys
+
+def _bump(connection, keys, delta):
+    # internal: add delta to each counter in SQL, creating missing rows
+    table = CatalogCounter.__table__
+    for kind, dimension, value in keys:
+        match = (table.c.kind == kind) & (table.c.dimension == dimension) & (table.c.value == value)
+        result = connection.execute(table.update().where(match).values(count=table.c.count + delta))
+        if not result.rowcount:
+            connection.execute(table.insert().values(kind=kind, dimension=dimension, value=value, count=delta))
+
+# Like the storage usage counters, these follow rows flushed through the ORM;
+# `flask reconcile-counters` rebuilds them after bulk or raw SQL changes.
+def _track(model, kind, mime_attr):
+    def keys(target):
+        return counter_keys(kind, getattr(target, mime_attr), target.uploaded_by)
+
+    @event.listens_for(model, 'after_insert')
+    def inserted(mapper, connection, target):
+        _bump(connection, keys(target), 1)
+
+    @event.listens_for(model, 'after_delete')
+    def deleted(mapper, connection, target):
+        _bump(connection, keys(target), -1)
+
+    @event.listens_for(model, 'after_update')
+    def updated(mapper, connection, target):
+        state = inspect(target)
+        mime = state.attrs[mime_attr].history
+        owner = state.attrs.uploaded_by.history
+        if not (mime.has_changes() or owner.has_changes()):
+            return
+        old_mime = mime.deleted[0] if mime.deleted else getattr(target, mime_attr)
+        old_owner = owner.deleted[0] if owner.deleted else target.uploaded_by
+        old_keys, new_keys = counter_keys(kind, old_mime, old_owner), keys(target)
+        _bump(connection, [key for key in old_keys if key not in new_keys], -1)
+        _bump(connection, [key for key in new_keys if key not in old_keys], 1)
+
+_track(Video, 'video', 'mime_type')
+_track(File, 'file', 'mimetype')
@@ -0,0 +1,135 @@
+"""
+Database Module
+
+Engine settings for the shared Flask-SQLAlchemy ``db``. Every model (users,
+files, videos, ...) goes through this one engine and its connection pool.
+
+SQLite connections also get a pragma profile when they are opened. The
+default profile switches the database to write-ahead logging, so listings
+and streams keep reading while an upload commits, and makes writers wait
+for a lock (busy_timeout) instead of failing with "database is locked".
+"""
+import re
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+# Order matters: the busy timeout must be set before journal_mode, which
+# needs a lock to switch a database to WAL
+SQLITE_PRAGMAS = (
+    ('busy_timeout', 5000),
+    ('journal_mode', 'WAL'),
+    # Durable at each checkpoint rather than each commit; safe with WAL
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    # Negative sizes are in KiB: an 8 MiB page cache per connection
+    ('cache_size', -8000),
+    ('temp_store', 'MEMORY'),
+    # Truncate the WAL file back to 64 MiB after a checkpoint following a burst of uploads
+    ('journal_size_limit', 64 * 1024 * 1024),
+)
+
+
+def engine_options(database_uri, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=3600):
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS for a database URI.
+
+    SQLAlchemy 1.4 opens a new connection per checkout for SQLite files
+    (NullPool), and Flask-SQLAlchemy keeps that unless a pool is configured.
+    File databases get a QueuePool instead; its connections are handed
+    between threads one at a time, so the same-thread check is disabled.
+    In-memory databases keep Flask-SQLAlchemy's single shared connection.
+
+    Args:
+        database_uri: SQLAlchemy database URI
+        pool_size: Connections kept open in the pool
+        max_overflow: Extra connections allowed under load
+        pool_timeout: Seconds to wait for a free connection
+        pool_recycle: Seconds after which a connection is replaced
+
+    Returns:
+        Dictionary of create_engine keyword arguments
+    """
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite':
+        if not is_sqlite_file(database_uri):
+            return {}
+        return {
+            'poolclass': QueuePool,
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': pool_timeout,
+            'connect_args': {'check_same_thread': False},
+        }
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': True,
+    }
+
+
+def is_sqlite_file(database_uri):
+    """Return True if a database URI names an SQLite database file."""
+    url = make_url(database_uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def sqlite_pragmas(journal_mode=None, synchronous=None, mmap_size=None, cache_size=None,
+                   busy_timeout=None, temp_store=None):
+    """
+    Build a pragma profile from ``SQLITE_PRAGMAS`` and overrides.
+
+    Args:
+        journal_mode: Journal mode, e.g. 'WAL' or 'DELETE'
+        synchronous: Sync level, e.g. 'NORMAL' or 'FULL'
+        mmap_size: Bytes of the database file read through mmap (0 disables)
+        cache_size: Page cache size; negative values are KiB
+        busy_timeout: Milliseconds to wait for a lock before failing
+        temp_store: Where temporary tables live, 'MEMORY' or 'FILE'
+
+    Returns:
+        Tuple of (pragma, value) pairs in the order they are applied
+    """
+    overrides = {
+        'journal_mode': journal_mode, 'synchronous': synchronous, 'mmap_size': mmap_size,
+        'cache_size': cache_size, 'busy_timeout': busy_timeout, 'temp_store': temp_store,
+    }
+    return tuple(
+        (name, value if overrides.get(name) is None else overrides[name])
+        for name, value in SQLITE_PRAGMAS
+    )
+
+
+def install_pragmas(engine, pragmas=SQLITE_PRAGMAS):
+    """
+    Apply a pragma profile to every new connection of an SQLite engine.
+
+    Connections already in the pool are not changed, so call this before
+    the engine is first used.
+
+    Args:
+        engine: SQLAlchemy engine
+        pragmas: (pragma, value) pairs, e.g. from ``sqlite_pragmas``
+
+    Returns:
+        True if the engine is SQLite and the profile was installed
+    """
+    if engine.dialect.name != 'sqlite':
+        return False
+    for name, value in pragmas:
+        # Pragmas take no bound parameters, so only plain words and numbers are allowed
+        if not re.fullmatch(r'-?\w+', str(value)):
+            raise ValueError(f"Invalid value for PRAGMA {name}: {value!r}")
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', apply_pragmas)
+    return True
@@ -12,6 +12,7 @@ class File(db.Model):
     """Flask-SQLAlchemy File model for database mapping."""
     
     __tablename__ = 'files'
+    __table_args__ = (db.Index('ix_files_uploaded_at_id', 'uploaded_at', 'id'),)  # Newest-first catalog listing
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(255), unique=True, index=True, nullable=False)  # Use 'key' for consistency
     original_name = db.Column(db.String(255), nullable=False)
@@ -20,6 +21,7 @@ class File(db.Model):
     size = db.Column(db.Integer)
     uploaded_by = db.Column(db.String(50), nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    blob_sha256 = db.Column(db.String(64), index=True)  # NULL for legacy files stored by name
 
     def to_dict(self):
         """Convert file object to dictionary for API responses."""
@@ -37,7 +39,7 @@ class FileModel:
     """
     File model service class that handles database operations using Flask-SQLAlchemy.
     """
-    def create_file_record(self, filename, filepath, mimetype, size, uploaded_by):
+    def create_file_record(self, filename, filepath, mimetype, size, uploaded_by, blob_sha256=None):
         """
         Create a new file record.
         
@@ -47,6 +49,7 @@ class FileModel:
             mimetype: MIME type of the file
             size: Size of the file in bytes
             uploaded_by: Username of the uploader
+            blob_sha256: Digest of the content in the blob store, if stored there
             
         Returns:
             Created file object
@@ -57,7 +60,8 @@ class FileModel:
             filepath=filepath,
             mimetype=mimetype,
             size=size,
-            uploaded_by=uploaded_by
+            uploaded_by=uploaded_by,
+            blob_sha256=blob_sha256
         )
         db.session.add(file)
         db.session.commit()
@@ -75,6 +79,18 @@ class FileModel:
         """
         return File.query.filter_by(id=file_id).first()
 
+    def get_file_by_key(self, key):
+        """
+        Get a file by its unique key.
+        
+        Args:
+            key: File key (stored filename) to search for
+            
+        Returns:
+            File object if found, None otherwise
+        """
+        return File.query.filter_by(key=key).first()
+
     def get_all_files(self):
         """
         Get all files.
@@ -94,4 +110,37 @@ class FileModel:
         Returns:
             List of file objects uploaded by the specified user
         """
-        return File.query.filter_by(uploaded_by=username).all()
\ No newline at end of file
+        return File.query.filter_by(uploaded_by=username).all()
+
+    def search_files(self, query, page=1, per_page=20):
+        """
+        Search files by original name.
+        
+        Args:
+            query: Search text; every word is matched as a prefix
+            page: Page number (1-based)
+            per_page: Number of results per page
+            
+        Returns:
+            Pagination of matching file objects, best matches first
+        """
+        # Imported here because the search index imports this module
+        from services.search_index import search_index
+        return search_index.search_files(query, page=page, per_page=per_page)
+
+    def delete_file(self, file_id):
+        """
+        Delete a file record by ID.
+        
+        Args:
+            file_id: ID of the file to delete
+            
+        Returns:
+            True if the record was found and deleted, False otherwise
+        """
+        file = File.query.filter_by(id=file_id).first()
+        if not file:
+            return False
+        db.session.delete(file)
+        db.session.commit()
+        return True
@@ -0,0 +1,45 @@
+from datetime import datetime
+from models.video_model import db
+
+# job states
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    # serves the claim query: queued jobs, highest priority first, then oldest
+    __table_args__ = (db.Index('ix_jobs_status_priority_id', 'status', 'priority', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    # name of the handler registered with the job queue
+    kind = db.Column(db.String(50), nullable=False)
+    # video the job works on, if any
+    video_id = db.Column(db.Integer, index=True)
+    # larger numbers run first
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default=JOB_QUEUED)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    # earliest time the job may run; failed attempts push it back
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # when the current or last attempt was claimed
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # message of the last failed attempt
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'videoId': self.video_id,
+            'priority': self.priority,
+            'status': self.status,
+            'attempts': self.attempts,
+            'maxAttempts': self.max_attempts,
+            'lastError': self.last_error,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'finishedAt': self.finished_at.isoformat() if self.finished_at else None
+        }
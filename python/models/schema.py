@@ -0,0 +1,44 @@
+"""
+Schema Module
+
+Brings an existing database up to date with the models. ``db.create_all``
+only creates missing tables, so columns and indexes added to a model after
+its table was created would otherwise never reach a deployed database
+(such as the media.db volume mounted by docker-compose).
+"""
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+
+def upgrade_schema(db):
+    """
+    Add missing nullable columns and missing indexes to existing tables.
+
+    Must be called inside an application context after ``db.create_all``.
+
+    Args:
+        db: The Flask-SQLAlchemy instance whose metadata describes the schema
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    # Existing rows would have no value; this needs a manual migration
+                    print(f"Schema upgrade skipped NOT NULL column {table.name}.{column.name}")
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+                present.add(column.name)
+
+            for index in table.indexes:
+                if all(column.name in present for column in index.columns):
+                    index.create(bind=connection, checkfirst=True)
@@ -0,0 +1,56 @@
+from datetime import datetime
+from models.video_model import db
+
+class UploadSession(db.Model):
+    __tablename__ = 'upload_sessions'
+    # opaque identifier handed to the client
+    id = db.Column(db.String(32), primary_key=True)
+    # object key the finished video will be stored under
+    key = db.Column(db.String(255), nullable=False)
+    title = db.Column(db.String(255), nullable=False)
+    mime_type = db.Column(db.String(100), nullable=False)
+    # declared size of the complete upload
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    # username of the uploader, when the session was started with a token
+    uploaded_by = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    chunks = db.relationship('UploadChunk', backref='session', cascade='all, delete-orphan',
+                             order_by='UploadChunk.offset', lazy=True)
+
+    def received_ranges(self):
+        """Return the received byte ranges as merged, sorted (start, end) half-open tuples."""
+        merged = []
+        for chunk in sorted(self.chunks, key=lambda c: c.offset):
+            start, end = chunk.offset, chunk.offset + chunk.length
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def received_offset(self):
+        """Return the length of the contiguous prefix received so far."""
+        ranges = self.received_ranges()
+        if ranges and ranges[0][0] == 0:
+            return ranges[0][1]
+        return 0
+
+    def to_dict(self):
+        return {
+            'uploadId': self.id,
+            'filename': self.key,
+            'title': self.title,
+            'mimetype': self.mime_type,
+            'size': self.size_bytes,
+            'offset': self.received_offset(),
+            'received': [list(r) for r in self.received_ranges()]
+        }
+
+class UploadChunk(db.Model):
+    __tablename__ = 'upload_chunks'
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(32), db.ForeignKey('upload_sessions.id'), index=True, nullable=False)
+    # byte offset of the chunk within the upload
+    offset = db.Column(db.BigInteger, nullable=False)
+    length = db.Column(db.Integer, nullable=False)
@@ -0,0 +1,90 @@
+from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from models.video_model import db, Video
+from models.file_model import File
+
+# scope of the row holding the totals across all uploaders
+TOTAL_SCOPE = '*'
+
+# INSERT ... ON CONFLICT DO UPDATE constructs of the dialects that have one
+UPSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+class StorageUsage(db.Model):
+    __tablename__ = 'storage_usage'
+    # '*' for the global total, otherwise the uploader's username
+    scope = db.Column(db.String(50), primary_key=True)
+    # bytes held by committed files and videos rows
+    used_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    # bytes promised to uploads still in flight
+    reserved_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            'scope': self.scope,
+            'usedBytes': self.used_bytes,
+            'reservedBytes': self.reserved_bytes
+        }
+
+def apply_usage(executor, scope, used=0, reserved=0):
+    """Add deltas to one counter row in SQL, creating the row if needed."""
+    table = StorageUsage.__table__
+    upsert = UPSERTS.get(db.engine.dialect.name)
+    if upsert is not None:
+        # one statement, so two first uploads for a new scope cannot both insert
+        statement = upsert(table).values(scope=scope, used_bytes=used, reserved_bytes=reserved)
+        executor.execute(statement.on_conflict_do_update(
+            index_elements=['scope'],
+            set_={
+                'used_bytes': table.c.used_bytes + used,
+                'reserved_bytes': table.c.reserved_bytes + reserved,
+                'updated_at': datetime.utcnow()
+            }
+        ))
+        return
+    result = executor.execute(
+        table.update().where(table.c.scope == scope).values(
+            used_bytes=table.c.used_bytes + used,
+            reserved_bytes=table.c.reserved_bytes + reserved
+        )
+    )
+    if not result.rowcount:
+        # without an upsert, a concurrent first write for the scope makes this
+        # INSERT fail on the primary key and its transaction is rolled back
+        executor.execute(table.insert().values(scope=scope, used_bytes=used, reserved_bytes=reserved))
+
+def _charge(connection, username, size):
+    # internal: move size bytes of usage onto (or, negative, off) the total and the uploader
+    if not size:
+        return
+    apply_usage(connection, TOTAL_SCOPE, used=size)
+    if username:
+        apply_usage(connection, username, used=size)
+
+# The counters follow every files/videos row flushed through the ORM, inside
+# the flush's transaction. Bulk query.delete()/update() calls bypass these
+# hooks; `flask reconcile-usage` rebuilds the counters after such changes.
+def _track(model, size_attr):
+    @event.listens_for(model, 'after_insert')
+    def inserted(mapper, connection, target):
+        _charge(connection, target.uploaded_by, getattr(target, size_attr))
+
+    @event.listens_for(model, 'after_delete')
+    def deleted(mapper, connection, target):
+        _charge(connection, target.uploaded_by, -(getattr(target, size_attr) or 0))
+
+    @event.listens_for(model, 'after_update')
+    def updated(mapper, connection, target):
+        state = inspect(target)
+        size = state.attrs[size_attr].history
+        owner = state.attrs.uploaded_by.history
+        if not (size.has_changes() or owner.has_changes()):
+            return
+        old_size = size.deleted[0] if size.deleted else getattr(target, size_attr)
+        old_owner = owner.deleted[0] if owner.deleted else target.uploaded_by
+        _charge(connection, old_owner, -(old_size or 0))
+        _charge(connection, target.uploaded_by, getattr(target, size_attr))
+
+_track(Video, 'size_bytes')
+_track(File, 'size')
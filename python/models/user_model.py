@@ -2,31 +2,22 @@
 User Model Module
 
 Provides database interaction for user-related operations
-using SQLAlchemy ORM for better object-oriented design.
+using Flask-SQLAlchemy, sharing the application's engine and
+request-scoped session with the file and video models.
 """
-from sqlalchemy import Column, Integer, String, Boolean, create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
-import os
-from dotenv import load_dotenv
+from models.video_model import db  # Use the same db instance
 
-# Load environment variables
-load_dotenv()
-
-# Create SQLAlchemy base class
-Base = declarative_base()
-
-class User(Base):
-    """SQLAlchemy User model for database mapping."""
+class User(db.Model):
+    """Flask-SQLAlchemy User model for database mapping."""
     
     __tablename__ = 'users'
     
-    id = Column(Integer, primary_key=True)
-    username = Column(String(50), unique=True, nullable=False)
-    email = Column(String(100), unique=True, nullable=False)
-    password = Column(String(255), nullable=False)
-    is_admin = Column(Integer, default=0)
-    is_approved = Column(Integer, default=0)
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(50), unique=True, nullable=False)
+    email = db.Column(db.String(100), unique=True, nullable=False)
+    password = db.Column(db.String(255), nullable=False)
+    is_admin = db.Column(db.Integer, default=0)
+    is_approved = db.Column(db.Integer, default=0)
     
     def to_dict(self):
         """Convert user object to dictionary for API responses."""
@@ -43,24 +34,6 @@ class UserModel:
     User model service class that handles database operations.
     Uses OOP principles to encapsulate database logic.
     """
-    
-    def __init__(self, db_url=None):
-        """
-        Initialize the database connection.
-        
-        Args:
-            db_url: Database connection string (defaults to SQLite from env)
-        """
-        self.db_url = db_url or os.environ.get('DATABASE_URL', 'sqlite:///media.db')
-        self.engine = create_engine(self.db_url)
-        
-        # Create session factory
-        session_factory = sessionmaker(bind=self.engine)
-        self.Session = scoped_session(session_factory)
-        
-        # Create tables if they don't exist
-        Base.metadata.create_all(self.engine)
-        
     def create(self, username, email, password, is_admin=0, is_approved=0):
         """
         Create a new user.
@@ -75,21 +48,16 @@ class UserModel:
         Returns:
             Created user object
         """
-        session = self.Session()
-        try:
-            user = User(
-                username=username,
-                email=email,
-                password=password,
-                is_admin=is_admin,
-                is_approved=is_approved
-            )
-            session.add(user)
-            session.commit()
-            session.refresh(user)
-            return user
-        finally:
-            session.close()
+        user = User(
+            username=username,
+            email=email,
+            password=password,
+            is_admin=is_admin,
+            is_approved=is_approved
+        )
+        db.session.add(user)
+        db.session.commit()
+        return user
             
     def get_by_username(self, username):
         """
@@ -101,11 +69,7 @@ class UserModel:
         Returns:
             User object if found, None otherwise
         """
-        session = self.Session()
-        try:
-            return session.query(User).filter(User.username == username).first()
-        finally:
-            session.close()
+        return User.query.filter_by(username=username).first()
             
     def get_user_by_id(self, user_id):
         """
@@ -117,11 +81,7 @@ class UserModel:
         Returns:
             User object if found, None otherwise
         """
-        session = self.Session()
-        try:
-            return session.query(User).filter(User.id == user_id).first()
-        finally:
-            session.close()
+        return User.query.filter_by(id=user_id).first()
             
     def get_all_users(self):
         """
@@ -130,11 +90,7 @@ class UserModel:
         Returns:
             List of all user objects
         """
-        session = self.Session()
-        try:
-            return session.query(User).all()
-        finally:
-            session.close()
+        return User.query.all()
             
     def get_users_by_approval_status(self, is_approved):
         """
@@ -146,11 +102,7 @@ class UserModel:
         Returns:
             List of user objects with the specified approval status
         """
-        session = self.Session()
-        try:
-            return session.query(User).filter(User.is_approved == is_approved).all()
-        finally:
-            session.close()
+        return User.query.filter_by(is_approved=is_approved).all()
             
     def approve_user(self, user_id):
         """
@@ -162,17 +114,31 @@ class UserModel:
         Returns:
             True if user was found and approved, False otherwise
         """
-        session = self.Session()
-        try:
-            user = session.query(User).filter(User.id == user_id).first()
-            if user:
-                user.is_approved = 1
-                session.commit()
-                return True
-            return False
-        finally:
-            session.close()
-            
+        user = User.query.filter_by(id=user_id).first()
+        if user:
+            user.is_approved = 1
+            db.session.commit()
+            return True
+        return False
+
+    def update_password(self, user_id, password):
+        """
+        Replace a user's password hash.
+
+        Args:
+            user_id: ID of the user
+            password: New hashed password
+
+        Returns:
+            True if user was found and updated, False otherwise
+        """
+        user = User.query.filter_by(id=user_id).first()
+        if user:
+            user.password = password
+            db.session.commit()
+            return True
+        return False
+
     def count_users(self):
         """
         Count all users in the database.
@@ -180,11 +146,7 @@ class UserModel:
         Returns:
             Number of users
         """
-        session = self.Session()
-        try:
-            return session.query(User).count()
-        finally:
-            session.close()
+        return User.query.count()
             
     def delete_user(self, user_id):
         """
@@ -196,13 +158,9 @@ class UserModel:
         Returns:
             True if user was found and deleted, False otherwise
         """
-        session = self.Session()
-        try:
-            user = session.query(User).filter(User.id == user_id).first()
-            if user:
-                session.delete(user)
-                session.commit()
-                return True
-            return False
-        finally:
-            session.close()
\ No newline at end of file
+        user = User.query.filter_by(id=user_id).first()
+        if user:
+            db.session.delete(user)
+            db.session.commit()
+            return True
+        return False
\ No newline at end of file
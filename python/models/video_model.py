@@ -3,8 +3,16 @@ from datetime import datetime
 
 db = SQLAlchemy()
 
+# processing states of a stored video; NULL for videos stored before processing existed
+PROCESSING_PENDING = 'pending'
+PROCESSING_RUNNING = 'processing'
+PROCESSING_READY = 'ready'
+PROCESSING_FAILED = 'failed'
+
 class Video(db.Model): 
     __tablename__ = 'videos'
+    # serves the newest-first catalog listing
+    __table_args__ = (db.Index('ix_videos_uploaded_at_id', 'uploaded_at', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     # unique key to identify objects
     key = db.Column(db.String(255), unique=True, index=True, nullable=False)
@@ -15,4 +23,23 @@ class Video(db.Model):
     # mime type (video/mp4, etc.)
     mime_type = db.Column(db.String(100), nullable=False)
     # date of upload
-    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
\ No newline at end of file
+    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # username of the uploader, when the upload was authenticated
+    uploaded_by = db.Column(db.String(50), index=True)
+    # content digest in the blob store (NULL for videos stored under their key)
+    blob_sha256 = db.Column(db.String(64), index=True)
+    # keyframe time -> byte offset table of MP4 videos (services/mp4_index.py);
+    # empty when the video was examined and has none, NULL when not yet examined
+    keyframe_index = db.deferred(db.Column(db.LargeBinary))
+    # post-upload processing state (faststart rewrite, keyframe index)
+    processing_status = db.Column(db.String(20), index=True)
+    # technical metadata read from the container headers (services/media_metadata.py);
+    # container is NULL until the file was examined, 'unknown' if it could not be parsed
+    container = db.Column(db.String(20))
+    duration_seconds = db.Column(db.Float, index=True)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer, index=True)
+    # average bits per second over the whole file
+    bitrate = db.Column(db.Integer)
+    video_codec = db.Column(db.String(20), index=True)
+    audio_codec = db.Column(db.String(20))
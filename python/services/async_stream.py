@@ -0,0 +1,207 @@
+"""
+Async Stream Module
+
+Asyncio counterpart of ``media_stream.stream_file`` for the ASGI media
+server (asgi.py). Conditional and range requests are evaluated by the same
+``plan_stream`` and multipart helpers, so both servers answer a request with
+the same status, headers and bytes.
+
+Blocks are read with os.pread on a small thread pool shared by every stream
+of the process, and each block is handed to the server's ``send``, which
+waits while the client's socket buffer is full. A viewer draining a stream
+slowly therefore costs a suspended coroutine and one chunk of memory, not a
+thread for the whole playback.
+"""
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.datastructures import Headers
+from services.media_stream import (
+    STREAM_CHUNK_SIZE, plan_stream, new_boundary, multipart_part_headers,
+    multipart_trailer, multipart_length
+)
+
+# Threads doing blocking reads and lookups for all streams of a process
+READ_THREADS = 4
+
+
+class BlockingPool:
+    """
+    Runs blocking calls for coroutines on a bounded thread pool created per process.
+    """
+
+    def __init__(self, threads=READ_THREADS, name='media-io'):
+        """
+        Initialize without starting any threads.
+
+        Args:
+            threads: Maximum number of threads
+            name: Thread name prefix
+        """
+        self.threads = threads
+        self.name = name
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def configure(self, threads=None):
+        """Apply the thread count from the application config before first use."""
+        if threads is not None:
+            self.threads = threads
+
+    async def run(self, fn, *args):
+        """
+        Run a blocking function on the pool and wait for its result.
+
+        Args:
+            fn: Function to call
+            *args: Positional arguments for fn
+
+        Returns:
+            Return value of fn
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor(), fn, *args)
+
+    def executor(self):
+        """Return the executor of this process, creating it on first use."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Forked children inherit the executor object but none of its threads
+                    self._executor = ThreadPoolExecutor(max_workers=self.threads,
+                                                        thread_name_prefix=self.name)
+                    self._pid = os.getpid()
+        return self._executor
+
+
+def request_headers(scope):
+    """
+    Return the headers of an ASGI HTTP scope as a case-insensitive mapping.
+
+    Args:
+        scope: ASGI connection scope
+
+    Returns:
+        werkzeug Headers
+    """
+    return Headers([(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']])
+
+
+def encode_headers(headers):
+    """Encode (name, value) pairs for an ASGI response start message."""
+    return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers]
+
+
+async def send_media(scope, receive, send, path, mimetype, file_size, mtime, etag, pool,
+                     extra_headers=(), chunk_size=STREAM_CHUNK_SIZE, block_cache=None, backend=None):
+    """
+    Send a stored file as an ASGI response, honouring conditional and range headers.
+
+    The file is opened before the response starts, so a missing file raises
+    FileNotFoundError while the caller can still send an error response.
+
+    Args:
+        scope: ASGI connection scope of the request
+        receive: ASGI receive callable, watched for the client disconnecting
+        send: ASGI send callable
+        path: Path of the file to stream
+        mimetype: MIME type of the file
+        file_size: Size of the file in bytes
+        mtime: Modification time of the file
+        etag: Unquoted strong entity tag
+        pool: BlockingPool used for reads
+        extra_headers: Additional (name, value) response headers
+        chunk_size: Maximum bytes read and sent at once
+        block_cache: Optional BlockCache serving the hot head of the file from memory
+        backend: Optional StreamBackend; the mmap backend sends slices of a mapping of each range
+
+    Raises:
+        FileNotFoundError: If the file is missing
+    """
+    method = scope['method']
+    plan = plan_stream(method, request_headers(scope), file_size, mtime, etag)
+    headers = list(plan.headers.items()) + list(extra_headers)
+
+    if plan.status in (304, 416):
+        await send({'type': 'http.response.start', 'status': plan.status, 'headers': encode_headers(headers)})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    boundary = None
+    if plan.status == 200:
+        ranges = [(0, file_size - 1)] if file_size else []
+        headers += [('Content-Type', mimetype), ('Content-Length', file_size)]
+    elif len(plan.ranges) == 1:
+        ranges = plan.ranges
+        start, end = ranges[0]
+        headers += [('Content-Type', mimetype), ('Content-Range', f'bytes {start}-{end}/{file_size}'),
+                    ('Content-Length', end - start + 1)]
+    else:
+        ranges = plan.ranges
+        boundary = new_boundary()
+        headers += [('Content-Type', f'multipart/byteranges; boundary={boundary}'),
+                    ('Content-Length', multipart_length(boundary, mimetype, ranges, file_size))]
+
+    fd = await pool.run(os.open, path, os.O_RDONLY) if method != 'HEAD' else None
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, disconnected))
+    try:
+        await send({'type': 'http.response.start', 'status': plan.status, 'headers': encode_headers(headers)})
+        if fd is not None:
+            for byte_range in ranges:
+                if boundary:
+                    await _send_body(send, multipart_part_headers(boundary, mimetype, byte_range, file_size))
+                mapped = backend.map_range(fd, byte_range[0], byte_range[1] - byte_range[0] + 1) \
+                    if backend is not None else None
+                try:
+                    if not await _send_range(send, fd, byte_range, pool, chunk_size, disconnected,
+                                             block_cache, etag, mapped):
+                        return
+                finally:
+                    if mapped is not None:
+                        mapped.close()
+            if boundary:
+                await _send_body(send, multipart_trailer(boundary))
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        if fd is not None:
+            os.close(fd)
+
+
+async def _send_range(send, fd, byte_range, pool, chunk_size, disconnected, block_cache=None, etag=None,
+                      mapped=None):
+    """Send one inclusive byte range; returns False if the client went away or the file shrank."""
+    position, end = byte_range
+    while position <= end:
+        if disconnected.is_set():
+            return False
+        if block_cache is not None and block_cache.caches(position):
+            data = await pool.run(block_cache.read, fd, etag, position, end - position + 1)
+        elif mapped is not None:
+            # Sent without copying (uvicorn takes any bytes-like body); its pages are
+            # faulted in on the pool so the event loop never waits on the disk
+            data = mapped.view(position, chunk_size)
+            await pool.run(mapped.fault_in, data)
+        else:
+            data = await pool.run(os.pread, fd, min(chunk_size, end - position + 1), position)
+        if not data:
+            return False
+        position += len(data)
+        await _send_body(send, data)
+    return True
+
+
+async def _send_body(send, data):
+    """Send one fragment of a response body that continues."""
+    await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+
+async def _watch_disconnect(receive, disconnected):
+    """Set ``disconnected`` once the server reports that the client has gone."""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
@@ -0,0 +1,195 @@
+"""
+Blob Store Module
+
+Content-addressed storage for uploaded media. Each distinct content is
+stored once under its SHA-256 digest (objects/ab/cd/<digest>) and the blobs
+table counts how many files/videos rows reference it. Uploading content that
+is already stored only adds a reference; deleting a row only removes the
+blob file when its last reference goes.
+
+Reference changes are made on the current db.session and become durable
+with the caller's commit, together with the row that holds the reference.
+"""
+import os
+import hashlib
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.video_model import db
+from models.blob_model import Blob
+from services.block_cache import block_cache
+
+# Bytes read per iteration when hashing a file already on disk
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """
+    Compute the SHA-256 digest and size of a file in one pass.
+
+    Args:
+        path: Path of the file
+
+    Returns:
+        (hex digest, size in bytes) tuple
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class BlobStore:
+    """
+    Stores blobs under an upload folder and tracks their reference counts.
+    """
+
+    def __init__(self, upload_folder):
+        """
+        Initialize the store.
+
+        Args:
+            upload_folder: Upload folder the objects directory lives in
+        """
+        self.root = os.path.join(upload_folder, 'objects')
+
+    def path_for(self, digest):
+        """
+        Return the storage path of a blob.
+
+        Args:
+            digest: Hex SHA-256 digest of the content
+
+        Returns:
+            Absolute path of the blob file
+        """
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def ingest_staged(self, staged):
+        """
+        Add a reference to the content of a staged upload, storing it if new.
+
+        Args:
+            staged: StagedUpload holding the complete body
+
+        Returns:
+            Hex digest of the content
+        """
+        digest = staged.hexdigest()
+        try:
+            dest = self._add_reference(digest, staged.size)
+            # Checked after the upsert, whose write lock a concurrent purge waits on
+            if not os.path.exists(dest):
+                staged.commit(dest)
+        finally:
+            # Removes the staged copy when the content was already stored
+            staged.close()
+        return digest
+
+    def ingest_path(self, path, digest=None, size=None):
+        """
+        Add a reference to the content of a file, moving it into the store if new.
+
+        Args:
+            path: File to ingest; it is moved or removed
+            digest: Hex SHA-256 digest if already known
+            size: Size in bytes if already known
+
+        Returns:
+            Hex digest of the content
+        """
+        if digest is None or size is None:
+            digest, size = hash_file(path)
+        dest = self._add_reference(digest, size)
+        # Checked after the upsert, whose write lock a concurrent purge waits on
+        if os.path.exists(dest):
+            os.remove(path)
+        else:
+            os.replace(path, dest)
+        return digest
+
+    def release(self, digest):
+        """
+        Drop one reference to a blob, deleting its row at zero.
+
+        The blob file is left in place until ``purge`` runs after the commit.
+
+        Args:
+            digest: Hex SHA-256 digest of the content
+        """
+        blobs = Blob.__table__
+        # Decrement in SQL so concurrent releases cannot lose an update
+        db.session.execute(
+            blobs.update().where(blobs.c.sha256 == digest).values(ref_count=blobs.c.ref_count - 1)
+        )
+        db.session.execute(
+            blobs.delete().where(blobs.c.sha256 == digest).where(blobs.c.ref_count <= 0)
+        )
+
+    def purge(self, digest):
+        """
+        Unlink a blob file once no committed row references it.
+
+        The check and the unlink run under the database write lock. An ingest
+        holds that lock from its reference upsert until its commit, and only
+        looks for the blob file after the upsert. A reference being added is
+        therefore either committed and seen here, or added after the unlink
+        and stores the content again.
+
+        Args:
+            digest: Hex SHA-256 digest of the content
+
+        Returns:
+            True if the file was removed
+        """
+        try:
+            self._lock_blobs(digest)
+            if db.session.query(Blob.sha256).filter_by(sha256=digest).first() is not None:
+                return False
+            try:
+                os.remove(self.path_for(digest))
+            except FileNotFoundError:
+                return False
+        finally:
+            db.session.commit()
+        # Blocks of this process's cache; other processes evict theirs as they age
+        block_cache.invalidate(digest)
+        return True
+
+    def _lock_blobs(self, digest):
+        # internal: take the write lock that ingests hold until they commit
+        blobs = Blob.__table__
+        if db.engine.dialect.name == 'postgresql':
+            # Row locks cannot cover a row that is still being inserted
+            db.session.execute(text('LOCK TABLE blobs IN SHARE ROW EXCLUSIVE MODE'))
+        else:
+            # Any write statement makes SQLite take the database write lock, even one matching no row
+            db.session.execute(
+                blobs.update().where(blobs.c.sha256 == digest).values(ref_count=blobs.c.ref_count)
+            )
+
+    def _add_reference(self, digest, size):
+        # internal: increment (or create) the blob row and return the blob path
+        dest = self.path_for(digest)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if db.engine.dialect.name == 'sqlite':
+            # Atomic upsert so concurrent identical uploads cannot both insert
+            statement = sqlite_insert(Blob.__table__).values(sha256=digest, size_bytes=size, ref_count=1)
+            statement = statement.on_conflict_do_update(
+                index_elements=['sha256'],
+                set_={'ref_count': Blob.__table__.c.ref_count + 1}
+            )
+            db.session.execute(statement)
+        else:
+            blobs = Blob.__table__
+            updated = db.session.execute(
+                blobs.update().where(blobs.c.sha256 == digest).values(ref_count=blobs.c.ref_count + 1)
+            )
+            if not updated.rowcount:
+                db.session.execute(blobs.insert().values(sha256=digest, size_bytes=size, ref_count=1))
+        return dest
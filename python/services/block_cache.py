@@ -0,0 +1,144 @@
+"""
+Block Cache Module
+
+Keeps the hot head of popular media in memory. Every viewer of a video
+reads the same first bytes (the container header and the opening seconds),
+and on SD-card or USB storage each of those reads goes to the disk once
+the kernel has dropped the pages under the container's memory limit.
+
+Files are cut into fixed-size blocks keyed by (ETag, block number). The ETag
+of a blob is its content digest, so a rewritten or replaced file never
+serves stale blocks, and files and videos sharing a blob share its blocks.
+Only blocks within the first ``head_bytes`` of a file are cached: the rest
+of a video is read once per viewer at most and would only push the heads
+out. Blocks are evicted least recently used once the byte budget is spent.
+
+Each worker process has its own cache, so the budget is per process.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+
+class BlockCache:
+    """
+    Byte-budgeted LRU cache of file blocks with hit statistics.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, block_size=256 * 1024, head_bytes=4 * 1024 * 1024):
+        """
+        Initialize an empty cache.
+
+        Args:
+            max_bytes: Total size of the cached blocks (0 disables the cache)
+            block_size: Bytes per block
+            head_bytes: Leading bytes of each file that are cached
+        """
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.head_bytes = head_bytes
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_bytes=None, block_size=None, head_bytes=None):
+        """Apply the budget and block settings from the application config."""
+        with self._lock:
+            if block_size is not None and block_size != self.block_size:
+                # Blocks of the old size no longer line up with the new keys
+                self._blocks.clear()
+                self.size = 0
+                self.block_size = block_size
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if head_bytes is not None:
+                self.head_bytes = head_bytes
+            self._trim()
+
+    def caches(self, position):
+        """Return True if the block holding a file position is served through the cache."""
+        return self.max_bytes > 0 and position < self.head_bytes
+
+    def read(self, fd, key, position, limit):
+        """
+        Read bytes at a position through the cache, up to the end of its block.
+
+        On a miss the whole block is read from the descriptor and kept.
+
+        Args:
+            fd: Open descriptor of the file
+            key: ETag identifying the file's content
+            position: First byte to return
+            limit: Maximum number of bytes to return
+
+        Returns:
+            Bytes read, empty at the end of the file
+        """
+        number, skip = divmod(position, self.block_size)
+        block_key = (key, number)
+        with self._lock:
+            block = self._blocks.get(block_key)
+            if block is not None:
+                self._blocks.move_to_end(block_key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if block is None:
+            block = os.pread(fd, self.block_size, number * self.block_size)
+            self._store(block_key, block)
+        return block[skip:skip + limit]
+
+    def invalidate(self, key):
+        """Forget every block of a file."""
+        with self._lock:
+            for block_key in [k for k in self._blocks if k[0] == key]:
+                self.size -= len(self._blocks.pop(block_key))
+
+    def clear(self):
+        """Forget every block."""
+        with self._lock:
+            self._blocks.clear()
+            self.size = 0
+
+    def stats(self):
+        """Report the budget, contents and hit ratio of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'maxBytes': self.max_bytes,
+                'bytes': self.size,
+                'blocks': len(self._blocks),
+                'blockSize': self.block_size,
+                'headBytes': self.head_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRatio': round(self.hits / lookups, 4) if lookups else None
+            }
+
+    def _store(self, block_key, block):
+        # internal: keep a block read on a miss, evicting the least recently used ones
+        if not block or len(block) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._blocks.pop(block_key, None)
+            if previous is not None:
+                # Another thread read the same block meanwhile
+                self.size -= len(previous)
+            self._blocks[block_key] = block
+            self.size += len(block)
+            self._trim()
+
+    def _trim(self):
+        # internal: evict until the blocks fit the budget; the lock must be held
+        while self.size > self.max_bytes and self._blocks:
+            _, block = self._blocks.popitem(last=False)
+            self.size -= len(block)
+            self.evictions += 1
+
+
+# Shared instance used by the streaming endpoints
+block_cache = BlockCache()
@@ -0,0 +1,304 @@
+"""
+Catalog Service Module
+
+Lists files and videos as one catalog, newest first. Pages are fetched with
+keyset pagination: the client gets an opaque cursor naming the last item it
+saw, and the next page starts strictly after that item. Each table
+contributes at most one page of rows read from its (uploaded_at, id) index,
+so a deep page costs the same as the first one.
+
+Items are ordered by uploaded_at, then kind ('video' before 'file'), then id,
+all descending. Files uploaded before uploaded_at was recorded (NULL) come
+last.
+
+The per-kind listings (/api/videos/list, /api/files/list) page the same way
+and can stream every item as NDJSON, fetched in keyset batches.
+
+Item counts come from the catalog_counters table, which ORM hooks keep up to
+date (see models/counter_model.py), instead of COUNT(*) over each table.
+"""
+import json
+import base64
+import binascii
+from datetime import datetime
+from flask import request, jsonify
+from sqlalchemy import select, literal, null, tuple_, union_all
+from models.video_model import db, Video
+from models.file_model import File
+from services.ndjson import wants_ndjson, ndjson_response
+from models.counter_model import CatalogCounter, DIMENSION_ALL, DIMENSION_MIME, DIMENSION_UPLOADER, counter_keys
+
+# Page size bounds for catalog requests
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Rows fetched per query while iterating over a whole listing
+ITER_BATCH_SIZE = 500
+# Kinds of catalog items
+KINDS = ('video', 'file')
+
+
+def encode_cursor(item):
+    """
+    Build the cursor that continues a listing after an item.
+
+    Args:
+        item: Catalog item dict as returned by ``CatalogService.list_page``
+
+    Returns:
+        URL-safe opaque cursor string
+    """
+    key = [item['uploaded_at'], item['type'], item['id']]
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Parse a cursor made by ``encode_cursor``.
+
+    Args:
+        cursor: Cursor string from a client
+
+    Returns:
+        (uploaded_at datetime or None, kind, id) tuple
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        uploaded_at, kind, item_id = json.loads(raw)
+        if kind not in KINDS or not isinstance(item_id, int):
+            raise ValueError
+        if uploaded_at is not None:
+            uploaded_at = datetime.fromisoformat(uploaded_at)
+        return uploaded_at, kind, item_id
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+class CatalogService:
+    """
+    Builds pages of the unified file and video catalog.
+    """
+
+    def list_page(self, limit=DEFAULT_PAGE_SIZE, cursor=None, kinds=KINDS):
+        """
+        Return one page of the catalog.
+
+        Args:
+            limit: Maximum number of items on the page
+            cursor: Cursor from the previous page, or None for the first page
+            kinds: Kinds of items to list ('video', 'file')
+
+        Returns:
+            (items, next_cursor) tuple; next_cursor is None on the last page
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        return self._page(max(1, min(limit, MAX_PAGE_SIZE)), cursor, kinds)
+
+    def iter_items(self, cursor=None, kinds=KINDS, batch_size=ITER_BATCH_SIZE, between_batches=None):
+        """
+        Iterate over the catalog from a cursor to the end.
+
+        Each batch is one short keyset query, so memory stays bounded by the
+        batch size and no read stays open while the consumer is slow.
+
+        Args:
+            cursor: Cursor to start after, or None to start at the newest item
+            kinds: Kinds of items to list ('video', 'file')
+            batch_size: Items fetched per query
+            between_batches: Optional callable run after each batch, e.g. to end the transaction
+
+        Yields:
+            Catalog item dicts
+
+        Raises:
+            ValueError: If the cursor is malformed (raised before the first item)
+        """
+        while True:
+            items, cursor = self._page(batch_size, cursor, kinds)
+            if between_batches:
+                between_batches()
+            yield from items
+            if cursor is None:
+                return
+
+    def _page(self, limit, cursor, kinds):
+        # internal: one page of the given kinds, limit unchecked
+        after = decode_cursor(cursor) if cursor else None
+
+        branches = []
+        for kind, model, columns in self._sources():
+            if kind in kinds:
+                branches.extend(self._branches(kind, model, columns, after, limit + 1))
+        catalog = union_all(*branches).subquery()
+        query = select(catalog).order_by(
+            catalog.c.uploaded_at.desc(), catalog.c.type.desc(), catalog.c.id.desc()
+        ).limit(limit + 1)
+
+        rows = db.session.execute(query).mappings().all()
+        items = [self._item(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+        return items, next_cursor
+
+    def totals(self):
+        """
+        Return the number of videos and files.
+
+        Returns:
+            Dict with 'video' and 'file' counts
+        """
+        totals = {'video': 0, 'file': 0}
+        rows = db.session.query(CatalogCounter.kind, CatalogCounter.count)\
+            .filter(CatalogCounter.dimension == DIMENSION_ALL)
+        for kind, count in rows:
+            totals[kind] = count
+        return totals
+
+    def stats(self):
+        """
+        Return every counter, grouped by kind.
+
+        Returns:
+            Dict of kind -> {'total', 'byMimeClass', 'byUploader'}
+        """
+        stats = {kind: {'total': 0, 'byMimeClass': {}, 'byUploader': {}} for kind in KINDS}
+        groups = {DIMENSION_MIME: 'byMimeClass', DIMENSION_UPLOADER: 'byUploader'}
+        for counter in CatalogCounter.query.filter(CatalogCounter.count != 0):
+            entry = stats.setdefault(counter.kind, {'total': 0, 'byMimeClass': {}, 'byUploader': {}})
+            if counter.dimension == DIMENSION_ALL:
+                entry['total'] = counter.count
+            elif counter.dimension in groups:
+                entry[groups[counter.dimension]][counter.value] = counter.count
+        return stats
+
+    def initialize_counters(self):
+        """Build the counters once for a database that predates them."""
+        if CatalogCounter.query.first() is None:
+            self.reconcile_counters()
+
+    def reconcile_counters(self):
+        """
+        Rebuild every counter from the files and videos tables.
+
+        Returns:
+            Dict of (kind, dimension, value) -> (old, new) for counters that changed
+        """
+        before = {(c.kind, c.dimension, c.value): c.count for c in CatalogCounter.query}
+        after = {('video', DIMENSION_ALL, ''): 0, ('file', DIMENSION_ALL, ''): 0}
+        sources = (
+            ('video', Video.mime_type, Video.uploaded_by),
+            ('file', File.mimetype, File.uploaded_by),
+        )
+        for kind, mimetype, uploaded_by in sources:
+            grouped = db.session.query(mimetype, uploaded_by, db.func.count()).group_by(mimetype, uploaded_by)
+            for mime, owner, count in grouped:
+                for key in counter_keys(kind, mime, owner):
+                    after[key] = after.get(key, 0) + count
+
+        CatalogCounter.query.delete()
+        for (kind, dimension, value), count in after.items():
+            db.session.add(CatalogCounter(kind=kind, dimension=dimension, value=value, count=count))
+        db.session.commit()
+
+        return {
+            key: (before.get(key, 0), after.get(key, 0))
+            for key in set(before) | set(after)
+            if before.get(key, 0) != after.get(key, 0)
+        }
+
+    def _sources(self):
+        # internal: (kind, model, projected columns) of each catalog table; files have no media metadata
+        return (
+            ('video', Video, (Video.key, Video.title, Video.mime_type, Video.size_bytes,
+                              Video.duration_seconds, Video.width, Video.height, Video.video_codec)),
+            ('file', File, (File.key, File.original_name, File.mimetype, File.size,
+                            null(), null(), null(), null())),
+        )
+
+    def _branches(self, kind, model, columns, after, limit):
+        # internal: index-ordered selects of the rows of one table following the cursor
+        filename, name, mimetype, size, duration, width, height, codec = columns
+        projection = (
+            literal(kind).label('type'), model.id.label('id'), filename.label('filename'),
+            name.label('originalName'), mimetype.label('mimetype'), size.label('size'),
+            model.uploaded_by.label('uploaded_by'), model.uploaded_at.label('uploaded_at'),
+            duration.label('duration'), width.label('width'), height.label('height'),
+            codec.label('videoCodec')
+        )
+        order = (model.uploaded_at.desc(), model.id.desc())
+        nullable = model.__table__.c.uploaded_at.nullable
+
+        if after is None:
+            conditions = [model.uploaded_at.isnot(None)]
+            if nullable:
+                conditions.append(model.uploaded_at.is_(None))
+        else:
+            ts, after_kind, after_id = after
+            conditions = []
+            if ts is not None:
+                # Rows with the cursor's timestamp follow it only if they sort after it
+                if kind < after_kind:
+                    conditions.append(model.uploaded_at <= ts)
+                elif kind == after_kind:
+                    conditions.append(tuple_(model.uploaded_at, model.id) < tuple_(ts, after_id))
+                else:
+                    conditions.append(model.uploaded_at < ts)
+                if nullable:
+                    conditions.append(model.uploaded_at.is_(None))
+            elif nullable:
+                if kind < after_kind:
+                    conditions.append(model.uploaded_at.is_(None))
+                elif kind == after_kind:
+                    conditions.append(db.and_(model.uploaded_at.is_(None), model.id < after_id))
+
+        # Separate subqueries keep each condition a plain index range
+        return [
+            select(select(*projection).where(condition).order_by(*order).limit(limit).subquery())
+            for condition in conditions
+        ]
+
+    def _item(self, row):
+        # internal: JSON-ready catalog item
+        item = dict(row)
+        uploaded_at = item['uploaded_at']
+        item['uploaded_at'] = uploaded_at.isoformat() if uploaded_at else None
+        return item
+
+
+# Shared instance used by the listing endpoints
+catalog_service = CatalogService()
+
+
+def catalog_response(kinds, key):
+    """
+    Respond to a listing request for some kinds of catalog items.
+
+    Clients asking for NDJSON get a stream of every item (after ``cursor``
+    if given); requests with ``per_page`` or ``cursor`` get one page and the
+    next cursor; other requests get every item as one JSON list.
+
+    Args:
+        kinds: Kinds of items to list ('video', 'file')
+        key: JSON key the items are returned under
+
+    Returns:
+        Flask response
+    """
+    cursor = request.args.get('cursor')
+    try:
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+
+    if wants_ndjson(request):
+        # End the read transaction between batches so a slow client holds no lock
+        return ndjson_response(catalog_service.iter_items(cursor, kinds, between_batches=db.session.rollback))
+    if cursor or 'per_page' in request.args:
+        per_page = max(1, min(request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+        items, next_cursor = catalog_service.list_page(per_page, cursor, kinds)
+        return jsonify({key: items, 'per_page': per_page, 'next_cursor': next_cursor})
+    return jsonify({key: list(catalog_service.iter_items(kinds=kinds))})
@@ -0,0 +1,126 @@
+"""
+Database Maintenance Module
+
+Background upkeep for an SQLite database in WAL mode. Every interval a
+daemon thread runs a passive WAL checkpoint, which copies committed pages
+back into the database file without waiting on readers or writers, and
+``PRAGMA optimize``, which refreshes query planner statistics that have
+gone stale.
+
+The thread is started lazily by the first request a process serves, so a
+server that forks workers after loading the app (gunicorn --preload) gets
+one thread per worker rather than one orphaned in the parent.
+"""
+import os
+import time
+import threading
+from models.video_model import db
+
+
+class DatabaseMaintenance:
+    """
+    Runs periodic WAL checkpoints and planner optimization in one thread per process.
+    """
+
+    def __init__(self, interval=300):
+        """
+        Initialize without starting the thread.
+
+        Args:
+            interval: Seconds between maintenance runs (0 disables the thread)
+        """
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stop = None
+        self._thread = None
+        self.runs = 0
+        self.failures = 0
+        self.last_run = None
+        self.last_checkpoint = None
+
+    def configure(self, interval=None):
+        """Apply the maintenance interval from the application config."""
+        if interval is not None:
+            self.interval = interval
+
+    def start(self, app):
+        """
+        Start the maintenance thread for this process if it is not running.
+
+        Cheap enough to call on every request: after the first call it is a
+        process ID comparison.
+
+        Args:
+            app: Flask application whose database is maintained
+        """
+        if self._pid == os.getpid() or self.interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child inherits _pid and _thread but not the thread itself
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(app, self._stop), name='db-maintenance', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop the maintenance thread of this process and wait for it."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._stop.set()
+            self._thread.join()
+            self._pid = None
+
+    def run_once(self):
+        """
+        Checkpoint the WAL and optimize the database now.
+
+        Must be called inside an application context.
+
+        Returns:
+            Dict with the checkpoint result ('busy', 'walPages', 'checkpointedPages'),
+            or None if the database is not SQLite
+        """
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return None
+        with engine.connect() as connection:
+            # PASSIVE never blocks: pages still needed by open readers are left for next time
+            busy, wal_pages, checkpointed = connection.exec_driver_sql(
+                'PRAGMA wal_checkpoint(PASSIVE)'
+            ).first()
+            connection.exec_driver_sql('PRAGMA optimize')
+        self.runs += 1
+        self.last_run = time.time()
+        self.last_checkpoint = {'busy': busy, 'walPages': wal_pages, 'checkpointedPages': checkpointed}
+        return self.last_checkpoint
+
+    def stats(self):
+        """Report whether the thread runs and the outcome of the last run."""
+        return {
+            'running': self._pid == os.getpid() and self._thread is not None and self._thread.is_alive(),
+            'interval': self.interval,
+            'runs': self.runs,
+            'failures': self.failures,
+            'lastRun': self.last_run,
+            'lastCheckpoint': self.last_checkpoint
+        }
+
+    def _run(self, app, stop):
+        # internal: thread body, one maintenance run per interval until stopped
+        while not stop.wait(self.interval):
+            try:
+                with app.app_context():
+                    self.run_once()
+            except Exception as err:
+                self.failures += 1
+                print(f"Error during database maintenance: {err}")
+
+
+# Shared instance started by the application
+database_maintenance = DatabaseMaintenance()
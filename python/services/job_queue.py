@@ -0,0 +1,282 @@
+"""
+Job Queue Module
+
+Runs slow work (rewriting and indexing uploaded videos) outside the request
+that caused it. Jobs are rows of the jobs table, so they survive restarts
+and are shared by every worker process: a worker claims a job with a
+conditional UPDATE, which only one claimant can win.
+
+Each process runs a fixed number of daemon threads, started lazily by its
+first request like the database maintenance thread. The count caps how
+much CPU and disk bandwidth background work can take from streaming.
+Threads wake as soon as a transaction that enqueued jobs commits, and
+otherwise poll the table, which picks up jobs enqueued by other processes
+and retries whose delay has passed.
+
+Failed attempts are retried with exponential backoff up to the job's
+``max_attempts``; a handler's ``on_failure`` callback runs when the last
+attempt fails.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models.video_model import db
+from models.job_model import Job, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED
+
+# session.info key of the queues enqueued to, woken when the session commits
+NOTIFY_KEY = 'job_queue_notify'
+
+
+class JobQueue:
+    """
+    Database-backed queue of jobs run by a pool of threads per process.
+    """
+
+    def __init__(self, workers=1, poll_interval=5, max_attempts=3, retry_delay=30, stale_after=3600):
+        """
+        Initialize without starting any threads.
+
+        Args:
+            workers: Threads running jobs per process (0 runs none)
+            poll_interval: Seconds an idle thread waits before checking the table again
+            max_attempts: Attempts of a job before it is marked failed
+            retry_delay: Seconds before the first retry; doubled for each further one
+            stale_after: Seconds after which a running job is presumed lost with its process
+        """
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.stale_after = stale_after
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._stop = None
+        self._threads = []
+        self.completed = 0
+        self.failures = 0
+
+    def configure(self, workers=None, poll_interval=None, max_attempts=None, retry_delay=None):
+        """Apply the worker count and retry policy from the application config."""
+        if workers is not None:
+            self.workers = workers
+        if poll_interval is not None:
+            self.poll_interval = poll_interval
+        if max_attempts is not None:
+            self.max_attempts = max_attempts
+        if retry_delay is not None:
+            self.retry_delay = retry_delay
+
+    def register(self, kind, handler, on_failure=None):
+        """
+        Register the function that runs jobs of a kind.
+
+        Args:
+            kind: Job kind name
+            handler: Callable taking the Job, run inside an application context;
+                     raising fails the attempt
+            on_failure: Optional callable taking the Job, run after its last attempt failed
+        """
+        self._handlers[kind] = (handler, on_failure)
+
+    def enqueue(self, kind, video_id=None, priority=0, max_attempts=None):
+        """
+        Add a job to the current db.session.
+
+        The job becomes visible, and idle threads are woken, when the
+        caller commits, so a job never runs before the rows it refers to exist.
+
+        Args:
+            kind: Registered job kind
+            video_id: Video the job works on
+            priority: Larger numbers run first
+            max_attempts: Attempts before the job fails (defaults to the queue setting)
+
+        Returns:
+            The pending Job
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = Job(kind=kind, video_id=video_id, priority=priority, status=JOB_QUEUED,
+                  max_attempts=max_attempts or self.max_attempts, run_after=datetime.utcnow())
+        db.session.add(job)
+        db.session.info.setdefault(NOTIFY_KEY, set()).add(self)
+        return job
+
+    def notify(self):
+        """Wake idle threads of this process to look for jobs."""
+        self._wake.set()
+
+    def start(self, app):
+        """
+        Start this process's threads if they are not running.
+
+        Cheap enough to call on every request: after the first call it is a
+        process ID comparison.
+
+        Args:
+            app: Flask application the jobs run in
+        """
+        if self._pid == os.getpid() or self.workers <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child inherits _pid and _threads but not the threads themselves
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            self._threads = [
+                threading.Thread(target=self._run, args=(app, self._stop), name=f'job-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self):
+        """Stop this process's threads and wait for their current jobs to finish."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._stop.set()
+            self._wake.set()
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+            self._pid = None
+
+    def run_next(self):
+        """
+        Claim and run the next due job.
+
+        Must be called inside an application context.
+
+        Returns:
+            The finished Job, or None if no job was due
+        """
+        job = self._claim()
+        if job is None:
+            return None
+        handler, on_failure = self._handlers.get(job.kind, (None, None))
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind {job.kind}")
+            handler(job)
+        except Exception as err:
+            db.session.rollback()
+            print(f"Error running job {job.id} ({job.kind}): {err}")
+            self._fail(job, err, on_failure)
+        else:
+            job.status = JOB_DONE
+            job.finished_at = datetime.utcnow()
+            job.last_error = None
+            db.session.commit()
+            self.completed += 1
+        return job
+
+    def requeue_stale(self):
+        """
+        Return running jobs whose process presumably died to the queue.
+
+        Must be called inside an application context.
+
+        Returns:
+            Number of jobs requeued
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        requeued = Job.query.filter(Job.status == JOB_RUNNING, Job.started_at < cutoff)\
+            .update({'status': JOB_QUEUED}, synchronize_session=False)
+        db.session.commit()
+        return requeued
+
+    def counts(self):
+        """Return the number of jobs in each state; must be called inside an application context."""
+        return dict(db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status).all())
+
+    def stats(self):
+        """Report the threads of this process and the jobs they finished."""
+        return {
+            'workers': self.workers,
+            'running': self._pid == os.getpid() and any(thread.is_alive() for thread in self._threads),
+            'completed': self.completed,
+            'failures': self.failures
+        }
+
+    def _claim(self):
+        # internal: mark the next due job running and return it, or None
+        while True:
+            now = datetime.utcnow()
+            candidate = db.session.query(Job.id)\
+                .filter(Job.status == JOB_QUEUED, Job.run_after <= now)\
+                .order_by(Job.priority.desc(), Job.id).first()
+            if candidate is None:
+                db.session.commit()
+                return None
+            # Only one of several racing workers sees its UPDATE match the queued row
+            claimed = Job.query.filter_by(id=candidate.id, status=JOB_QUEUED).update(
+                {'status': JOB_RUNNING, 'attempts': Job.attempts + 1, 'started_at': now},
+                synchronize_session=False
+            )
+            db.session.commit()
+            if claimed:
+                return Job.query.get(candidate.id)
+
+    def _fail(self, job, err, on_failure):
+        # internal: schedule a retry with backoff, or mark the job failed for good
+        job = Job.query.get(job.id)
+        job.last_error = str(err)[:2000]
+        if job.attempts < job.max_attempts:
+            job.status = JOB_QUEUED
+            job.run_after = datetime.utcnow() + timedelta(seconds=self.retry_delay * 2 ** (job.attempts - 1))
+            db.session.commit()
+            return
+        job.status = JOB_FAILED
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        self.failures += 1
+        if on_failure is not None:
+            try:
+                on_failure(job)
+            except Exception as callback_err:
+                db.session.rollback()
+                print(f"Error in failure callback of job {job.id}: {callback_err}")
+
+    def _run(self, app, stop):
+        # internal: thread body, runs due jobs and sleeps until woken or the poll interval passes
+        try:
+            with app.app_context():
+                self.requeue_stale()
+        except Exception as err:
+            print(f"Error requeueing stale jobs: {err}")
+        while not stop.is_set():
+            try:
+                # A fresh context per job, so each starts with a clean session
+                with app.app_context():
+                    job = self.run_next()
+            except Exception as err:
+                job = None
+                print(f"Error in job worker: {err}")
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                if not stop.is_set():
+                    # Left set when stopping, so every other idle thread wakes too
+                    self._wake.clear()
+
+
+# Shared instance used by the video service and started by the application
+job_queue = JobQueue()
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_workers(session):
+    # Wake the workers once the transaction that enqueued jobs is committed
+    for queue in session.info.pop(NOTIFY_KEY, ()):
+        queue.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_enqueued(session):
+    # Jobs of a rolled back transaction were never stored
+    session.info.pop(NOTIFY_KEY, None)
@@ -0,0 +1,163 @@
+"""
+Media Cache Module
+
+Caches the resolved descriptor (path, size, MIME type, mtime, ETag) of
+streamable media by ID. A video element issues many Range requests per
+playback; with the descriptor cached, a steady-state request needs neither a
+database query nor a stat call before the file is opened.
+
+Entries expire after a TTL and are evicted LRU when the cache is full.
+Uploads and deletes invalidate affected entries explicitly, but only in the
+process that handled them: every worker has its own cache. Until the TTL
+runs out, another worker can keep serving a deleted record whose blob
+still exists because a second record shares it. The TTL is kept short for
+that reason; a deleted record whose blob was purged fails to open and is
+not served.
+"""
+import os
+import mimetypes
+from collections import namedtuple
+from flask import current_app
+from models.file_model import File
+from models.video_model import Video
+from services.blob_store import BlobStore
+from services.cache import TTLCache
+from services.media_stream import make_etag
+
+MediaDescriptor = namedtuple('MediaDescriptor', ['path', 'size', 'mimetype', 'mtime', 'etag'])
+
+
+def upload_folder_path():
+    """
+    Return the configured upload folder as an absolute path.
+
+    Returns:
+        Absolute upload folder path
+    """
+    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+    if not os.path.isabs(upload_folder):
+        # Relative folders are resolved against the python/ directory
+        upload_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), upload_folder)
+    return upload_folder
+
+
+class MediaCache:
+    """
+    Resolves file and video IDs to media descriptors through a TTL/LRU cache.
+    """
+
+    def __init__(self, maxsize=1024, ttl=30):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of descriptors kept
+            ttl: Lifetime of a descriptor in seconds
+        """
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def configure(self, maxsize=None, ttl=None):
+        """Apply size and lifetime settings from the application config."""
+        self.cache.configure(maxsize=maxsize, ttl=ttl)
+
+    def get_file(self, file_id):
+        """
+        Resolve an entry of the files table.
+
+        Args:
+            file_id: ID of the file
+
+        Returns:
+            MediaDescriptor, or None if no such record exists
+
+        Raises:
+            FileNotFoundError: If the record exists but its blob is missing
+        """
+        key = ('file', file_id)
+        descriptor = self.cache.get(key)
+        if descriptor is None:
+            file_info = File.query.get(file_id)
+            if not file_info:
+                return None
+            mimetype = file_info.mimetype or mimetypes.guess_type(file_info.filepath)[0]
+            descriptor = self._describe(file_info.filepath, mimetype, file_info.blob_sha256)
+            self.cache.set(key, descriptor)
+        return descriptor
+
+    def get_video(self, video_id):
+        """
+        Resolve an entry of the videos table.
+
+        Args:
+            video_id: ID of the video
+
+        Returns:
+            MediaDescriptor, or None if no such record exists
+
+        Raises:
+            FileNotFoundError: If the record exists but its blob is missing
+        """
+        key = ('video', video_id)
+        descriptor = self.cache.get(key)
+        if descriptor is None:
+            video = Video.query.get(video_id)
+            if not video:
+                return None
+            if video.blob_sha256:
+                path = BlobStore(upload_folder_path()).path_for(video.blob_sha256)
+            else:
+                # legacy videos are stored under their key
+                path = os.path.join(upload_folder_path(), video.key)
+            descriptor = self._describe(path, video.mime_type, video.blob_sha256)
+            self.cache.set(key, descriptor)
+        return descriptor
+
+    def cached(self, kind, media_id):
+        """
+        Return a descriptor only if it is already cached, without a database query.
+
+        Args:
+            kind: 'file' or 'video'
+            media_id: ID of the record
+
+        Returns:
+            MediaDescriptor, or None on a miss
+        """
+        return self.cache.get((kind, media_id))
+
+    def invalidate_file(self, file_id):
+        """Forget the descriptor of a file."""
+        self.cache.pop(('file', file_id))
+
+    def invalidate_video(self, video_id):
+        """Forget the descriptor of a video."""
+        self.cache.pop(('video', video_id))
+
+    def invalidate_path(self, path):
+        """Forget every descriptor pointing at a path that was rewritten."""
+        path = os.path.abspath(path)
+        self.cache.discard_where(lambda descriptor: descriptor.path == path)
+
+    def clear(self):
+        """Forget all descriptors."""
+        self.cache.clear()
+
+    def stats(self):
+        """Report the size and hit ratio of the cache."""
+        return self.cache.stats()
+
+    def _describe(self, path, mimetype, digest=None):
+        """Stat a blob once and build its descriptor; content digests make the ETag."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return MediaDescriptor(
+            path=path,
+            size=stat.st_size,
+            mimetype=mimetype,
+            mtime=stat.st_mtime,
+            etag=make_etag(stat.st_size, stat.st_mtime, digest)
+        )
+
+
+# Shared instance used by the file and video controllers
+media_cache = MediaCache()
@@ -0,0 +1,305 @@
+"""
+Media Metadata Module
+
+Reads the technical metadata of a stored video (duration, resolution,
+bitrate, codecs) from its container headers, without decoding any media:
+the ``moov`` box of MP4/QuickTime files and the EBML Info and Tracks
+elements at the start of WebM/Matroska files. The results are stored on
+the Video row, so listings can show and filter by them without touching
+the file.
+
+The functions here use neither Flask nor the database, so ``probe`` can run
+in the worker processes of a process pool.
+"""
+import os
+import struct
+from services.mp4_faststart import MP4Error, read_boxes, read_moov, parse_children
+from services.mp4_index import find_box, find_boxes, handler_type
+
+# First bytes of an EBML (WebM/Matroska) file
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+
+# Box types an MP4/QuickTime file may start with
+MP4_LEADING_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot'}
+
+# Sample entry formats and Matroska codec IDs, by the codec name stored on Video
+MP4_CODECS = {
+    b'avc1': 'h264', b'avc3': 'h264', b'hvc1': 'hevc', b'hev1': 'hevc', b'av01': 'av1',
+    b'vp09': 'vp9', b'vp08': 'vp8', b'mp4v': 'mpeg4', b'mp4a': 'aac', b'Opus': 'opus',
+    b'ac-3': 'ac3', b'ec-3': 'eac3', b'.mp3': 'mp3', b'fLaC': 'flac'
+}
+MATROSKA_CODECS = {
+    'V_VP8': 'vp8', 'V_VP9': 'vp9', 'V_AV1': 'av1', 'V_MPEG4/ISO/AVC': 'h264',
+    'V_MPEG4/ISO/ASP': 'mpeg4', 'V_MPEGH/ISO/HEVC': 'hevc',
+    'A_OPUS': 'opus', 'A_VORBIS': 'vorbis', 'A_AAC': 'aac',
+    'A_MPEG/L3': 'mp3', 'A_FLAC': 'flac'
+}
+
+# Matroska element IDs (marker bits included)
+EBML_DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER = 0x1F43B675
+
+# Largest header element read into memory
+MAX_ELEMENT_SIZE = 16 * 1024 * 1024
+
+
+class MediaMetadataError(ValueError):
+    """Raised when a file's container headers cannot be read."""
+
+
+def empty_metadata(container=None):
+    """
+    Return a metadata dictionary with every field unknown.
+
+    Keys are the names of the Video columns they are stored in.
+
+    Args:
+        container: Container format, if known
+    """
+    return {
+        'container': container, 'duration_seconds': None, 'width': None, 'height': None,
+        'bitrate': None, 'video_codec': None, 'audio_codec': None
+    }
+
+
+def extract_metadata(path):
+    """
+    Read the metadata of an MP4 or WebM file.
+
+    Args:
+        path: Path of the file
+
+    Returns:
+        Metadata dictionary (see ``empty_metadata``); fields the headers do not give are None
+
+    Raises:
+        MediaMetadataError: If the file is not MP4 or WebM, or its headers are malformed
+        OSError: If the file cannot be read
+    """
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        head = f.read(8)
+        f.seek(0)
+        try:
+            if head[:4] == EBML_MAGIC:
+                metadata = _webm_metadata(f, file_size)
+            elif head[4:8] in MP4_LEADING_BOXES:
+                metadata = _mp4_metadata(f, file_size)
+            else:
+                raise MediaMetadataError("Unrecognized container format")
+        except (MP4Error, struct.error) as err:
+            raise MediaMetadataError(str(err))
+    if metadata['duration_seconds']:
+        metadata['bitrate'] = int(file_size * 8 / metadata['duration_seconds'])
+    return metadata
+
+
+def probe(path):
+    """
+    Read the metadata of a file without raising, for use in pool workers.
+
+    Args:
+        path: Path of the file
+
+    Returns:
+        Metadata dictionary; container is 'unknown' for files that cannot be
+        parsed. None if the file cannot be read, so it is examined again later
+    """
+    try:
+        return extract_metadata(path)
+    except MediaMetadataError:
+        return empty_metadata('unknown')
+    except OSError:
+        return None
+
+
+def _mp4_metadata(f, file_size):
+    # internal: metadata from the moov box of an MP4/QuickTime file
+    metadata = empty_metadata('mp4')
+    moov = read_moov(f, read_boxes(f, 0, file_size))
+    if moov is None:
+        return metadata
+
+    mvhd = find_box(moov, b'mvhd')
+    if mvhd is not None and len(mvhd) >= 20:
+        # Version 1 widens the times and the duration to 64 bits
+        if mvhd[0] == 1:
+            timescale, duration = struct.unpack_from('>IQ', mvhd, 20)
+        else:
+            timescale, duration = struct.unpack_from('>II', mvhd, 12)
+        if not duration:
+            # Fragmented files may give the total in mvex/mehd instead
+            duration = _fragment_duration(find_box(moov, b'mvex'))
+        if timescale and duration:
+            metadata['duration_seconds'] = duration / timescale
+
+    for trak in find_boxes(moov, b'trak'):
+        mdia = find_box(trak, b'mdia') or []
+        stbl = find_box(find_box(mdia, b'minf') or [], b'stbl') or []
+        entry = _sample_entry(find_box(stbl, b'stsd'))
+        kind = handler_type(mdia)
+        if kind == b'vide' and metadata['video_codec'] is None and entry:
+            fmt, body = entry
+            metadata['video_codec'] = MP4_CODECS.get(fmt, fmt.decode('latin-1').strip().lower())
+            # Visual sample entries give the coded size 24 bytes into their fields
+            if len(body) >= 28:
+                metadata['width'], metadata['height'] = struct.unpack_from('>HH', body, 24)
+        elif kind == b'soun' and metadata['audio_codec'] is None and entry:
+            fmt = entry[0]
+            metadata['audio_codec'] = MP4_CODECS.get(fmt, fmt.decode('latin-1').strip().lower())
+    return metadata
+
+
+def _sample_entry(stsd):
+    # internal: (format, fields) of the first sample entry of an stsd box, or None
+    if stsd is None or len(stsd) < 16:
+        return None
+    size, fmt = struct.unpack_from('>I4s', stsd, 8)
+    return fmt, stsd[16:8 + size]
+
+
+def _fragment_duration(mvex):
+    # internal: fragment_duration of the mehd box inside mvex, or 0
+    if mvex is None:
+        return 0
+    mehd = find_box(parse_children(mvex), b'mehd')
+    if mehd is None or len(mehd) < 8:
+        return 0
+    if mehd[0] == 1 and len(mehd) >= 12:
+        return struct.unpack_from('>Q', mehd, 4)[0]
+    return struct.unpack_from('>I', mehd, 4)[0]
+
+
+def _webm_metadata(f, file_size):
+    # internal: metadata from the EBML header, Info and Tracks of a WebM/Matroska file
+    metadata = empty_metadata('webm')
+    elements = _elements(f, 0, file_size)
+    _, offset, size = next(elements)
+    for element_id, child_offset, child_size in _elements(f, offset, offset + size):
+        if element_id == EBML_DOC_TYPE:
+            doc_type = _read(f, child_offset, child_size).rstrip(b'\x00').decode('ascii', 'replace')
+            metadata['container'] = 'webm' if doc_type == 'webm' else 'matroska'
+
+    for element_id, offset, size in elements:
+        if element_id == SEGMENT:
+            segment_end = file_size if size is None else min(offset + size, file_size)
+            _segment_metadata(f, offset, segment_end, metadata)
+            break
+    return metadata
+
+
+def _segment_metadata(f, start, end, metadata):
+    # internal: fill metadata from the Info and Tracks elements of a Segment
+    timecode_scale, duration = 1000000, None
+    for element_id, offset, size in _elements(f, start, end):
+        if element_id == INFO:
+            for child_id, child_offset, child_size in _elements(f, offset, offset + size):
+                if child_id == TIMECODE_SCALE:
+                    timecode_scale = _uint(_read(f, child_offset, child_size))
+                elif child_id == DURATION:
+                    duration = _float(_read(f, child_offset, child_size))
+        elif element_id == TRACKS:
+            for child_id, child_offset, child_size in _elements(f, offset, offset + size):
+                if child_id == TRACK_ENTRY:
+                    _track_metadata(f, child_offset, child_offset + child_size, metadata)
+        elif element_id == CLUSTER or size is None:
+            # Header elements come before the media clusters
+            break
+    if duration:
+        # Duration counts ticks of TimecodeScale nanoseconds
+        metadata['duration_seconds'] = duration * timecode_scale / 1e9
+
+
+def _track_metadata(f, start, end, metadata):
+    # internal: fill codec and size fields from one TrackEntry
+    track_type, codec, width, height = None, None, None, None
+    for element_id, offset, size in _elements(f, start, end):
+        if element_id == TRACK_TYPE:
+            track_type = _uint(_read(f, offset, size))
+        elif element_id == CODEC_ID:
+            codec_id = _read(f, offset, size).rstrip(b'\x00').decode('ascii', 'replace')
+            codec = MATROSKA_CODECS.get(codec_id, codec_id.lower())
+        elif element_id == VIDEO:
+            for child_id, child_offset, child_size in _elements(f, offset, offset + size):
+                if child_id == PIXEL_WIDTH:
+                    width = _uint(_read(f, child_offset, child_size))
+                elif child_id == PIXEL_HEIGHT:
+                    height = _uint(_read(f, child_offset, child_size))
+    if track_type == 1 and metadata['video_codec'] is None:
+        metadata['video_codec'], metadata['width'], metadata['height'] = codec, width, height
+    elif track_type == 2 and metadata['audio_codec'] is None:
+        metadata['audio_codec'] = codec
+
+
+def _elements(f, start, end):
+    # internal: (id, payload offset, payload size) of the EBML elements in [start, end);
+    # size is None for an element of unknown size, which ends the iteration
+    position = start
+    while position < end:
+        f.seek(position)
+        element_id = _vint(f, keep_marker=True)
+        size = _vint(f, keep_marker=False)
+        offset = f.tell()
+        if element_id is None or offset > end:
+            return
+        if size is not None and offset + size > end:
+            raise MediaMetadataError(f"EBML element {element_id:#x} overruns its parent")
+        yield element_id, offset, size
+        if size is None:
+            return
+        position = offset + size
+
+
+def _vint(f, keep_marker):
+    # internal: EBML variable-length integer; None at the end of the file or for "unknown size"
+    first = f.read(1)
+    if not first:
+        return None
+    length = 1
+    while length <= 8 and not first[0] & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8:
+        raise MediaMetadataError("Invalid EBML variable-length integer")
+    rest = f.read(length - 1)
+    if len(rest) < length - 1:
+        return None
+    value = first[0] if keep_marker else first[0] & (0xFF >> length)
+    for byte in rest:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        # All value bits set means the size is unknown (live streams, open segments)
+        return None
+    return value
+
+
+def _read(f, offset, size):
+    # internal: payload of a header element
+    if size > MAX_ELEMENT_SIZE:
+        raise MediaMetadataError(f"EBML element of {size} bytes is too large to read")
+    f.seek(offset)
+    return f.read(size)
+
+
+def _uint(data):
+    # internal: big-endian unsigned integer element
+    return int.from_bytes(data, 'big')
+
+
+def _float(data):
+    # internal: 4- or 8-byte big-endian float element
+    if len(data) == 4:
+        return struct.unpack('>f', data)[0]
+    if len(data) == 8:
+        return struct.unpack('>d', data)[0]
+    return None
@@ -0,0 +1,150 @@
+"""
+Media Server Module
+
+ASGI application for the asyncio serving mode (see asgi.py). Video streams
+(/api/videos/stream/<id>) and file downloads (/api/files/<id>) are answered
+by coroutines: while a client drains its stream at the shaped rate, its
+response waits in the server's flow control without holding a thread.
+Every other route is passed to the Flask app, run on a bounded thread pool.
+
+The streaming routes reuse the Flask app's pieces: tokens are checked by
+the same AuthMiddleware, media is resolved through the same descriptor
+cache, and range and conditional requests are planned by the same
+media_stream functions, so responses match the WSGI server's.
+"""
+import re
+import json
+from auth.auth_middleware import auth_middleware
+from services.media_cache import media_cache
+from services.block_cache import block_cache
+from services.stream_backend import stream_backend
+from services.async_stream import BlockingPool, request_headers, encode_headers, send_media
+from services.wsgi_bridge import WSGIBridge
+
+
+class MediaServer:
+    """
+    ASGI application streaming media itself and passing other requests to Flask.
+    """
+
+    def __init__(self, app):
+        """
+        Initialize the server.
+
+        Args:
+            app: Flask application built by create_app
+        """
+        self.app = app
+        # Reads and descriptor lookups; a few threads serve every stream
+        self.pool = BlockingPool(app.config.get('ASGI_READ_THREADS', 4))
+        self.fallback = WSGIBridge(app, threads=app.config.get('ASGI_WSGI_THREADS', 8))
+        self.routes = (
+            (re.compile(r'/api/videos/stream/(\d+)'), self.stream_video),
+            (re.compile(r'/api/files/(\d+)'), self.get_file),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            # No websocket routes
+            return await send({'type': 'websocket.close'})
+        if scope['method'] in ('GET', 'HEAD'):
+            for pattern, handler in self.routes:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    return await handler(scope, receive, send, int(match.group(1)))
+        await self.fallback(scope, receive, send)
+
+    async def stream_video(self, scope, receive, send, video_id):
+        """Stream a video file by its video ID (see video_controller.stream_video)."""
+        try:
+            media = await self._resolve('video', video_id)
+        except FileNotFoundError:
+            return await self._error(scope, send, 'File not found on disk', 404)
+        if not media:
+            return await self._error(scope, send, 'Video not found', 404)
+        await self._stream(scope, receive, send, 'video', video_id, media, 'File not found on disk')
+
+    async def get_file(self, scope, receive, send, file_id):
+        """Stream a video stored as a file, for authenticated users (see FileController.get_file)."""
+        headers = request_headers(scope)
+        _, error = auth_middleware.authenticate_header(headers.get('Authorization'))
+        if error:
+            return await self._error(scope, send, *error)
+        try:
+            media = await self._resolve('file', file_id)
+        except FileNotFoundError:
+            return await self._error(scope, send, 'File not found on server', 404)
+        if not media:
+            return await self._error(scope, send, 'File not found', 404)
+        if not media.mimetype or not media.mimetype.startswith('video/'):
+            return await self._error(scope, send, 'Only video files can be streamed or downloaded.', 403)
+        await self._stream(scope, receive, send, 'file', file_id, media, 'File not found on server')
+
+    async def _resolve(self, kind, media_id):
+        # internal: cached descriptor, or one loaded from the database off the event loop
+        media = media_cache.cached(kind, media_id)
+        if media is None:
+            media = await self.pool.run(self._lookup, kind, media_id)
+        return media
+
+    def _lookup(self, kind, media_id):
+        # internal: pool thread body, descriptor lookup inside an app context
+        with self.app.app_context():
+            if kind == 'video':
+                return media_cache.get_video(media_id)
+            return media_cache.get_file(media_id)
+
+    async def _stream(self, scope, receive, send, kind, media_id, media, missing_message):
+        # internal: send the media; a blob that vanished since it was cached (replaced by
+        # its faststart rewrite, or deleted) is resolved once more before answering 404
+        for retry in (True, False):
+            try:
+                return await send_media(scope, receive, send, media.path,
+                                        media.mimetype or 'application/octet-stream',
+                                        media.size, media.mtime, media.etag, self.pool,
+                                        extra_headers=self._cors_headers(scope),
+                                        block_cache=block_cache, backend=stream_backend)
+            except FileNotFoundError:
+                if kind == 'video':
+                    media_cache.invalidate_video(media_id)
+                else:
+                    media_cache.invalidate_file(media_id)
+            if not retry:
+                break
+            try:
+                media = await self._resolve(kind, media_id)
+            except FileNotFoundError:
+                break
+            if not media:
+                break
+        await self._error(scope, send, missing_message, 404)
+
+    async def _error(self, scope, send, message, status):
+        # internal: JSON error body shaped like the Flask controllers' errors
+        body = (json.dumps({'error': message}, separators=(',', ':')) + '\n').encode('utf-8')
+        headers = [('Content-Type', 'application/json'), ('Content-Length', len(body))]
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': encode_headers(headers + self._cors_headers(scope))
+        })
+        await send({'type': 'http.response.body', 'body': body if scope['method'] != 'HEAD' else b''})
+
+    def _cors_headers(self, scope):
+        # internal: the headers Flask-CORS adds for the app's allow-all policy
+        origin = request_headers(scope).get('Origin')
+        if not origin:
+            return []
+        return [('Access-Control-Allow-Origin', origin), ('Vary', 'Origin')]
+
+    async def _lifespan(self, receive, send):
+        # internal: acknowledge startup and shutdown; the Flask app is already set up
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
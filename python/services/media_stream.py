@@ -0,0 +1,468 @@
+"""
+Media Stream Module
+
+Serves stored media files with byte range and conditional request support
+without buffering ranges in memory. Full and single-range responses hand a
+bounded file reader to the WSGI server's file wrapper, so servers that
+implement it (gunicorn) transmit the bytes with os.sendfile; other servers
+iterate the same reader in fixed-size chunks. Memory use per response is one
+chunk regardless of the range size.
+
+Request evaluation follows RFC 7232/7233: If-None-Match and
+If-Modified-Since short-circuit to 304, If-Range falls back to the full
+representation when the validator no longer matches, several ranges are
+served as multipart/byteranges and unsatisfiable ranges return 416.
+
+Ranges lying wholly in the hot head of a file are served through a
+BlockCache (services/block_cache.py), and deployments can select the mmap
+stream backend (services/stream_backend.py); those responses are iterated
+in Python rather than sent with sendfile. Any other range, including every
+full-file request, keeps the sendfile path.
+"""
+import os
+import binascii
+from flask import Response, request
+from werkzeug.http import http_date, parse_date, parse_etags, parse_if_range_header, quote_etag
+from werkzeug.wsgi import wrap_file
+
+# Size of the blocks handed to the server when it cannot use sendfile
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Requests asking for more ranges than this are served the full file instead
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header cannot be satisfied for the file size."""
+
+
+class RangeFile:
+    """
+    Read-only file object limited to ``length`` bytes starting at ``offset``.
+
+    The underlying descriptor is unbuffered and positioned at ``offset`` so a
+    server using sendfile (which reads the current descriptor position and
+    the response Content-Length) sends exactly the requested bytes.
+    """
+
+    def __init__(self, path, offset, length):
+        """
+        Open the file and seek to the start of the range.
+
+        Args:
+            path: Path of the file to read
+            offset: First byte of the range
+            length: Number of bytes that may be read
+        """
+        self._file = open(path, 'rb', buffering=0)
+        try:
+            self._file.seek(offset)
+        except OSError:
+            self._file.close()
+            raise
+        self._remaining = length
+
+    def fileno(self):
+        """Return the descriptor so the server can sendfile from it."""
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        """
+        Read at most ``size`` bytes without crossing the end of the range.
+
+        Args:
+            size: Maximum number of bytes to return (-1 for the rest of the range)
+
+        Returns:
+            Bytes read, empty once the range is exhausted
+        """
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        """Close the underlying file."""
+        self._file.close()
+
+
+class RangeBody:
+    """
+    Response body for a byte range read in Python rather than by the server.
+
+    Bytes inside the hot head of the file come from a block cache when one
+    is given; the rest comes from a memory mapping of the range when the
+    mmap stream backend is selected, and from os.pread otherwise.
+    """
+
+    def __init__(self, path, offset, length, block_cache=None, key=None, backend=None,
+                 chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Open the file; raises FileNotFoundError before the response starts.
+
+        Args:
+            path: Path of the file to read
+            offset: First byte of the range
+            length: Number of bytes to send
+            block_cache: Optional BlockCache holding the file's head blocks
+            key: ETag identifying the file's content in the block cache
+            backend: Optional StreamBackend; the mmap backend maps the range
+            chunk_size: Maximum bytes sent at once outside the cached head
+        """
+        self._fd = os.open(path, os.O_RDONLY)
+        self._position = offset
+        self._end = offset + length
+        self._cache = block_cache
+        self._key = key
+        self._chunk_size = chunk_size
+        self._mapped = backend.map_range(self._fd, offset, length) if backend is not None else None
+
+    def __iter__(self):
+        while self._position < self._end:
+            remaining = self._end - self._position
+            if self._cache is not None and self._cache.caches(self._position):
+                data = self._cache.read(self._fd, self._key, self._position, remaining)
+            elif self._mapped is not None:
+                # WSGI servers accept only bytes, so the slice is copied once here
+                data = self._mapped.view(self._position, self._chunk_size).tobytes()
+            else:
+                data = os.pread(self._fd, min(self._chunk_size, remaining), self._position)
+            if not data:
+                return
+            self._position += len(data)
+            yield data
+
+    def close(self):
+        """Unmap the range and close the underlying descriptor."""
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class StreamPlan:
+    """
+    Outcome of evaluating a request's conditional and range headers.
+
+    Attributes:
+        status: HTTP status to respond with (200, 206, 304 or 416)
+        ranges: Inclusive (start, end) byte ranges to send for a 206
+        headers: Validator and range headers common to every body shape
+    """
+
+    def __init__(self, status, ranges=None, headers=None):
+        self.status = status
+        self.ranges = ranges or []
+        self.headers = headers or {}
+
+
+def make_etag(file_size, mtime, digest=None):
+    """
+    Build a strong entity tag for a stored file.
+
+    Args:
+        file_size: Size of the file in bytes
+        mtime: Modification time of the file in seconds
+        digest: Hex content hash; used verbatim when known
+
+    Returns:
+        Unquoted entity tag
+    """
+    if digest:
+        return digest
+    return f'{file_size:x}-{int(mtime * 1000000):x}'
+
+
+def parse_byte_ranges(range_header, file_size):
+    """
+    Parse a ``bytes=`` Range header into satisfiable, coalesced ranges.
+
+    Args:
+        range_header: Value of the Range header
+        file_size: Size of the file in bytes
+
+    Returns:
+        Sorted list of inclusive (start, end) tuples, or None if the header
+        is absent, malformed or asks for too many ranges and should be ignored
+
+    Raises:
+        RangeNotSatisfiable: If no requested range overlaps the file
+    """
+    if not range_header:
+        return None
+    units, _, spec = range_header.partition('=')
+    if units.strip().lower() != 'bytes':
+        return None
+    specs = [item.strip() for item in spec.split(',') if item.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for item in specs:
+        first, sep, last = item.partition('-')
+        first, last = first.strip(), last.strip()
+        if not sep or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if not first:
+            # Suffix range: the final N bytes of the file
+            if not last:
+                return None
+            suffix = int(last)
+            if suffix > 0 and file_size > 0:
+                ranges.append((max(file_size - suffix, 0), file_size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < file_size:
+            end = int(last) if last else file_size - 1
+            ranges.append((start, min(end, file_size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable(range_header)
+
+    # Overlapping or adjacent ranges are merged so no byte is sent twice
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _if_range_matches(if_range_header, etag, mtime):
+    """Return True when an If-Range validator still identifies the file."""
+    if not if_range_header:
+        return True
+    if if_range_header.lstrip().startswith('W/'):
+        # Weak validators never satisfy If-Range
+        return False
+    if_range = parse_if_range_header(if_range_header)
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return int(if_range.date.timestamp()) == int(mtime)
+    return False
+
+
+def plan_stream(method, headers, file_size, mtime, etag):
+    """
+    Evaluate conditional and range headers for a stored file.
+
+    Args:
+        method: HTTP method of the request
+        headers: Mapping of request headers with a case-insensitive ``get``
+        file_size: Size of the file in bytes
+        mtime: Modification time of the file in seconds
+        etag: Unquoted strong entity tag of the file
+
+    Returns:
+        StreamPlan describing the response
+    """
+    validators = {
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(int(mtime)),
+        'Accept-Ranges': 'bytes'
+    }
+
+    if method in ('GET', 'HEAD'):
+        if_none_match = headers.get('If-None-Match')
+        if if_none_match:
+            if parse_etags(if_none_match).contains_weak(etag):
+                return StreamPlan(304, headers=validators)
+        else:
+            since = parse_date(headers.get('If-Modified-Since'))
+            if since is not None and int(mtime) <= since.timestamp():
+                return StreamPlan(304, headers=validators)
+
+    range_header = headers.get('Range')
+    if method != 'GET' or not range_header:
+        return StreamPlan(200, headers=validators)
+    if not _if_range_matches(headers.get('If-Range'), etag, mtime):
+        return StreamPlan(200, headers=validators)
+
+    try:
+        ranges = parse_byte_ranges(range_header, file_size)
+    except RangeNotSatisfiable:
+        validators['Content-Range'] = f'bytes */{file_size}'
+        return StreamPlan(416, headers=validators)
+    if ranges is None:
+        return StreamPlan(200, headers=validators)
+    return StreamPlan(206, ranges, validators)
+
+
+def new_boundary():
+    """Return a random multipart boundary string."""
+    return binascii.hexlify(os.urandom(16)).decode('ascii')
+
+
+def multipart_part_headers(boundary, mimetype, byte_range, file_size):
+    """Return the encoded delimiter and headers preceding one body part."""
+    start, end = byte_range
+    return (
+        f'\r\n--{boundary}\r\n'
+        f'Content-Type: {mimetype}\r\n'
+        f'Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n'
+    ).encode('latin-1')
+
+
+def multipart_trailer(boundary):
+    """Return the encoded closing delimiter of a multipart body."""
+    return f'\r\n--{boundary}--\r\n'.encode('latin-1')
+
+
+def multipart_length(boundary, mimetype, ranges, file_size):
+    """
+    Compute the exact Content-Length of a multipart/byteranges body.
+
+    Args:
+        boundary: Multipart boundary string
+        mimetype: MIME type of each part
+        ranges: Inclusive (start, end) byte ranges
+        file_size: Size of the file in bytes
+
+    Returns:
+        Body length in bytes
+    """
+    total = len(multipart_trailer(boundary))
+    for byte_range in ranges:
+        total += len(multipart_part_headers(boundary, mimetype, byte_range, file_size))
+        total += byte_range[1] - byte_range[0] + 1
+    return total
+
+
+def iter_multipart(filepath, boundary, mimetype, ranges, file_size, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield a multipart/byteranges body in bounded chunks.
+
+    Args:
+        filepath: Path to the file to stream
+        boundary: Multipart boundary string
+        mimetype: MIME type of each part
+        ranges: Inclusive (start, end) byte ranges
+        file_size: Size of the file in bytes
+        chunk_size: Maximum bytes read per iteration
+
+    Yields:
+        Encoded body fragments
+    """
+    fd = os.open(filepath, os.O_RDONLY)
+    try:
+        for byte_range in ranges:
+            yield multipart_part_headers(boundary, mimetype, byte_range, file_size)
+            position, end = byte_range
+            while position <= end:
+                data = os.pread(fd, min(chunk_size, end - position + 1), position)
+                if not data:
+                    return
+                position += len(data)
+                yield data
+        yield multipart_trailer(boundary)
+    finally:
+        os.close(fd)
+
+
+def prewarm_range(filepath, start, length):
+    """
+    Ask the kernel to start reading a byte range into the page cache.
+
+    Returns immediately; the Range request that follows finds the bytes in
+    memory instead of waiting on the disk.
+
+    Args:
+        filepath: Path of the file
+        start: First byte of the range
+        length: Number of bytes
+
+    Returns:
+        True if the hint was given, False where posix_fadvise is unavailable
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    fd = os.open(filepath, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, start, length, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+    return True
+
+
+def range_body(filepath, start, length, etag, block_cache=None, backend=None):
+    """
+    Return the WSGI body of one byte range of a file.
+
+    Args:
+        filepath: Path to the file
+        start: First byte of the range
+        length: Number of bytes
+        etag: Unquoted entity tag, keying the file's cached blocks
+        block_cache: Optional BlockCache for ranges lying in the file's head
+        backend: Optional StreamBackend selecting how the range is read
+
+    Returns:
+        RangeBody, or the server's file wrapper around a RangeFile (sendfile backend)
+    """
+    # Only ranges ending in the head come from the cache: one WSGI body cannot be
+    # partly iterated and partly sent with sendfile, and the tail is the larger part
+    cached = block_cache is not None and length and block_cache.caches(start + length - 1)
+    if length and (cached or (backend is not None and backend.maps())):
+        return RangeBody(filepath, start, length, block_cache, etag, backend)
+    return wrap_file(request.environ, RangeFile(filepath, start, length), STREAM_CHUNK_SIZE)
+
+
+def stream_file(filepath, mimetype, file_size=None, mtime=None, etag=None, block_cache=None,
+                backend=None):
+    """
+    Build a streaming response for a file, honouring conditional and range headers.
+
+    Args:
+        filepath: Path to the file to stream
+        mimetype: MIME type of the file
+        file_size: Size of the file in bytes (stat'ed when not supplied)
+        mtime: Modification time of the file (stat'ed when not supplied)
+        etag: Unquoted strong entity tag (derived from size and mtime when not supplied)
+        block_cache: Optional BlockCache serving the hot head of the file from memory
+        backend: Optional StreamBackend; without one, or with sendfile, the server's file wrapper sends ranges
+
+    Returns:
+        Response object with appropriate headers for streaming
+    """
+    if file_size is None or mtime is None:
+        stat = os.stat(filepath)
+        file_size, mtime = stat.st_size, stat.st_mtime
+    if etag is None:
+        etag = make_etag(file_size, mtime)
+
+    plan = plan_stream(request.method, request.headers, file_size, mtime, etag)
+    headers = plan.headers
+
+    if plan.status in (304, 416):
+        return Response(status=plan.status, headers=headers)
+
+    if plan.status == 200:
+        headers['Content-Length'] = str(file_size)
+        body = range_body(filepath, 0, file_size, etag, block_cache, backend)
+        return Response(body, 200, headers, mimetype=mimetype, direct_passthrough=True)
+
+    if len(plan.ranges) == 1:
+        start, end = plan.ranges[0]
+        length = end - start + 1
+        headers['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+        headers['Content-Length'] = str(length)
+        body = range_body(filepath, start, length, etag, block_cache, backend)
+        return Response(body, 206, headers, mimetype=mimetype, direct_passthrough=True)
+
+    boundary = new_boundary()
+    headers['Content-Length'] = str(multipart_length(boundary, mimetype, plan.ranges, file_size))
+    body = iter_multipart(filepath, boundary, mimetype, plan.ranges, file_size)
+    return Response(body, 206, headers,
+                    content_type=f'multipart/byteranges; boundary={boundary}',
+                    direct_passthrough=True)
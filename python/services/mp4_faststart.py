@@ -0,0 +1,282 @@
+"""
+MP4 Faststart Module
+
+Moves the ``moov`` box of an MP4 (ISO-BMFF) file in front of its media
+data. Encoders that write ``moov`` last leave players unable to start until
+they have fetched the end of the file; with ``moov`` first, the opening
+Range request of a playback carries everything needed to decode.
+
+Moving ``moov`` forward shifts the media data behind it, so the absolute
+chunk offsets in every ``stco``/``co64`` table are rewritten. Only ``moov``
+itself (the index, typically well under a megabyte) is held in memory; the
+media data is copied from the source file to the destination in fixed-size
+blocks.
+"""
+import os
+import struct
+from collections import namedtuple
+
+# Bytes copied per read while moving media data
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# moov boxes larger than this are not rewritten in memory
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+# Boxes on the path from moov to the chunk offset tables
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+# MIME types treated as ISO-BMFF
+MP4_MIME_TYPES = {'video/mp4', 'video/quicktime', 'video/x-m4v', 'audio/mp4'}
+
+Box = namedtuple('Box', ['type', 'offset', 'size', 'header_size'])
+
+
+class MP4Error(ValueError):
+    """Raised when a file is not a well-formed MP4 this module can rewrite."""
+
+
+def read_boxes(f, start, end):
+    """
+    List the boxes between two offsets of a file, without reading their payloads.
+
+    Args:
+        f: Binary file object
+        start: Offset of the first box
+        end: Offset just past the last box
+
+    Returns:
+        List of Box tuples in file order
+
+    Raises:
+        MP4Error: If a box header is truncated or a size is invalid
+    """
+    boxes = []
+    offset = start
+    while offset < end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            raise MP4Error(f"Truncated box header at {offset}")
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                raise MP4Error(f"Truncated box header at {offset}")
+            size = struct.unpack('>Q', large)[0]
+            header_size = 16
+        elif size == 0:
+            # The last box may extend to the end of the file
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise MP4Error(f"Invalid size {size} for box {box_type!r} at {offset}")
+        boxes.append(Box(box_type, offset, size, header_size))
+        offset += size
+    return boxes
+
+
+def needs_faststart(path):
+    """
+    Return True if an MP4 file stores its moov box after its media data.
+
+    Args:
+        path: Path of the file
+
+    Returns:
+        True if ``faststart`` would rewrite the file
+    """
+    try:
+        with open(path, 'rb') as f:
+            return _plan(read_boxes(f, 0, os.fstat(f.fileno()).st_size)) is not None
+    except MP4Error:
+        return False
+
+
+def read_moov(f, boxes):
+    """
+    Read and parse the moov box of a file.
+
+    Args:
+        f: Binary file object
+        boxes: Top-level boxes of the file from ``read_boxes``
+
+    Returns:
+        Children of moov as returned by ``parse_children``, or None without a moov
+
+    Raises:
+        MP4Error: If moov is malformed or larger than MAX_MOOV_SIZE
+    """
+    for box in boxes:
+        if box.type == b'moov':
+            if box.size > MAX_MOOV_SIZE:
+                raise MP4Error(f"moov box of {box.size} bytes is too large to read")
+            f.seek(box.offset + box.header_size)
+            return parse_children(f.read(box.size - box.header_size))
+    return None
+
+
+def faststart(src_path, dst_path, block_size=COPY_BLOCK_SIZE):
+    """
+    Write a copy of an MP4 file with its moov box in front of the media data.
+
+    Args:
+        src_path: MP4 file to read
+        dst_path: Path the rewritten file is written to
+        block_size: Bytes copied per read
+
+    Returns:
+        True if dst_path was written, False if the file needs no rewrite
+        (moov already first, fragmented MP4, no moov)
+
+    Raises:
+        MP4Error: If the file is malformed or its moov cannot be rewritten
+    """
+    with open(src_path, 'rb') as src:
+        file_size = os.fstat(src.fileno()).st_size
+        boxes = read_boxes(src, 0, file_size)
+        plan = _plan(boxes)
+        if plan is None:
+            return False
+        moov, insert_at = plan
+        moov_bytes = _relocate(read_moov(src, boxes), insert_at, moov.offset, moov.size)
+
+        with open(dst_path, 'wb') as dst:
+            for box in boxes:
+                if box.offset == insert_at:
+                    dst.write(moov_bytes)
+                if box is not moov:
+                    _copy_range(src, dst, box.offset, box.size, block_size)
+            dst.flush()
+            os.fsync(dst.fileno())
+    return True
+
+
+def _plan(boxes):
+    # internal: (moov box, offset it moves to), or None if no rewrite is needed
+    types = [box.type for box in boxes]
+    if b'moov' not in types or b'mdat' not in types or b'moof' in types:
+        return None
+    moov = boxes[types.index(b'moov')]
+    first_mdat = boxes[types.index(b'mdat')]
+    if moov.offset < first_mdat.offset:
+        return None
+    return moov, first_mdat.offset
+
+
+def parse_children(payload):
+    """
+    Parse the payload of a container box down through CONTAINER_BOXES.
+
+    Args:
+        payload: Bytes of the container box after its header
+
+    Returns:
+        List of [box type, body] pairs; body is a list for containers, bytes otherwise
+
+    Raises:
+        MP4Error: If a box is truncated or compressed
+    """
+    children = []
+    offset = 0
+    while offset < len(payload):
+        if len(payload) - offset < 8:
+            raise MP4Error("Truncated box inside moov")
+        size, box_type = struct.unpack_from('>I4s', payload, offset)
+        header_size = 8
+        if size == 1:
+            if len(payload) - offset < 16:
+                raise MP4Error("Truncated box inside moov")
+            size = struct.unpack_from('>Q', payload, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = len(payload) - offset
+        if size < header_size or offset + size > len(payload):
+            raise MP4Error(f"Invalid size {size} for box {box_type!r} inside moov")
+        if box_type == b'cmov':
+            raise MP4Error("Compressed moov boxes are not supported")
+        body = payload[offset + header_size:offset + size]
+        if box_type in CONTAINER_BOXES:
+            body = parse_children(body)
+        children.append([box_type, body])
+        offset += size
+    return children
+
+
+def _relocate(tree, insert_at, moov_offset, old_size):
+    """
+    Serialize moov with chunk offsets adjusted for its move to ``insert_at``.
+
+    Media between the insertion point and the old moov position moves
+    forward by the size of moov. Media after the old moov moves by the
+    difference between the new and old moov sizes, which is not zero when
+    tables are widened or moov had a 64-bit size header. stco tables are
+    widened to co64 when a shifted offset no longer fits in 32 bits, which
+    grows moov and therefore the shift.
+    """
+    widen = False
+    while True:
+        moov_size = len(_serialize([[b'moov', tree]], widen, None))
+        shift = (insert_at, moov_offset, old_size, moov_size)
+        try:
+            return _serialize([[b'moov', tree]], widen, shift)
+        except OverflowError:
+            if widen:
+                raise MP4Error("Chunk offsets overflow 64 bits")
+            widen = True
+
+
+def _serialize(boxes, widen, shift):
+    # internal: encode boxes; with shift, chunk offset tables are patched
+    out = bytearray()
+    for box_type, body in boxes:
+        if isinstance(body, list):
+            body = _serialize(body, widen, shift)
+        elif box_type in (b'stco', b'co64'):
+            box_type, body = _offset_table(box_type, body, widen, shift)
+        size = len(body) + 8
+        if size > 0xFFFFFFFF:
+            out += struct.pack('>I4sQ', 1, box_type, size + 8)
+        else:
+            out += struct.pack('>I4s', size, box_type)
+        out += body
+    return bytes(out)
+
+
+def _offset_table(box_type, body, widen, shift):
+    # internal: (type, body) of a stco/co64 box with its offsets moved
+    if len(body) < 8:
+        raise MP4Error(f"Truncated {box_type.decode()} box")
+    count = struct.unpack_from('>I', body, 4)[0]
+    width = 8 if box_type == b'co64' else 4
+    if len(body) < 8 + count * width:
+        raise MP4Error(f"Truncated {box_type.decode()} box")
+    offsets = struct.unpack_from(f'>{count}{"Q" if width == 8 else "I"}', body, 8)
+
+    out_type = b'co64' if widen else box_type
+    if shift is not None:
+        insert_at, moov_offset, old_size, moov_size = shift
+        offsets = [_shifted(offset, insert_at, moov_offset, old_size, moov_size) for offset in offsets]
+        if out_type == b'stco' and offsets and max(offsets) > 0xFFFFFFFF:
+            raise OverflowError("Chunk offset exceeds 32 bits")
+    encoded = struct.pack(f'>{count}{"Q" if out_type == b"co64" else "I"}', *offsets)
+    return out_type, body[:8] + encoded
+
+
+def _shifted(offset, insert_at, moov_offset, old_size, moov_size):
+    # internal: position of a media byte once moov has moved from moov_offset to insert_at
+    if insert_at <= offset < moov_offset:
+        return offset + moov_size
+    if offset >= moov_offset + old_size:
+        return offset + moov_size - old_size
+    return offset
+
+
+def _copy_range(src, dst, offset, length, block_size):
+    # internal: copy length bytes of src starting at offset to the end of dst
+    src.seek(offset)
+    while length > 0:
+        data = src.read(min(block_size, length))
+        if not data:
+            raise MP4Error("File ended inside a box")
+        dst.write(data)
+        length -= len(data)
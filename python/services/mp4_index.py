@@ -0,0 +1,298 @@
+"""
+MP4 Keyframe Index Module
+
+Builds a time -> byte offset table of the keyframes (sync samples) of the
+video track of an MP4 file. A player seeking with plain Range requests has
+to guess where a keyframe lies and usually probes several ranges before it
+finds one; with the table it can ask for the exact range of the group of
+pictures that starts at the seek target.
+
+The sample tables of ``moov`` (stts, stss, stsc, stsz, stco/co64) are read
+once, when the video is stored. The result is two parallel arrays of
+unsigned 64-bit integers, stored on the Video row as a few bytes per
+keyframe.
+"""
+import os
+import sys
+import struct
+from array import array
+from bisect import bisect_right
+from services.mp4_faststart import MP4Error, read_boxes, read_moov
+
+# Leading bytes of a serialized index: magic, timescale, keyframe count
+HEADER = struct.Struct('<4sII')
+MAGIC = b'KFI1'
+# Most samples a video track may declare (19 hours at 60 frames per second);
+# counts come from the upload and size the arrays and loops of the index
+MAX_SAMPLES = 1 << 22
+
+
+class KeyframeIndex:
+    """
+    Keyframe decode times and byte offsets of one video track.
+    """
+
+    def __init__(self, timescale, times, offsets):
+        """
+        Initialize the index.
+
+        Args:
+            timescale: Time units per second of ``times``
+            times: array('Q') of keyframe decode times, ascending
+            offsets: array('Q') of keyframe byte offsets in the file
+        """
+        self.timescale = timescale
+        self.times = times
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.times)
+
+    def find(self, seconds):
+        """
+        Return the position of the last keyframe at or before a time.
+
+        Args:
+            seconds: Time in seconds; earlier times give the first keyframe
+
+        Returns:
+            Position in the index, or None if the index is empty
+        """
+        if not self.times:
+            return None
+        position = bisect_right(self.times, max(0, int(seconds * self.timescale))) - 1
+        return max(position, 0)
+
+    def seconds(self, position):
+        """Return the decode time of a keyframe in seconds."""
+        return self.times[position] / self.timescale
+
+    def byte_range(self, position, file_size):
+        """
+        Return the inclusive byte range from a keyframe up to the next one.
+
+        Args:
+            position: Position in the index
+            file_size: Size of the file, ending the range of the last keyframe
+
+        Returns:
+            (start, end) tuple
+        """
+        start = self.offsets[position]
+        end = file_size - 1
+        if position + 1 < len(self.offsets) and self.offsets[position + 1] > start:
+            end = self.offsets[position + 1] - 1
+        return start, end
+
+    def to_list(self):
+        """Return [seconds, offset] pairs, with times rounded to milliseconds."""
+        return [[round(t / self.timescale, 3), o] for t, o in zip(self.times, self.offsets)]
+
+    def to_bytes(self):
+        """Serialize the index for the Video.keyframe_index column."""
+        times, offsets = array('Q', self.times), array('Q', self.offsets)
+        if sys.byteorder == 'big':
+            times.byteswap()
+            offsets.byteswap()
+        return HEADER.pack(MAGIC, self.timescale, len(times)) + times.tobytes() + offsets.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Load an index serialized by ``to_bytes``.
+
+        Raises:
+            ValueError: If the data is not a serialized index
+        """
+        if len(data) < HEADER.size:
+            raise ValueError("Keyframe index is truncated")
+        magic, timescale, count = HEADER.unpack_from(data)
+        if magic != MAGIC or len(data) != HEADER.size + 16 * count:
+            raise ValueError("Keyframe index is malformed")
+        times, offsets = array('Q'), array('Q')
+        times.frombytes(data[HEADER.size:HEADER.size + 8 * count])
+        offsets.frombytes(data[HEADER.size + 8 * count:])
+        if sys.byteorder == 'big':
+            times.byteswap()
+            offsets.byteswap()
+        return cls(timescale, times, offsets)
+
+
+def build_keyframe_index(path):
+    """
+    Index the keyframes of the first video track of an MP4 file.
+
+    Args:
+        path: Path of the file
+
+    Returns:
+        KeyframeIndex, or None if the file has no video track with sample tables
+        (fragmented MP4 keeps them in moof boxes and is not indexed)
+
+    Raises:
+        MP4Error: If the file or its sample tables are malformed
+    """
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        moov = read_moov(f, read_boxes(f, 0, file_size))
+    if moov is None:
+        return None
+    for trak in find_boxes(moov, b'trak'):
+        mdia = find_box(trak, b'mdia')
+        if mdia is None or handler_type(mdia) != b'vide':
+            continue
+        stbl = find_box(find_box(mdia, b'minf') or [], b'stbl')
+        if stbl is None or find_box(stbl, b'stsz') is None:
+            continue
+        return _index_track(media_timescale(mdia), stbl, file_size)
+    return None
+
+
+def handler_type(mdia):
+    """Return the handler type of a parsed mdia box (b'vide', b'soun', ...), or None."""
+    hdlr = find_box(mdia, b'hdlr')
+    if hdlr is None or len(hdlr) < 12:
+        return None
+    return hdlr[8:12]
+
+
+def media_timescale(mdia):
+    """
+    Return the time units per second of a track, from the mdhd of its parsed mdia box.
+
+    Raises:
+        MP4Error: If mdhd is missing or invalid
+    """
+    mdhd = find_box(mdia, b'mdhd')
+    if mdhd is None or len(mdhd) < 24:
+        raise MP4Error("Missing or truncated mdhd box")
+    # Version 1 has 64-bit creation and modification times before the timescale
+    timescale = struct.unpack_from('>I', mdhd, 20 if mdhd[0] == 1 else 12)[0]
+    if not timescale:
+        raise MP4Error("Track timescale is zero")
+    return timescale
+
+
+def find_box(children, box_type):
+    """Return the body of the first box of a type in a parse_children list, or None."""
+    for child_type, body in children:
+        if child_type == box_type:
+            return body
+    return None
+
+
+def find_boxes(children, box_type):
+    """Return the bodies of every box of a type in a parse_children list."""
+    return [body for child_type, body in children if child_type == box_type]
+
+
+def _index_track(timescale, stbl, file_size):
+    # internal: KeyframeIndex of one track from its sample table boxes
+    sample_sizes = _sample_sizes(find_box(stbl, b'stsz'), file_size)
+    sample_count = len(sample_sizes)
+    stss = find_box(stbl, b'stss')
+    # Without stss every sample is a sync sample
+    sync = _table(stss, 'I') if stss is not None else range(1, sample_count + 1)
+
+    chunk_offsets = _chunk_offsets(stbl)
+    chunk_first = _chunk_first_samples(find_box(stbl, b'stsc'), len(chunk_offsets))
+
+    times, offsets = array('Q'), array('Q')
+    deltas = iter(_pairs(find_box(stbl, b'stts')))
+    run_left, delta, run_start_sample, run_start_time = 0, 0, 1, 0
+    for sample in sync:
+        if not 1 <= sample <= sample_count:
+            raise MP4Error(f"Sync sample {sample} outside {sample_count} samples")
+        # Decode time: advance through the stts runs to the run holding the sample
+        while sample >= run_start_sample + run_left:
+            run_start_sample += run_left
+            run_start_time += run_left * delta
+            try:
+                run_left, delta = next(deltas)
+            except StopIteration:
+                raise MP4Error("stts covers fewer samples than stsz")
+        times.append(run_start_time + (sample - run_start_sample) * delta)
+
+        # Byte offset: the chunk's offset plus the samples before it in the chunk
+        chunk = bisect_right(chunk_first, sample) - 1
+        if chunk < 0:
+            raise MP4Error(f"No chunk holds sample {sample}")
+        first = chunk_first[chunk]
+        offsets.append(chunk_offsets[chunk] + sum(sample_sizes[first - 1:sample - 1]))
+    return KeyframeIndex(timescale, times, offsets)
+
+
+def _sample_sizes(stsz, file_size):
+    # internal: array of sample sizes; stsz gives one size for all samples or one per sample
+    if len(stsz) < 12:
+        raise MP4Error("Truncated stsz box")
+    uniform, count = struct.unpack_from('>II', stsz, 4)
+    if count > MAX_SAMPLES:
+        raise MP4Error(f"stsz declares {count} samples, more than the {MAX_SAMPLES} indexed")
+    if uniform:
+        # A per-sample table is bounded by the box size; a uniform size is not
+        if count * uniform > file_size:
+            raise MP4Error(f"stsz declares {count} samples of {uniform} bytes in a {file_size} byte file")
+        return array('Q', [uniform]) * count
+    return _table(stsz, 'I', header=12)
+
+
+def _chunk_offsets(stbl):
+    # internal: chunk offsets from stco or co64
+    stco = find_box(stbl, b'stco')
+    if stco is not None:
+        return _table(stco, 'I')
+    co64 = find_box(stbl, b'co64')
+    if co64 is not None:
+        return _table(co64, 'Q')
+    raise MP4Error("Sample table has no chunk offsets")
+
+
+def _chunk_first_samples(stsc, chunk_count):
+    # internal: number of the first sample of each chunk (both counted from 1)
+    if stsc is None:
+        raise MP4Error("Sample table has no stsc box")
+    entries = _triples(stsc)
+    first_samples = array('Q')
+    sample = 1
+    for i, (first_chunk, samples_per_chunk, _) in enumerate(entries):
+        next_chunk = entries[i + 1][0] if i + 1 < len(entries) else chunk_count + 1
+        for _ in range(first_chunk, min(next_chunk, chunk_count + 1)):
+            first_samples.append(sample)
+            sample += samples_per_chunk
+    return first_samples
+
+
+def _table(body, code, header=8):
+    # internal: entries of a full box whose count follows the version/flags word
+    if len(body) < header:
+        raise MP4Error("Truncated sample table box")
+    count = struct.unpack_from('>I', body, header - 4)[0]
+    width = struct.calcsize(code)
+    if len(body) < header + count * width:
+        raise MP4Error("Truncated sample table box")
+    return array('Q', struct.unpack_from(f'>{count}{code}', body, header))
+
+
+def _pairs(body):
+    # internal: (count, value) entries of stts
+    if body is None:
+        raise MP4Error("Sample table has no stts box")
+    values = _table_n(body, 2)
+    return list(zip(values[0::2], values[1::2]))
+
+
+def _triples(body):
+    # internal: (first chunk, samples per chunk, description index) entries of stsc
+    values = _table_n(body, 3)
+    return list(zip(values[0::3], values[1::3], values[2::3]))
+
+
+def _table_n(body, fields):
+    # internal: flat list of the 32-bit fields of a full box with multi-field entries
+    if len(body) < 8:
+        raise MP4Error("Truncated sample table box")
+    count = struct.unpack_from('>I', body, 4)[0]
+    if len(body) < 8 + count * fields * 4:
+        raise MP4Error("Truncated sample table box")
+    return struct.unpack_from(f'>{count * fields}I', body, 8)
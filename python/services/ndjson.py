@@ -0,0 +1,60 @@
+"""
+NDJSON Module
+
+Streams listings as newline-delimited JSON (application/x-ndjson): one JSON
+object per line, written as rows are produced, so neither the server nor the
+client has to hold the whole listing in memory.
+"""
+import json
+from flask import Response, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# Approximate bytes of output collected before it is sent
+NDJSON_CHUNK_SIZE = 64 * 1024
+
+
+def wants_ndjson(request):
+    """
+    Return True if the client asked for an NDJSON stream.
+
+    Clients opt in with ``Accept: application/x-ndjson`` or ``?format=ndjson``.
+
+    Args:
+        request: Current Flask request
+    """
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def ndjson_response(items):
+    """
+    Build a streamed response writing one line per item.
+
+    The generator runs inside the request context, so it may query the
+    database while the response is being sent.
+
+    Args:
+        items: Iterable of JSON-serializable objects
+
+    Returns:
+        Streaming Response
+    """
+    def generate():
+        # Lines are sent in chunks so each write carries many of them
+        lines, size = [], 0
+        for item in items:
+            line = json.dumps(item, separators=(',', ':')) + '\n'
+            lines.append(line)
+            size += len(line)
+            if size >= NDJSON_CHUNK_SIZE:
+                yield ''.join(lines)
+                lines, size = [], 0
+        if lines:
+            yield ''.join(lines)
+
+    response = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    response.headers['Cache-Control'] = 'no-store'
+    # Ask reverse proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,115 @@
+"""
+Page Cache Module
+
+Serves the server-rendered UI pages from memory. The /media pages take no
+per-request context, so their HTML only changes with a deploy; each
+template is rendered on its first request in a worker process and the
+bytes are reused from then on.
+
+Every page carries a strong ETag (a digest of its bytes) and
+``Cache-Control: no-cache``, so browsers revalidate on each visit and get
+a bodyless 304 while the page is unchanged.
+
+When templates are reloaded automatically (debug mode, or
+TEMPLATES_AUTO_RELOAD), the cache is dropped as soon as a file under a
+template folder or the static folder changes; the latter catches rebuilt
+assets, whose fingerprinted names are part of the HTML.
+"""
+import os
+import hashlib
+import threading
+from flask import current_app, request, render_template, Response
+
+# Key of the per-application pages in app.extensions
+EXTENSION_KEY = 'page_cache'
+
+
+class PageCache:
+    """
+    Renders each page template once per process and serves it with a strong ETag.
+    """
+
+    def __init__(self):
+        """Initialize the hit statistics."""
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.renders = 0
+        self.not_modified = 0
+
+    def send(self, template_name):
+        """
+        Serve a rendered template, or 304 if the client's copy is current.
+
+        Must be called while handling a request.
+
+        Args:
+            template_name: Name of a template that needs no context
+
+        Returns:
+            Response
+        """
+        page = self._page(current_app._get_current_object(), template_name)
+        response = Response(page[0], mimetype='text/html')
+        response.set_etag(page[1])
+        response.cache_control.no_cache = True
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            with self._lock:
+                self.not_modified += 1
+        return response
+
+    def clear(self, app=None):
+        """Drop the rendered pages of an application (the current one by default)."""
+        app = app or current_app._get_current_object()
+        app.extensions.pop(EXTENSION_KEY, None)
+
+    def stats(self):
+        """Report how often pages were served from memory, rendered, and revalidated."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'renders': self.renders,
+                'notModified': self.not_modified
+            }
+
+    def _page(self, app, template_name):
+        # internal: the (body, etag) of a template, rendered if not cached or out of date
+        entry = app.extensions.get(EXTENSION_KEY)
+        signature = self._signature(app) if app.templates_auto_reload else None
+        if entry is None or entry['signature'] != signature:
+            entry = {'signature': signature, 'pages': {}}
+            app.extensions[EXTENSION_KEY] = entry
+        # Links are rendered relative to the mount point of the application
+        key = (template_name, request.script_root)
+        page = entry['pages'].get(key)
+        if page is not None:
+            with self._lock:
+                self.hits += 1
+            return page
+        body = render_template(template_name).encode('utf-8')
+        page = (body, hashlib.sha256(body).hexdigest()[:32])
+        # Concurrent first requests may both render; either result is the same page
+        entry['pages'][key] = page
+        with self._lock:
+            self.renders += 1
+        return page
+
+    def _signature(self, app):
+        # internal: modification times of every template and static file, to notice edits in development
+        folders = [app.static_folder]
+        for loader in [app.jinja_loader] + [bp.jinja_loader for bp in app.iter_blueprints()]:
+            folders.extend(getattr(loader, 'searchpath', ()))
+        mtimes = []
+        for folder in dict.fromkeys(f for f in folders if f):
+            for directory, _, filenames in os.walk(folder):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    try:
+                        mtimes.append((path, os.stat(path).st_mtime_ns))
+                    except OSError:
+                        continue
+        return tuple(sorted(mtimes))
+
+
+# Shared instance used by the UI routes
+page_cache = PageCache()
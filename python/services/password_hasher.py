@@ -0,0 +1,199 @@
+"""
+Password Hasher Module
+
+Runs bcrypt hashing and verification on a small dedicated thread pool.
+bcrypt is deliberately slow (tens to hundreds of milliseconds per call), and
+a burst of logins run inline on request threads would take every thread and
+CPU slice the server has, stalling streams and listings behind them.
+
+The pool has a fixed number of workers and a bounded queue. A request that
+finds the queue full is refused at once with ``HasherBusy``, which the
+controllers turn into 503 with a Retry-After estimate, rather than waiting
+in line. Each admitted call holds its request thread until the hash is
+done, so admissions are also capped at half the server's request threads;
+the other half stays free for streams whatever the queue settings.
+bcrypt releases the GIL while it works, so other request threads keep
+running while a worker hashes.
+
+Hashes made with a cost factor other than the configured one are reported
+by ``needs_rehash`` so the login path can upgrade them transparently.
+"""
+import os
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full; ``retry_after`` is a wait in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__("Too many password checks in progress, try again shortly")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Bounded executor for bcrypt work.
+    """
+
+    def __init__(self, workers=1, queue_limit=2, rounds=12, timeout=30, request_threads=None):
+        """
+        Initialize without starting any threads.
+
+        Args:
+            workers: Threads hashing at the same time
+            queue_limit: Requests allowed to wait for a worker before new ones are refused
+            rounds: bcrypt cost factor (log2 of the iterations) for new hashes
+            timeout: Seconds a request waits for its result
+            request_threads: Request threads of a server process, or None if unknown;
+                             at most half of them may wait on hashing
+        """
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.rounds = rounds
+        self.timeout = timeout
+        self.request_threads = request_threads
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        # Calls submitted and not yet finished, running or queued
+        self._in_flight = 0
+        # Moving average of one bcrypt call, used for Retry-After
+        self._average = 0.25
+        self.completed = 0
+        self.rejected = 0
+
+    def configure(self, workers=None, queue_limit=None, rounds=None, timeout=None, request_threads=None):
+        """Apply pool size, queue limit, thread budget and cost settings from the application config."""
+        with self._lock:
+            if workers is not None:
+                self.workers = workers
+            if queue_limit is not None:
+                self.queue_limit = queue_limit
+            if rounds is not None:
+                self.rounds = rounds
+            if timeout is not None:
+                self.timeout = timeout
+            if request_threads is not None:
+                self.request_threads = request_threads
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False)
+            # The pool is rebuilt with the new sizes on next use
+            self._pid = None
+
+    def hash(self, password):
+        """
+        Hash a password with the configured cost factor.
+
+        Args:
+            password: Plain text password
+
+        Returns:
+            bcrypt hash string
+
+        Raises:
+            HasherBusy: If the queue is full
+        """
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password, hashed):
+        """
+        Check a password against a stored hash.
+
+        Args:
+            password: Plain text password
+            hashed: Stored bcrypt hash string
+
+        Returns:
+            True if the password matches
+
+        Raises:
+            HasherBusy: If the queue is full
+        """
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """
+        Return True if a stored hash was made with a different cost factor.
+
+        Args:
+            hashed: Stored bcrypt hash string ($2b$<cost>$...)
+        """
+        parts = hashed.split('$')
+        return len(parts) < 4 or not parts[2].isdigit() or int(parts[2]) != self.rounds
+
+    def admission_limit(self):
+        """Return how many calls may run or wait at once before new ones are refused."""
+        limit = self.workers + self.queue_limit
+        if self.request_threads is not None:
+            limit = min(limit, max(1, self.request_threads // 2))
+        return limit
+
+    def stats(self):
+        """Report pool sizing, queued work and outcomes in this process."""
+        return {
+            'workers': self.workers,
+            'queueLimit': self.queue_limit,
+            'admissionLimit': self.admission_limit(),
+            'rounds': self.rounds,
+            'inFlight': self._in_flight if self._pid == os.getpid() else 0,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'averageSeconds': round(self._average, 4)
+        }
+
+    def _run(self, fn, *args):
+        # internal: run fn on the pool if a slot is free, waiting for its result
+        executor = self._pool()
+        with self._lock:
+            if self._in_flight >= self.admission_limit():
+                self.rejected += 1
+                raise HasherBusy(self._retry_after())
+            self._in_flight += 1
+        try:
+            future = executor.submit(self._timed, fn, *args)
+        except BaseException:
+            self._finished()
+            raise
+        future.add_done_callback(lambda _: self._finished())
+        return future.result(timeout=self.timeout)
+
+    def _finished(self):
+        # internal: free the slot of a finished call
+        with self._lock:
+            self._in_flight -= 1
+
+    def _timed(self, fn, *args):
+        # internal: worker body, keeps the moving average of call duration
+        started = time.monotonic()
+        result = fn(*args)
+        self._average = 0.8 * self._average + 0.2 * (time.monotonic() - started)
+        self.completed += 1
+        return result
+
+    def _pool(self):
+        # internal: executor of this process, created on first use
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Forked children inherit the executor object but none of its threads
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='bcrypt')
+                    if self._pid is not None:
+                        # Calls counted in the parent process never finish here
+                        self._in_flight = 0
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _retry_after(self):
+        # internal: seconds until the current queue should have drained
+        backlog = self.admission_limit()
+        return max(1, math.ceil(backlog * self._average / self.workers))
+
+
+# Shared instance used by the auth and user controllers
+password_hasher = PasswordHasher()
@@ -0,0 +1,208 @@
+"""
+Search Index Module
+
+Full-text search over video titles and file names backed by an SQLite FTS5
+table. A single index holds both kinds of media: a video's entry uses rowid
+2 * id and a file's entry 2 * id + 1, so triggers on the videos and files
+tables find the entry to change by rowid instead of scanning the index.
+
+Queries match every word of the search text as a prefix ("holi vid" finds
+"Holiday Video.mp4") and are ordered by bm25 relevance. Databases without
+FTS5 (other dialects, or an SQLite built without it) fall back to LIKE
+filters, which are correct but scan the table.
+"""
+import re
+import weakref
+from flask_sqlalchemy import Pagination
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from models.video_model import db, Video
+from models.file_model import File
+
+# Kinds of media in the index, by rowid parity
+VIDEO_KIND = 0
+FILE_KIND = 1
+
+# Search text is reduced to at most this many words
+MAX_QUERY_TERMS = 16
+
+INDEX_TABLE = 'media_search'
+
+_CREATE_INDEX = f"""
+CREATE VIRTUAL TABLE {INDEX_TABLE} USING fts5(
+    title,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+# (source table, indexed column, rowid parity)
+_SOURCES = (
+    ('videos', 'title', VIDEO_KIND),
+    ('files', 'original_name', FILE_KIND),
+)
+
+_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+    INSERT INTO {index}(rowid, title) VALUES (new.id * 2 + {kind}, new.{column});
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+    DELETE FROM {index} WHERE rowid = old.id * 2 + {kind};
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {column} ON {table} BEGIN
+    UPDATE {index} SET title = new.{column} WHERE rowid = old.id * 2 + {kind};
+END;
+"""
+
+
+def match_query(search_text):
+    """
+    Turn free text into an FTS5 query matching every word as a prefix.
+
+    Args:
+        search_text: Text typed by the user
+
+    Returns:
+        FTS5 MATCH expression, or None if the text has no words
+    """
+    terms = re.findall(r'\w+', search_text or '')[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    # Quoting keeps words such as AND/NOT/NEAR from being read as operators
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+class SearchIndex:
+    """
+    Maintains the FTS5 index and runs paginated media searches.
+    """
+
+    def __init__(self):
+        """Initialize with no engine indexed yet."""
+        # Engines whose database has the index and its triggers
+        self._engines = weakref.WeakSet()
+
+    def install(self):
+        """
+        Create the index and its triggers if missing, filling a new index
+        from the existing rows.
+
+        Must be called inside an application context after ``db.create_all``.
+
+        Returns:
+            True if full-text search is available on this database
+        """
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return False
+        try:
+            with engine.begin() as connection:
+                exists = connection.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': INDEX_TABLE}
+                ).first()
+                if not exists:
+                    connection.exec_driver_sql(_CREATE_INDEX)
+                    self._fill(connection)
+                for table, column, kind in _SOURCES:
+                    for statement in _TRIGGERS.format(table=table, column=column, kind=kind,
+                                                      index=INDEX_TABLE).split('END;'):
+                        if statement.strip():
+                            connection.exec_driver_sql(statement + 'END;')
+        except OperationalError as err:
+            # SQLite compiled without FTS5
+            print(f"Full-text search unavailable, using LIKE search: {err}")
+            return False
+        self._engines.add(engine)
+        return True
+
+    def rebuild(self):
+        """
+        Refill the index from the videos and files tables.
+
+        Returns:
+            Number of entries indexed
+        """
+        if not self.available():
+            return 0
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql(f'DELETE FROM {INDEX_TABLE}')
+            self._fill(connection)
+            return connection.exec_driver_sql(f'SELECT count(*) FROM {INDEX_TABLE}').scalar()
+
+    def available(self):
+        """Return True if the current database has the full-text index."""
+        return db.engine in self._engines
+
+    def search_videos(self, search_text, page=1, per_page=20):
+        """
+        Search video titles.
+
+        Args:
+            search_text: Text typed by the user
+            page: 1-based page number
+            per_page: Results per page
+
+        Returns:
+            Pagination of Video objects, best matches first
+        """
+        return self._search(Video, Video.title, VIDEO_KIND, search_text, page, per_page)
+
+    def search_files(self, search_text, page=1, per_page=20):
+        """
+        Search original file names.
+
+        Args:
+            search_text: Text typed by the user
+            page: 1-based page number
+            per_page: Results per page
+
+        Returns:
+            Pagination of File objects, best matches first
+        """
+        return self._search(File, File.original_name, FILE_KIND, search_text, page, per_page)
+
+    def _search(self, model, column, kind, search_text, page, per_page):
+        # internal: ranked FTS search of one kind, or the LIKE fallback
+        page, per_page = max(page, 1), max(per_page, 1)
+        if not self.available():
+            return self._like_search(model, column, search_text, page, per_page)
+
+        query = match_query(search_text)
+        if query is None:
+            return Pagination(None, page, per_page, 0, [])
+        params = {'query': query, 'kind': kind, 'limit': per_page, 'offset': (page - 1) * per_page}
+        total = db.session.execute(text(
+            f'SELECT count(*) FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH :query AND rowid % 2 = :kind'
+        ), params).scalar()
+        rowids = db.session.execute(text(
+            f'SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH :query AND rowid % 2 = :kind '
+            'ORDER BY rank LIMIT :limit OFFSET :offset'
+        ), params).scalars().all()
+
+        ids = [rowid // 2 for rowid in rowids]
+        rows = {row.id: row for row in model.query.filter(model.id.in_(ids))} if ids else {}
+        items = [rows[item_id] for item_id in ids if item_id in rows]
+        return Pagination(None, page, per_page, total, items)
+
+    def _like_search(self, model, column, search_text, page, per_page):
+        # internal: substring match on every word, newest first
+        terms = re.findall(r'\w+', search_text or '')[:MAX_QUERY_TERMS]
+        if not terms:
+            return Pagination(None, page, per_page, 0, [])
+        query = model.query
+        for term in terms:
+            query = query.filter(column.ilike(f'%{term}%'))
+        return query.order_by(model.uploaded_at.desc(), model.id.desc())\
+            .paginate(page=page, per_page=per_page, error_out=False)
+
+    def _fill(self, connection):
+        # internal: index every existing video and file
+        for table, column, kind in _SOURCES:
+            connection.exec_driver_sql(
+                f'INSERT INTO {INDEX_TABLE}(rowid, title) SELECT id * 2 + {kind}, {column} FROM {table}'
+            )
+
+
+# Shared instance used by the file model and the video service
+search_index = SearchIndex()
@@ -0,0 +1,241 @@
+"""
+Static Assets Module
+
+Fingerprinted, precompressed copies of the files under static/, so browsers
+can cache them forever and repeat visits download no asset bytes.
+
+``build_assets`` (run by ``flask build-assets`` and the Docker build) copies
+each asset to static/dist/ with the first characters of its SHA-256 digest
+in its name (css/main.css -> dist/css/main.3f2a9c1b7d4e.css). Text assets
+also get .gz and, when the optional ``brotli`` package is installed, .br
+variants. manifest.json maps each source name to its fingerprinted name.
+
+``StaticAssets`` hooks ``url_for('static', ...)`` so templates link to the
+fingerprinted names. It also replaces the static view for them. The view
+answers with ``Cache-Control: immutable`` and serves the .br or .gz variant
+when the client accepts it. An asset edited after the last build no longer matches
+its fingerprint and is linked and served unfingerprinted until the next
+build.
+"""
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import mimetypes
+from flask import request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    # .br variants are skipped; browsers then get the .gz ones
+    brotli = None
+
+# Directory under static/ holding the build output, and its manifest
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+# Hex digits of the content digest put into each file name
+FINGERPRINT_LENGTH = 12
+# Assets worth compressing; images and fonts are compressed already
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.html', '.json', '.txt', '.map'}
+# Content-Encoding of each variant, most preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Fingerprinted names never change content, so caches may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def fingerprint(path):
+    """Return the fingerprint of a file: the leading hex digits of its SHA-256 digest."""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def fingerprinted_name(name, digest):
+    """Return the build output name of a static file name (relative to the static folder)."""
+    stem, extension = os.path.splitext(name)
+    return f'{DIST_DIR}/{stem}.{digest}{extension}'
+
+
+def build_assets(static_folder):
+    """
+    Write the fingerprinted and compressed assets and their manifest.
+
+    The new output is built beside the old one and swapped in, so a running
+    server never sees a half-written build.
+
+    Args:
+        static_folder: Static folder of the application
+
+    Returns:
+        Manifest dict of source name -> fingerprinted name, both relative to the static folder
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    staging = dist + '.new'
+    shutil.rmtree(staging, ignore_errors=True)
+    manifest = {}
+    for directory, subdirectories, filenames in os.walk(static_folder):
+        if directory == static_folder:
+            # Skip the build output, including a staging directory left by a failed build
+            subdirectories[:] = [d for d in subdirectories if not d.startswith(DIST_DIR)]
+        for filename in sorted(filenames):
+            source = os.path.join(directory, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            fingerprinted = fingerprinted_name(name, fingerprint(source))
+            target = os.path.join(staging, fingerprinted[len(DIST_DIR) + 1:])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                _write_variants(target)
+            manifest[name] = fingerprinted
+
+    with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    previous = dist + '.old'
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(dist):
+        os.rename(dist, previous)
+    os.rename(staging, dist)
+    shutil.rmtree(previous, ignore_errors=True)
+    return manifest
+
+
+def _write_variants(path):
+    # internal: write the .gz and .br variants of an asset, keeping only those that are smaller
+    with open(path, 'rb') as f:
+        data = f.read()
+    variants = {'.gz': gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+class StaticAssets:
+    """
+    Links templates to the fingerprinted assets of a build and serves them.
+    """
+
+    def __init__(self, static_folder, auto_reload=None):
+        """
+        Initialize without reading the manifest.
+
+        Args:
+            static_folder: Static folder of the application
+            auto_reload: Reread the manifest when a build or an edited asset makes it stale;
+                         None follows the application's debug mode
+        """
+        self.static_folder = static_folder
+        self.auto_reload = auto_reload
+        self._app = None
+        self._manifest_path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+        self._loaded_mtime = None
+        self._names = {}
+        self._variants = {}
+        self._source_mtimes = {}
+
+    def init_app(self, app):
+        """Hook url_for('static') and the static view of an application."""
+        self._app = app
+        self.load()
+        app.url_defaults(self._fingerprint_url)
+        default_view = app.view_functions['static']
+
+        def static(filename):
+            if self._current() and filename in self._variants:
+                return self.send_asset(filename)
+            return default_view(filename=filename)
+
+        app.view_functions['static'] = static
+
+    def load(self):
+        """
+        Read the manifest of the last build, if there is one.
+
+        Assets whose source changed since the build are left out.
+
+        Returns:
+            Number of fingerprinted assets in use
+        """
+        try:
+            mtime = os.stat(self._manifest_path).st_mtime
+            with open(self._manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            mtime, manifest = None, {}
+
+        names, variants, source_mtimes = {}, {}, {}
+        for name, fingerprinted in manifest.items():
+            source = safe_join(self.static_folder, name)
+            target = safe_join(self.static_folder, fingerprinted)
+            if source is None or target is None or not os.path.isfile(target):
+                continue
+            try:
+                source_mtimes[source] = os.stat(source).st_mtime
+                if fingerprinted != fingerprinted_name(name, fingerprint(source)):
+                    continue
+            except OSError:
+                continue
+            names[name] = fingerprinted
+            variants[fingerprinted] = [(encoding, suffix) for encoding, suffix in ENCODINGS
+                                       if os.path.isfile(target + suffix)]
+        self._names, self._variants = names, variants
+        self._loaded_mtime, self._source_mtimes = mtime, source_mtimes
+        return len(names)
+
+    def url(self, filename):
+        """Return the name to link for a static file: its fingerprinted name when built."""
+        self._current()
+        return self._names.get(filename, filename)
+
+    def send_asset(self, filename):
+        """
+        Serve a fingerprinted asset as immutable, in the best encoding the client accepts.
+
+        Args:
+            filename: Fingerprinted name relative to the static folder
+
+        Returns:
+            Response
+        """
+        path = safe_join(self.static_folder, filename)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for encoding, suffix in self._variants.get(filename, ()):
+            if request.accept_encodings[encoding]:
+                response = send_file(path + suffix, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_file(path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def _current(self):
+        # internal: in development, reload once a build or an edited asset made the manifest stale;
+        # True if any fingerprinted asset is in use
+        auto_reload = self.auto_reload
+        if auto_reload is None:
+            auto_reload = self._app is not None and self._app.debug
+        if auto_reload and self._stale():
+            self.load()
+        return bool(self._names)
+
+    def _stale(self):
+        # internal: True if the manifest or an asset it lists changed since it was loaded
+        for path, loaded in [(self._manifest_path, self._loaded_mtime)] + list(self._source_mtimes.items()):
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != loaded:
+                return True
+        return False
+
+    def _fingerprint_url(self, endpoint, values):
+        # internal: url_defaults hook pointing url_for('static', filename=...) at the fingerprinted name
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.url(values['filename'])
@@ -0,0 +1,204 @@
+"""
+Stream Backend Module
+
+Selects how the streaming endpoints read the bytes of a range, per deployment:
+
+- ``sendfile`` (default): the WSGI server's file wrapper sends the range
+  from the descriptor, with os.sendfile where the server supports it
+  (gunicorn). The kernel's own read-ahead applies.
+- ``mmap``: the range is memory-mapped and served in slices of the mapping.
+  The kernel is told the range is read sequentially and asked to read a
+  window ahead of the reader. Pages the reader has passed are dropped, so
+  a one-off download does not push hot media out of the page cache. The
+  head of each file, which every viewer reads, is never dropped.
+
+The ASGI server sends the mapped slices as memoryviews without copying
+them; WSGI servers only accept bytes, so there each slice is copied once,
+as a read would.
+"""
+import os
+import mmap
+
+# Backends accepted by STREAM_BACKEND
+BACKENDS = ('sendfile', 'mmap')
+
+
+class MappedRange:
+    """
+    Read-only mapping of one byte range of a file, with read-ahead and drop-behind hints.
+    """
+
+    def __init__(self, fd, offset, length, readahead, keep_head=0, drop_behind=True):
+        """
+        Map the range and ask the kernel to start reading it.
+
+        Args:
+            fd: Open descriptor of the file; it stays owned by the caller
+            offset: First byte of the range
+            length: Number of bytes in the range (at least 1)
+            readahead: Bytes the kernel is asked to read ahead of the reader
+            keep_head: Leading bytes of the file never dropped from the page cache
+            drop_behind: Drop pages the reader has passed from the page cache
+
+        Raises:
+            OSError, ValueError, OverflowError: If the range cannot be mapped
+                (e.g. beyond the address space of a 32-bit process)
+        """
+        self._fd = fd
+        self._end = offset + length
+        # Mappings start on an allocation boundary
+        self._base = offset - offset % mmap.ALLOCATIONGRANULARITY
+        self._map = mmap.mmap(fd, self._end - self._base, access=mmap.ACCESS_READ, offset=self._base)
+        self._view = memoryview(self._map)
+        self._readahead = max(readahead, mmap.PAGESIZE)
+        self._drop_from = keep_head if drop_behind else None
+        self._dropped_to = max(offset, keep_head)
+        self._advised_to = offset
+        if hasattr(self._map, 'madvise'):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        _fadvise(fd, offset, length, 'POSIX_FADV_SEQUENTIAL')
+        self._read_ahead(offset)
+
+    def view(self, position, size):
+        """
+        Return the bytes at a position as a slice of the mapping, without copying.
+
+        Args:
+            position: First byte, within the mapped range
+            size: Maximum number of bytes
+
+        Returns:
+            memoryview of at most ``size`` bytes, empty at the end of the range
+        """
+        size = max(0, min(size, self._end - position))
+        if position + size > self._advised_to - self._readahead // 2:
+            self._read_ahead(position)
+        if self._drop_from is not None and position - self._dropped_to >= 2 * self._readahead:
+            self._drop_behind(position - self._readahead)
+        start = position - self._base
+        return self._view[start:start + size]
+
+    def fault_in(self, view):
+        """
+        Touch every page of a slice, so its pages are resident before it is sent.
+
+        Called on a worker thread by the ASGI server, which must not wait on
+        the disk in its event loop.
+        """
+        if view:
+            view[::mmap.PAGESIZE].tobytes()
+            view[-1:].tobytes()
+
+    def close(self):
+        """Unmap the range once no slice of it is still being sent."""
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            # A server still holds a slice; the mapping goes when the last slice does
+            pass
+        self._map = None
+
+    def _read_ahead(self, position):
+        # internal: ask the kernel to read the window ahead of the reader
+        start = max(position, self._advised_to)
+        stop = min(position + self._readahead, self._end)
+        if stop > start:
+            _fadvise(self._fd, start, stop - start, 'POSIX_FADV_WILLNEED')
+            self._advised_to = stop
+
+    def _drop_behind(self, stop):
+        # internal: drop the pages between the last drop and stop from the page cache
+        stop -= stop % mmap.PAGESIZE
+        start = self._dropped_to
+        if stop <= start:
+            return
+        if hasattr(self._map, 'madvise'):
+            # Pages this mapping still maps are skipped by POSIX_FADV_DONTNEED; unmap them first
+            aligned = start - (start - self._base) % mmap.PAGESIZE
+            self._map.madvise(mmap.MADV_DONTNEED, aligned - self._base, stop - aligned)
+        _fadvise(self._fd, start, stop - start, 'POSIX_FADV_DONTNEED')
+        self._dropped_to = stop
+
+
+class StreamBackend:
+    """
+    Deployment-wide choice of how ranges are read, with its read-ahead settings.
+    """
+
+    def __init__(self, name='sendfile', readahead_bytes=4 * 1024 * 1024, drop_behind=True, keep_head=0):
+        """
+        Initialize the backend settings.
+
+        Args:
+            name: 'sendfile' or 'mmap'
+            readahead_bytes: Bytes read ahead of the reader by the mmap backend
+            drop_behind: Whether the mmap backend drops pages behind the reader
+            keep_head: Leading bytes of each file never dropped
+        """
+        self.name = name
+        self.readahead_bytes = readahead_bytes
+        self.drop_behind = drop_behind
+        self.keep_head = keep_head
+
+    def configure(self, name=None, readahead_bytes=None, drop_behind=None, keep_head=None):
+        """
+        Apply the backend settings from the application config.
+
+        Raises:
+            ValueError: If the backend name is unknown
+        """
+        if name is not None:
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown stream backend: {name} (expected one of {', '.join(BACKENDS)})")
+            self.name = name
+        if readahead_bytes is not None:
+            self.readahead_bytes = readahead_bytes
+        if drop_behind is not None:
+            self.drop_behind = drop_behind
+        if keep_head is not None:
+            self.keep_head = keep_head
+
+    def maps(self):
+        """Return True if ranges are served from memory mappings."""
+        return self.name == 'mmap'
+
+    def map_range(self, fd, offset, length):
+        """
+        Map a range for the mmap backend.
+
+        Args:
+            fd: Open descriptor of the file
+            offset: First byte of the range
+            length: Number of bytes
+
+        Returns:
+            MappedRange, or None if the backend does not map or the range cannot
+            be mapped; the caller then reads with os.pread
+        """
+        if not self.maps() or length <= 0:
+            return None
+        try:
+            return MappedRange(fd, offset, length, self.readahead_bytes, self.keep_head, self.drop_behind)
+        except (OSError, ValueError, OverflowError) as err:
+            print(f"Error mapping stream range, reading instead: {err}")
+            return None
+
+    def stats(self):
+        """Report the selected backend and its settings."""
+        return {
+            'backend': self.name,
+            'readaheadBytes': self.readahead_bytes,
+            'dropBehind': self.drop_behind,
+            'keepHead': self.keep_head
+        }
+
+
+def _fadvise(fd, offset, length, advice):
+    # internal: give a posix_fadvise hint where the platform has it
+    if hasattr(os, 'posix_fadvise') and hasattr(os, advice):
+        os.posix_fadvise(fd, offset, length, getattr(os, advice))
+
+
+# Shared instance configured by the application
+stream_backend = StreamBackend()
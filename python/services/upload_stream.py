@@ -0,0 +1,133 @@
+"""
+Upload Stream Module
+
+Writes uploaded file bodies straight into the upload folder while the
+multipart request is being parsed. Werkzeug normally spools each file part
+into a temporary file and the controller then copies it to its destination,
+so every byte hits the disk twice. Here the parser's file container is a
+staging file on the same filesystem as the destination that counts and
+hashes bytes as they are written; committing it is a rename.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+from flask import Request
+from werkzeug.formparser import default_stream_factory
+from services.media_cache import upload_folder_path
+
+# Bytes copied per iteration when staging a stream that was not parsed here
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class StagedUpload:
+    """
+    Writable file in a staging directory that tracks its size and SHA-256
+    digest as data is written.
+
+    Until ``commit`` moves it into place the file is private to the upload
+    and is removed on ``close``.
+    """
+
+    def __init__(self, directory):
+        """
+        Create an empty staging file.
+
+        Args:
+            directory: Directory to stage in; must share a filesystem with the destination
+        """
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        """Append data to the file, updating the size and digest."""
+        self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+        return len(data)
+
+    def hexdigest(self):
+        """Return the SHA-256 digest of everything written so far."""
+        return self._hash.hexdigest()
+
+    def commit(self, dest):
+        """
+        Flush the file to disk and move it to its final location.
+
+        Args:
+            dest: Destination path on the same filesystem
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        os.replace(self.path, dest)
+        self.path = dest
+        self.committed = True
+
+    def close(self):
+        """Close the file, deleting it unless it was committed."""
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        # read/seek/tell etc. are served by the underlying file
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._file, name)
+
+
+def stage_upload(file_storage, directory):
+    """
+    Return the uploaded file as a StagedUpload.
+
+    Bodies parsed by StreamingUploadRequest are already staged and are
+    returned as-is. Any other stream is copied once into a new staging file,
+    computing its size and digest in the same pass.
+
+    Args:
+        file_storage: FileStorage from request.files (or constructed directly)
+        directory: Staging directory on the destination filesystem
+
+    Returns:
+        StagedUpload holding the complete body
+    """
+    stream = file_storage.stream
+    if isinstance(stream, StagedUpload) and not stream.committed:
+        return stream
+    staged = StagedUpload(directory)
+    try:
+        shutil.copyfileobj(stream, staged, COPY_CHUNK_SIZE)
+    except Exception:
+        staged.close()
+        raise
+    return staged
+
+
+def staging_dir(upload_folder):
+    """Return the staging directory for an upload folder."""
+    return os.path.join(upload_folder, '.incoming')
+
+
+class StreamingUploadRequest(Request):
+    """
+    Request class whose multipart file parts are written directly into the
+    upload folder's staging directory.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not filename:
+            return default_stream_factory(
+                total_content_length=total_content_length,
+                filename=filename,
+                content_type=content_type,
+                content_length=content_length,
+            )
+        return StagedUpload(staging_dir(upload_folder_path()))
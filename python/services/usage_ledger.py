@@ -0,0 +1,149 @@
+"""
+Usage Ledger Module
+
+Keeps running byte counters of stored uploads, globally and per uploader,
+in the storage_usage table. Committed rows are counted by ORM hooks (see
+models/usage_model.py) in the same transaction that inserts or deletes the
+row, so admitting an upload reads one counter row instead of summing every
+files and videos row.
+
+Uploads reserve their size before their bytes are moved into the blob store.
+The reservation is a single conditional UPDATE, so two concurrent uploads
+cannot both pass a check that only one of them fits.
+"""
+from models.video_model import db, Video
+from models.file_model import File
+from models.upload_model import UploadSession
+from models.usage_model import StorageUsage, TOTAL_SCOPE, apply_usage
+
+
+class QuotaExceeded(IOError):
+    """Raised when a reservation would take usage past its limit."""
+
+
+class UsageLedger:
+    """
+    Reserves, releases and reports storage usage.
+    """
+
+    def reserve(self, size, username=None, max_total=None, max_user=None):
+        """
+        Reserve room for an upload and commit the reservation.
+
+        Args:
+            size: Number of bytes the upload will store
+            username: Uploader the bytes count against, if known
+            max_total: Limit on all stored bytes (None for no limit)
+            max_user: Limit on the uploader's stored bytes (None for no limit)
+
+        Raises:
+            QuotaExceeded: If either limit would be exceeded
+        """
+        try:
+            self._reserve_scope(TOTAL_SCOPE, size, max_total)
+            if username:
+                self._reserve_scope(username, size, max_user)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def release(self, size, username=None):
+        """
+        Give back a reservation.
+
+        The change is made on db.session and becomes durable with the caller's
+        commit, normally together with the row that now accounts for the bytes.
+
+        Args:
+            size: Number of bytes reserved
+            username: Uploader the reservation was made for
+        """
+        apply_usage(db.session, TOTAL_SCOPE, reserved=-size)
+        if username:
+            apply_usage(db.session, username, reserved=-size)
+
+    def get_usage(self, username=None):
+        """
+        Return the counters of the uploader, or the totals without one.
+
+        Args:
+            username: Uploader to report on
+
+        Returns:
+            StorageUsage row (unsaved and zeroed if nothing was stored yet)
+        """
+        scope = username or TOTAL_SCOPE
+        return StorageUsage.query.get(scope) or StorageUsage(scope=scope, used_bytes=0, reserved_bytes=0)
+
+    def get_all_usage(self):
+        """
+        Return the counter rows of every uploader, largest first.
+
+        Returns:
+            List of StorageUsage rows, excluding the totals row
+        """
+        return StorageUsage.query.filter(StorageUsage.scope != TOTAL_SCOPE)\
+            .order_by(StorageUsage.used_bytes.desc()).all()
+
+    def initialize(self):
+        """Build the counters once for a database that predates the ledger."""
+        if StorageUsage.query.get(TOTAL_SCOPE) is None:
+            self.reconcile()
+
+    def reconcile(self):
+        """
+        Rebuild every counter from the stored records.
+
+        Used bytes are summed from the files and videos tables and reserved
+        bytes from the open resumable upload sessions; reservations of direct
+        uploads that died mid-request are dropped.
+
+        Returns:
+            Dict of scope -> (used, reserved) before and after, for scopes that changed
+        """
+        before = {row.scope: (row.used_bytes, row.reserved_bytes) for row in StorageUsage.query.all()}
+        after = {TOTAL_SCOPE: [0, 0]}
+
+        def add(owner, used=0, reserved=0):
+            for scope in (TOTAL_SCOPE, owner) if owner else (TOTAL_SCOPE,):
+                counters = after.setdefault(scope, [0, 0])
+                counters[0] += used or 0
+                counters[1] += reserved or 0
+
+        for owner, total in db.session.query(File.uploaded_by, db.func.sum(File.size)).group_by(File.uploaded_by):
+            add(owner, used=total)
+        for owner, total in db.session.query(Video.uploaded_by, db.func.sum(Video.size_bytes)).group_by(Video.uploaded_by):
+            add(owner, used=total)
+        for owner, total in db.session.query(UploadSession.uploaded_by, db.func.sum(UploadSession.size_bytes))\
+                .group_by(UploadSession.uploaded_by):
+            add(owner, reserved=total)
+
+        StorageUsage.query.delete()
+        for scope, (used, reserved) in after.items():
+            db.session.add(StorageUsage(scope=scope, used_bytes=used, reserved_bytes=reserved))
+        db.session.commit()
+
+        changes = {}
+        for scope in set(before) | set(after):
+            old = before.get(scope, (0, 0))
+            new = tuple(after.get(scope, (0, 0)))
+            if old != new:
+                changes[scope] = (old, new)
+        return changes
+
+    def _reserve_scope(self, scope, size, limit):
+        # internal: add size to the scope's reservation if it stays within limit
+        apply_usage(db.session, scope)
+        table = StorageUsage.__table__
+        statement = table.update().where(table.c.scope == scope).values(
+            reserved_bytes=table.c.reserved_bytes + size
+        )
+        if limit is not None:
+            statement = statement.where(table.c.used_bytes + table.c.reserved_bytes + size <= limit)
+        if not db.session.execute(statement).rowcount:
+            raise QuotaExceeded("Not enough storage available")
+
+
+# Shared instance used by the upload paths
+usage_ledger = UsageLedger()
@@ -1,10 +1,34 @@
-import os, shutil
+import os, shutil, uuid, tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 from flask import current_app
 from werkzeug.datastructures import FileStorage
-from models.video_model import db, Video
+from models.video_model import db, Video, PROCESSING_PENDING, PROCESSING_RUNNING, PROCESSING_READY, \
+    PROCESSING_FAILED
+from models.upload_model import UploadSession, UploadChunk
+from services.media_cache import media_cache
+from services.upload_stream import stage_upload, staging_dir
+from services.blob_store import BlobStore, hash_file
+from services import mp4_faststart
+from services.mp4_index import build_keyframe_index
+from services import media_metadata
+from services.usage_ledger import usage_ledger
+from services.search_index import search_index
+from services.job_queue import job_queue
+
+# bytes copied per write while receiving an upload chunk
+CHUNK_COPY_SIZE = 64 * 1024
+# resumable sessions untouched for this long are discarded
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+# job kind of the post-upload processing of a video
+PROCESS_VIDEO_JOB = 'process_video'
+# videos read per batch by backfill_metadata
+METADATA_BATCH_SIZE = 100
 
 class VideoService:
-    def __init__(self, upload_folder: str, max_storage_bytes: int):
+    def __init__(self, upload_folder: str, max_storage_bytes: int, max_user_bytes: int = None,
+                 faststart: bool = True, job_queue=None):
         # Make sure we use an absolute path for uploads
         if not os.path.isabs(upload_folder):
             # Get the absolute path relative to the Python folder
@@ -13,68 +37,510 @@ class VideoService:
         else:
             self.upload_folder = upload_folder
         self.max_storage = max_storage_bytes
+        # per-uploader limit; None leaves only the total limit
+        self.max_user_storage = max_user_bytes or None
+        # move the MP4 index (moov) to the front of uploads so playback starts at once
+        self.faststart = faststart
+        # queue for post-upload processing; None processes inside the upload request
+        self.job_queue = job_queue
         os.makedirs(self.upload_folder, exist_ok=True)
+        self.blob_store = BlobStore(self.upload_folder)
 
     # upload_video parameters:
     # - file_stream: FileStorage object (Flask) for the uploaded file
-    # - filename: str, the object key (used both on disk and in DB)
+    # - filename: str, the object key stored in the DB (content is stored by digest)
     # - title: str, human-readable title stored in metadata
-    def upload_video(self, file_stream: FileStorage, filename: str, title: str):
+    # - uploaded_by: str or None, username the bytes count against
+    def upload_video(self, file_stream: FileStorage, filename: str, title: str, uploaded_by: str = None):
         """
         Uploads a video file and creates a metadata record in the database.
-        Handles disk space checks and file saving errors.
-        Raises IOError if not enough storage is available or file save fails.
+        Content identical to an already stored blob is not written again.
+        The bytes are stored as received; process_video runs afterwards,
+        on the job queue when there is one.
+        Reserves the size in the usage ledger before storing the blob.
+        Raises ValueError if a video with the same key exists, and IOError
+        if not enough storage is available or file save fails.
         """
         try:
-            # 1. Check disk space
-            free = shutil.disk_usage(self.upload_folder).free
-            file_stream.seek(0, os.SEEK_END)
-            size = file_stream.tell()
-            file_stream.seek(0)
-            if size > free or size + self._total_used() > self.max_storage:
-                raise IOError("Not enough storage available")
-
-            # 2. Save blob
-            dest = os.path.join(self.upload_folder, filename)
+            if Video.query.filter_by(key=filename).first():
+                raise ValueError("A video with this filename already exists")
+
+            # 1. Stage the body beside the blob store, sizing and hashing it in one pass
+            staged = stage_upload(file_stream, staging_dir(self.upload_folder))
+            size = staged.size
             try:
-                file_stream.save(dest)
-            except Exception as e:
-                raise IOError(f"Failed to save file: {e}")
+                self._reserve(size, uploaded_by)
+            except Exception:
+                staged.close()
+                raise
 
-            # 3. Create metadata record
-            video = Video(
-                key=filename,
-                title=title,
-                size_bytes=size,
-                mime_type=file_stream.mimetype
-            )
-            db.session.add(video)
-            db.session.commit()
+            try:
+                # 2. Store the blob, or reference the identical blob already stored
+                try:
+                    digest = self.blob_store.ingest_staged(staged)
+                except Exception as e:
+                    raise IOError(f"Failed to save file: {e}")
+
+                # 3. Create metadata record; the reservation turns into usage in the same commit
+                video = Video(
+                    key=filename,
+                    title=title,
+                    size_bytes=size,
+                    mime_type=file_stream.mimetype,
+                    uploaded_by=uploaded_by,
+                    blob_sha256=digest,
+                    processing_status=PROCESSING_PENDING
+                )
+                db.session.add(video)
+                self._queue_processing(video)
+                usage_ledger.release(size, uploaded_by)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                usage_ledger.release(size, uploaded_by)
+                db.session.commit()
+                raise
+            if self.job_queue is None:
+                self._process_now(video)
             return video
         except Exception as e:
             # Log or re-raise for test visibility
             print(f"VideoService.upload_video error: {e}")
             raise
 
+    # create_upload_session parameters:
+    # - filename: str, the object key the finished video will use
+    # - title: str, human-readable title stored in metadata
+    # - mime_type: str, MIME type of the video
+    # - size: int, total number of bytes the client will send
+    # - uploaded_by: str or None, username the bytes count against
+    def create_upload_session(self, filename: str, title: str, mime_type: str, size: int,
+                              uploaded_by: str = None):
+        """
+        Starts a resumable upload and preallocates its partial file.
+        The declared size stays reserved in the usage ledger until the
+        session is finalized, aborted or expires.
+        Raises ValueError for an invalid size or an existing key and
+        IOError if the declared size cannot fit in storage.
+        """
+        if size <= 0:
+            raise ValueError("Upload size must be positive")
+        if Video.query.filter_by(key=filename).first():
+            raise ValueError("A video with this filename already exists")
+        if size > shutil.disk_usage(self.upload_folder).free:
+            raise IOError("Not enough storage available")
+        self._expire_upload_sessions()
+        self._reserve(size, uploaded_by)
+
+        session = UploadSession(
+            id=uuid.uuid4().hex,
+            key=filename,
+            title=title,
+            mime_type=mime_type,
+            size_bytes=size,
+            uploaded_by=uploaded_by
+        )
+        try:
+            # A sparse file of the final size lets chunks land at any offset
+            with open(self._partial_path(session.id), 'wb') as f:
+                f.truncate(size)
+            db.session.add(session)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._remove_partial(session.id)
+            usage_ledger.release(size, uploaded_by)
+            db.session.commit()
+            raise
+        return session
+
+    # write_upload_chunk parameters:
+    # - upload_id: str, identifier returned by create_upload_session
+    # - offset: int, byte offset of the chunk within the upload
+    # - stream: file-like object the chunk body is read from
+    # - length: int, number of bytes in the chunk
+    def write_upload_chunk(self, upload_id: str, offset: int, stream, length: int):
+        """
+        Writes one chunk straight into the partial file at its offset.
+        Chunks may arrive in any order or in parallel; each one is recorded
+        only after all of its bytes are on disk.
+        Raises LookupError for an unknown session and ValueError for a
+        chunk outside the declared size.
+        """
+        session = self.get_upload_session(upload_id)
+        if offset < 0 or length < 0 or offset + length > session.size_bytes:
+            raise ValueError("Chunk lies outside the declared upload size")
+
+        fd = os.open(self._partial_path(upload_id), os.O_WRONLY)
+        try:
+            position, remaining = offset, length
+            while remaining:
+                data = stream.read(min(CHUNK_COPY_SIZE, remaining))
+                if not data:
+                    raise ValueError("Chunk body ended before its declared length")
+                written = os.pwrite(fd, data, position)
+                position += written
+                remaining -= written
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        if length:
+            db.session.add(UploadChunk(session_id=upload_id, offset=offset, length=length))
+            session.updated_at = datetime.utcnow()
+            db.session.commit()
+            db.session.refresh(session)
+        return session
+
+    # get_upload_session parameters:
+    # - upload_id: str, identifier returned by create_upload_session
+    def get_upload_session(self, upload_id: str):
+        """Returns the session or raises LookupError if it does not exist."""
+        session = UploadSession.query.get(upload_id)
+        if not session:
+            raise LookupError("Upload session not found")
+        return session
+
+    # finalize_upload parameters:
+    # - upload_id: str, identifier returned by create_upload_session
+    def finalize_upload(self, upload_id: str):
+        """
+        Completes a resumable upload: checks every byte arrived, moves the
+        partial file into place and creates the Video record, which takes
+        over the session's reservation.
+        Raises ValueError if bytes are missing or the key was taken
+        meanwhile. If the record cannot be committed, the partial file and
+        the session are left as they were, so finalizing can be retried.
+        """
+        session = self.get_upload_session(upload_id)
+        if session.received_ranges() != [(0, session.size_bytes)]:
+            raise ValueError("Upload is incomplete")
+        if Video.query.filter_by(key=session.key).first():
+            raise ValueError("A video with this filename already exists")
+
+        # The blob store consumes a second link to the partial file; the
+        # partial file itself goes only once the record is committed
+        partial = self._partial_path(upload_id)
+        ingested = partial + '.ingest'
+        self._link_or_copy(partial, ingested)
+        digest = None
+        try:
+            # Chunks arrived in any order, so the digest needs one pass over the file
+            digest = self.blob_store.ingest_path(ingested)
+
+            video = Video(
+                key=session.key,
+                title=session.title,
+                size_bytes=session.size_bytes,
+                mime_type=session.mime_type,
+                uploaded_by=session.uploaded_by,
+                blob_sha256=digest,
+                processing_status=PROCESSING_PENDING
+            )
+            db.session.add(video)
+            self._queue_processing(video)
+            db.session.delete(session)
+            usage_ledger.release(session.size_bytes, session.uploaded_by)
+            db.session.commit()
+        except Exception:
+            # The session keeps its reservation; a blob stored only for this upload is removed
+            db.session.rollback()
+            if os.path.exists(ingested):
+                os.remove(ingested)
+            if digest is not None:
+                self.blob_store.purge(digest)
+            raise
+        self._remove_partial(upload_id)
+        if self.job_queue is None:
+            self._process_now(video)
+        return video
+
+    # abort_upload parameters:
+    # - upload_id: str, identifier returned by create_upload_session
+    def abort_upload(self, upload_id: str):
+        """Discards a resumable upload and its partial file."""
+        session = self.get_upload_session(upload_id)
+        self._remove_partial(upload_id)
+        db.session.delete(session)
+        usage_ledger.release(session.size_bytes, session.uploaded_by)
+        db.session.commit()
+
+    # process_video parameters:
+    # - video: Video whose stored file is processed
+    def process_video(self, video: Video):
+        """
+        Runs the post-upload steps on a stored video: the MP4 faststart
+        rewrite, which replaces its blob, then metadata extraction and
+        keyframe indexing. Safe to repeat after a failure. Marks the video
+        ready and commits.
+        """
+        video.processing_status = PROCESSING_RUNNING
+        db.session.commit()
+        if video.blob_sha256:
+            self._rewrite_faststart(video)
+        self.extract_metadata(video)
+        self.index_keyframes(video)
+        video.processing_status = PROCESSING_READY
+        db.session.commit()
+
+    # index_keyframes parameters:
+    # - video: Video whose stored file is indexed
+    def index_keyframes(self, video: Video):
+        """
+        Builds the keyframe index of an MP4 video and sets it on the record
+        without committing. Videos that are not MP4 or cannot be parsed get
+        an empty index so they are not examined again.
+        Returns the KeyframeIndex, or None.
+        """
+        index = None
+        if video.mime_type in mp4_faststart.MP4_MIME_TYPES:
+            try:
+                index = build_keyframe_index(self.video_path(video))
+            except mp4_faststart.MP4Error as e:
+                print(f"VideoService keyframe index skipped: {e}")
+        video.keyframe_index = index.to_bytes() if index else b''
+        return index
+
+    # extract_metadata parameters:
+    # - video: Video whose stored file is examined
+    def extract_metadata(self, video: Video):
+        """
+        Reads duration, resolution, bitrate and codecs from the container
+        headers and sets them on the record without committing. Files that
+        are not MP4 or WebM, or cannot be parsed, get container 'unknown'
+        so they are not examined again.
+        Returns the metadata dictionary.
+        """
+        try:
+            metadata = media_metadata.extract_metadata(self.video_path(video))
+        except media_metadata.MediaMetadataError as e:
+            print(f"VideoService metadata extraction skipped: {e}")
+            metadata = media_metadata.empty_metadata('unknown')
+        for column, value in metadata.items():
+            setattr(video, column, value)
+        return metadata
+
+    # backfill_metadata parameters:
+    # - batch_size: int, videos read and updated per transaction
+    # - workers: int or None, processes parsing files (None: one per CPU, 0: parse in this process)
+    # - everything: bool, examine videos that already have metadata too
+    # - progress: optional callable taking the number of videos examined so far
+    def backfill_metadata(self, batch_size: int = METADATA_BATCH_SIZE, workers: int = None,
+                          everything: bool = False, progress=None):
+        """
+        Extracts the metadata of stored videos in batches, parsing the files
+        of each batch in parallel in a process pool and committing one bulk
+        update per batch, so an interrupted run keeps its finished batches.
+        Videos whose file cannot be read are left unexamined.
+        Returns (examined, unreadable) counts.
+        """
+        workers = (os.cpu_count() or 1) if workers is None else workers
+        # Spawned workers import only the parser, not this process's connections and threads
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) if workers else None
+        examined = unreadable = 0
+        last_id = 0
+        try:
+            while True:
+                query = db.session.query(Video.id, Video.key, Video.blob_sha256).filter(Video.id > last_id)
+                if not everything:
+                    query = query.filter(Video.container.is_(None))
+                rows = query.order_by(Video.id).limit(batch_size).all()
+                if not rows:
+                    break
+                paths = [self.video_path(row) for row in rows]
+                if pool:
+                    results = pool.map(media_metadata.probe, paths, chunksize=max(1, len(paths) // (workers * 4)))
+                else:
+                    results = map(media_metadata.probe, paths)
+                updates = []
+                for row, metadata in zip(rows, results):
+                    if metadata is None:
+                        unreadable += 1
+                    else:
+                        updates.append(dict(metadata, id=row.id))
+                db.session.bulk_update_mappings(Video, updates)
+                db.session.commit()
+                examined += len(rows)
+                last_id = rows[-1].id
+                if progress:
+                    progress(examined)
+        finally:
+            if pool:
+                pool.shutdown()
+        return examined, unreadable
+
+    # video_path parameters:
+    # - video: Video whose stored file is located
+    def video_path(self, video: Video):
+        """Returns the path of the stored file of a video."""
+        if video.blob_sha256:
+            return self.blob_store.path_for(video.blob_sha256)
+        # legacy videos are stored under their key
+        return os.path.join(self.upload_folder, video.key)
+
+    # delete_video parameters:
+    # - video_id: int, ID of the video to delete
+    def delete_video(self, video_id: int):
+        """
+        Deletes a video record and drops its blob reference; the blob file
+        is only removed when no other file or video still references it.
+        Returns False if the video does not exist.
+        """
+        video = Video.query.get(video_id)
+        if not video:
+            return False
+        digest = video.blob_sha256
+        if digest:
+            self.blob_store.release(digest)
+        db.session.delete(video)
+        db.session.commit()
+        if digest:
+            self.blob_store.purge(digest)
+        else:
+            legacy_path = self.video_path(video)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+        media_cache.invalidate_video(video_id)
+        return True
+
     # search_videos parameters:
-    # - search_term: str, substring to match against Video.title
+    # - search_term: str, words matched as prefixes of words in Video.title
     # - page: int, page number for pagination
+    # - per_page: int, number of results per page
     def search_videos(self, search_term: str, page: int = 1, per_page: int = 20):
-        '''TODO: add properly formatted python comments here'''
-        q = Video.query.filter(Video.title.ilike(f"%{search_term}%"))
-        return q.order_by(Video.uploaded_at.desc())\
-                .paginate(page=page, per_page=per_page)
+        """
+        Searches video titles through the full-text index.
+        Returns a Pagination of videos, best matches first.
+        """
+        return search_index.search_videos(search_term, page=page, per_page=per_page)
 
     # get_video parameters:
     # - key: str, the object key from the URL path
     def get_video(self, key: str):
         return Video.query.filter_by(key=key).first()
 
-    def _total_used(self):
-        # internal: sum of all stored file sizes
-        return db.session.query(db.func.sum(Video.size_bytes)).scalar() or 0
+    def _reserve(self, size, uploaded_by):
+        # internal: reserve size bytes against the total and the uploader's quota
+        usage_ledger.reserve(size, uploaded_by, max_total=self.max_storage,
+                             max_user=self.max_user_storage)
+
+    def _queue_processing(self, video):
+        # internal: enqueue processing of a new video in the transaction that stores it
+        if self.job_queue is not None:
+            db.session.flush()
+            self.job_queue.enqueue(PROCESS_VIDEO_JOB, video.id)
+
+    def _process_now(self, video):
+        # internal: process inside the request; the stored upload stands even if this fails
+        try:
+            self.process_video(video)
+        except Exception as e:
+            db.session.rollback()
+            print(f"VideoService.process_video error: {e}")
+            video.processing_status = PROCESSING_FAILED
+            db.session.commit()
+
+    def _rewrite_faststart(self, video):
+        # internal: swap the blob of an MP4 video for a copy with moov in front; True if swapped
+        if not self.faststart or video.mime_type not in mp4_faststart.MP4_MIME_TYPES:
+            return False
+        directory = staging_dir(self.upload_folder)
+        os.makedirs(directory, exist_ok=True)
+        fd, rewritten = tempfile.mkstemp(dir=directory, suffix='.faststart')
+        os.close(fd)
+        try:
+            try:
+                if not mp4_faststart.faststart(self.video_path(video), rewritten):
+                    return False
+            except mp4_faststart.MP4Error as e:
+                # A file the rewriter cannot handle is still a valid upload
+                print(f"VideoService faststart skipped: {e}")
+                return False
+            digest, size = hash_file(rewritten)
+            self.blob_store.ingest_path(rewritten, digest, size)
+        finally:
+            if os.path.exists(rewritten):
+                os.remove(rewritten)
+
+        old_digest = video.blob_sha256
+        self.blob_store.release(old_digest)
+        video.blob_sha256 = digest
+        # The size differs only if chunk offset tables had to be widened
+        video.size_bytes = size
+        db.session.commit()
+        # Still referenced if another video uploaded the same bytes
+        self.blob_store.purge(old_digest)
+        media_cache.invalidate_video(video.id)
+        return True
+
+    def _partial_path(self, upload_id):
+        # internal: location of the partial file of a resumable upload
+        partial_dir = os.path.join(self.upload_folder, '.partial')
+        os.makedirs(partial_dir, exist_ok=True)
+        return os.path.join(partial_dir, f"{upload_id}.part")
+
+    def _link_or_copy(self, source, target):
+        # internal: give a file a second name, copying where the filesystem has no hard links
+        if os.path.exists(target):
+            # Left behind by a finalize that died before ingesting
+            os.remove(target)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+    def _remove_partial(self, upload_id):
+        # internal: delete a partial file if it is still present
+        try:
+            os.remove(self._partial_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def _expire_upload_sessions(self):
+        # internal: drop resumable sessions abandoned for longer than the TTL
+        cutoff = datetime.utcnow() - UPLOAD_SESSION_TTL
+        for session in UploadSession.query.filter(UploadSession.updated_at < cutoff).all():
+            self._remove_partial(session.id)
+            db.session.delete(session)
+            usage_ledger.release(session.size_bytes, session.uploaded_by)
+        db.session.commit()
     
     def search_videos_by_title(search_term, page=1, per_page=20):
         query = Video.query.filter(Video.title.ilike(f"%{search_term}%"))
         return query.order_by(Video.uploaded_at.desc()) \
                 .paginate(page=page, per_page=per_page)
+
+
+def configured_video_service():
+    """
+    Build a VideoService from the current application's config.
+
+    Returns:
+        VideoService using the shared job queue when it has workers
+    """
+    config = current_app.config
+    return VideoService(
+        config.get('UPLOAD_FOLDER', 'uploads'),
+        config.get('MAX_STORAGE_BYTES', 100 * 1024 * 1024),
+        config.get('USER_QUOTA_BYTES'),
+        faststart=config.get('VIDEO_FASTSTART', True),
+        job_queue=job_queue if job_queue.workers > 0 else None
+    )
+
+
+def _process_video_job(job):
+    # Job handler; a video deleted since the upload needs no processing
+    video = Video.query.get(job.video_id)
+    if video is not None:
+        configured_video_service().process_video(video)
+
+
+def _mark_processing_failed(job):
+    # Job failure callback, run after the last attempt
+    video = Video.query.get(job.video_id)
+    if video is not None:
+        video.processing_status = PROCESSING_FAILED
+        db.session.commit()
+
+
+job_queue.register(PROCESS_VIDEO_JOB, _process_video_job, on_failure=_mark_processing_failed)
@@ -0,0 +1,191 @@
+"""
+WSGI Bridge Module
+
+Serves a WSGI application (the Flask app) from an ASGI server, so the ASGI
+media server can answer every route the Flask app has. Each request runs
+the WSGI application on a bounded thread pool, as a threaded WSGI server
+would. The request body is pulled from the ASGI server as the application
+reads it, so streamed uploads are not buffered, and each body chunk the
+application yields is sent before the next is produced.
+"""
+import sys
+import asyncio
+from services.async_stream import BlockingPool, encode_headers
+
+# Threads running WSGI requests, per process
+WSGI_THREADS = 8
+
+
+def build_environ(scope, body):
+    """
+    Build a WSGI environ for an ASGI HTTP scope.
+
+    Args:
+        scope: ASGI connection scope
+        body: File-like object the request body is read from
+
+    Returns:
+        WSGI environ dictionary
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI carries paths as latin-1 strings of the raw UTF-8 bytes
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0] or 'localhost',
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The body stream ends by itself, with or without a Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'] = client[0]
+        environ['REMOTE_PORT'] = str(client[1])
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        value = value.decode('latin-1')
+        if key in environ:
+            # Repeated headers are folded into one, as HTTP/1.1 servers do
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+class ReceiveStream:
+    """
+    Blocking file-like reader over ASGI ``http.request`` messages, used from a worker thread.
+    """
+
+    def __init__(self, receive, loop):
+        """
+        Initialize the stream.
+
+        Args:
+            receive: ASGI receive callable
+            loop: Event loop the receive callable belongs to
+        """
+        self._receive = receive
+        self._loop = loop
+        self._buffer = bytearray()
+        self._done = False
+
+    def read(self, size=-1):
+        """
+        Read up to ``size`` bytes, or the rest of the body when size is negative.
+
+        Returns:
+            Bytes read, empty at the end of the body
+        """
+        while not self._done and (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        return self._take(len(self._buffer) if size is None or size < 0 else size)
+
+    def readline(self, size=-1):
+        """
+        Read up to and including the next newline.
+
+        Returns:
+            Bytes read, empty at the end of the body
+        """
+        while not self._done and b'\n' not in self._buffer and \
+                (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        return self._take(end)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def _fill(self):
+        # internal: append the next body message, waiting on the event loop
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message['type'] == 'http.request':
+            self._buffer += message.get('body', b'')
+            self._done = not message.get('more_body', False)
+        else:
+            # http.disconnect: the body ends early and the application sees a short read
+            self._done = True
+
+    def _take(self, size):
+        # internal: remove and return the first size buffered bytes
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class WSGIBridge:
+    """
+    ASGI application that runs a WSGI application on a thread pool.
+    """
+
+    def __init__(self, wsgi_app, threads=WSGI_THREADS):
+        """
+        Initialize the bridge.
+
+        Args:
+            wsgi_app: WSGI application callable
+            threads: Maximum number of requests run at once
+        """
+        self.wsgi_app = wsgi_app
+        self.pool = BlockingPool(threads, name='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, ReceiveStream(receive, loop))
+        await self.pool.run(self._run, environ, send, loop)
+
+    def _run(self, environ, send, loop):
+        # internal: worker thread body, runs the application and relays its response
+        response = {}
+
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def start_sending():
+            if not response.get('sent'):
+                status, headers = response['start']
+                emit({
+                    'type': 'http.response.start',
+                    'status': int(status.split(' ', 1)[0]),
+                    'headers': encode_headers(headers)
+                })
+                response['sent'] = True
+
+        def write(data):
+            start_sending()
+            emit({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['start'] = (status, headers)
+            return write
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            for data in iterable:
+                if data:
+                    write(data)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        start_sending()
+        emit({'type': 'http.response.body', 'body': b''})
@@ -2,6 +2,8 @@
 let currentPage = 1;
 let totalPages = 1;
 const perPage = 20;
+// cursors[i] starts page i + 1; the list_all endpoint pages by cursor, not page number
+let cursors = [null];
 
 document.addEventListener('DOMContentLoaded', function() {
     // Check if user is logged in
@@ -24,6 +26,8 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Add event listener for refresh button
     document.getElementById('refresh-btn').addEventListener('click', function() {
+        currentPage = 1;
+        cursors = [null];
         loadFileList();
     });
 
@@ -35,7 +39,7 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     document.getElementById('next-page-btn').addEventListener('click', function() {
-        if (currentPage < totalPages) {
+        if (cursors[currentPage]) {
             currentPage++;
             loadFileList();
         }
@@ -84,7 +88,9 @@ function loadFileList() {
     // Show loading state
     fileList.innerHTML = 'Loading...';
     
-    fetch(`/api/videos/list_all?page=${currentPage}&per_page=${perPage}`, {
+    const cursor = cursors[currentPage - 1];
+    const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+    fetch(`/api/videos/list_all?per_page=${perPage}${cursorParam}`, {
         headers: {
             'Authorization': `Bearer ${token}`
         }
@@ -100,7 +106,8 @@ function loadFileList() {
         // Support both {items: [...]} and {videos: [...]} for compatibility
         if (Array.isArray(data.items)) {
             displayFiles(data.items);
-            updatePaginationControls(data.page, data.total_items);
+            cursors[currentPage] = data.next_cursor;
+            updatePaginationControls(currentPage, data.total_items, data.next_cursor);
         } else if (Array.isArray(data.videos)) {
             displayFiles(data.videos);
             updatePaginationControls(data.page, data.total_items);
@@ -117,14 +124,14 @@ function loadFileList() {
 /**
  * Update pagination controls
  */
-function updatePaginationControls(page, totalItems) {
+function updatePaginationControls(page, totalItems, nextCursor) {
     const pageIndicator = document.getElementById('page-indicator');
     const prevBtn = document.getElementById('prev-page-btn');
     const nextBtn = document.getElementById('next-page-btn');
-    totalPages = Math.ceil(totalItems / perPage) || 1;
+    totalPages = Math.max(Math.ceil(totalItems / perPage) || 1, page);
     pageIndicator.textContent = `Page ${page} of ${totalPages}`;
     prevBtn.disabled = page <= 1;
-    nextBtn.disabled = page >= totalPages;
+    nextBtn.disabled = !nextCursor;
 }
 
 /**
@@ -144,19 +151,24 @@ function searchFiles() {
         return;
     }
     
-    fetch(`/api/files/search?query=${encodeURIComponent(searchQuery)}`, {
-        headers: {
-            'Authorization': `Bearer ${token}`
-        }
-    })
-    .then(response => {
+    const query = encodeURIComponent(searchQuery);
+    const headers = {
+        'Authorization': `Bearer ${token}`
+    };
+    const fetchJson = url => fetch(url, { headers }).then(response => {
         if (!response.ok) {
             throw new Error(`HTTP error! Status: ${response.status}`);
         }
         return response.json();
-    })
-    .then(data => {
-        displayFiles(data.results);
+    });
+    
+    // Videos and files are indexed together but searched per kind
+    Promise.all([
+        fetchJson(`/api/videos/search?query=${query}&per_page=${perPage}`),
+        fetchJson(`/api/files/search?query=${query}&per_page=${perPage}`)
+    ])
+    .then(([videos, files]) => {
+        displayFiles(videos.items.concat(files.results));
     })
     .catch(error => {
         console.error('Error searching files:', error);
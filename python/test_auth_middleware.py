@@ -0,0 +1,65 @@
+'''
+Tests for the verified-token cache in AuthMiddleware.
+'''
+import time
+import unittest
+import jwt
+from flask import Flask, g, jsonify
+from auth.auth_middleware import AuthMiddleware
+from services.jwt_service import JWTService
+from services.cache import TTLCache
+
+class CountingJWTService(JWTService):
+    def __init__(self):
+        super().__init__(secret_key='test-secret')
+        self.verifications = 0
+
+    def verify_token(self, token):
+        self.verifications += 1
+        return super().verify_token(token)
+
+class AuthMiddlewareTestCase(unittest.TestCase):
+    def setUp(self):
+        self.jwt_service = CountingJWTService()
+        self.middleware = AuthMiddleware(self.jwt_service)
+        self.app = Flask(__name__)
+
+        @self.app.route('/me')
+        @self.middleware.authenticate_jwt
+        def me():
+            g.user['seen'] = True
+            return jsonify(g.user)
+
+        self.client = self.app.test_client()
+
+    def test_repeat_requests_skip_verification(self):
+        token = self.jwt_service.generate_token({'username': 'alice'})
+        for _ in range(3):
+            response = self.client.get('/me', headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.json['username'], 'alice')
+        self.assertEqual(self.jwt_service.verifications, 1)
+        stats = self.middleware.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        # Callers get copies; the cached payload is untouched
+        self.assertNotIn('seen', self.middleware.verify_token(token))
+
+    def test_invalid_tokens_are_not_cached(self):
+        forged = jwt.encode({'username': 'mallory', 'exp': time.time() + 60}, 'other-secret', algorithm='HS256')
+        for _ in range(2):
+            response = self.client.get('/me', headers={'Authorization': f'Bearer {forged}'})
+            self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.jwt_service.verifications, 2)
+        self.assertEqual(len(self.middleware.token_cache), 0)
+
+    def test_entries_expire_with_the_token(self):
+        now = [1000.0]
+        self.middleware = AuthMiddleware(self.jwt_service, TTLCache(maxsize=10, ttl=300, clock=lambda: now[0]))
+        token = jwt.encode({'username': 'alice', 'exp': int(time.time()) + 30}, 'test-secret', algorithm='HS256')
+        self.middleware.verify_token(token)
+        now[0] += 29
+        self.middleware.verify_token(token)
+        self.assertEqual(self.jwt_service.verifications, 1)
+        now[0] += 2
+        # The entry lapses at exp even though the cache TTL is longer
+        self.middleware.verify_token(token)
+        self.assertEqual(self.jwt_service.verifications, 2)
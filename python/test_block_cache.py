@@ -0,0 +1,110 @@
+'''
+Tests for the media head block cache and its use when streaming.
+'''
+import os
+import tempfile
+import unittest
+from flask import Flask
+from werkzeug.wsgi import FileWrapper
+from services.block_cache import BlockCache
+from services.media_stream import stream_file
+
+class BlockCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        self.data = os.urandom(10000)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.data)
+        self.fd = os.open(self.path, os.O_RDONLY)
+        self.cache = BlockCache(max_bytes=3000, block_size=1000, head_bytes=5000)
+
+    def tearDown(self):
+        os.close(self.fd)
+        os.remove(self.path)
+
+    def test_reads_stop_at_block_ends(self):
+        self.assertEqual(self.cache.read(self.fd, 'a', 1500, 5000), self.data[1500:2000])
+        self.assertEqual(self.cache.read(self.fd, 'a', 1600, 100), self.data[1600:1700])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(self.cache.stats()['hitRatio'], 0.5)
+
+    def test_least_recently_used_blocks_are_evicted(self):
+        for position in (0, 1000, 2000):
+            self.cache.read(self.fd, 'a', position, 1000)
+        self.cache.read(self.fd, 'a', 0, 1000)
+        self.cache.read(self.fd, 'a', 3000, 1000)
+        stats = self.cache.stats()
+        self.assertEqual((stats['bytes'], stats['blocks'], stats['evictions']), (3000, 3, 1))
+        # Block 1 was the least recently used
+        self.cache.read(self.fd, 'a', 1000, 1000)
+        self.assertEqual(self.cache.misses, 5)
+        self.cache.read(self.fd, 'a', 0, 1000)
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_only_the_head_is_cached(self):
+        self.assertTrue(self.cache.caches(4999))
+        self.assertFalse(self.cache.caches(5000))
+        self.cache.configure(max_bytes=0)
+        self.assertFalse(self.cache.caches(0))
+
+    def test_invalidate_and_reconfigure(self):
+        self.cache.read(self.fd, 'a', 0, 10)
+        self.cache.read(self.fd, 'b', 0, 10)
+        self.cache.invalidate('a')
+        self.assertEqual(self.cache.stats()['blocks'], 1)
+        self.cache.configure(block_size=500)
+        self.assertEqual(self.cache.stats()['bytes'], 0)
+
+class CachedStreamTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.mp4')
+        self.data = os.urandom(300000)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.data)
+        self.cache = BlockCache(max_bytes=10 ** 6, block_size=64 * 1024, head_bytes=128 * 1024)
+        self.app = Flask(__name__)
+
+        @self.app.route('/stream')
+        def stream():
+            stat = os.stat(self.path)
+            return stream_file(self.path, 'video/mp4', stat.st_size, stat.st_mtime, 'etag',
+                               block_cache=self.cache)
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_full_and_partial_responses(self):
+        self.assertEqual(self.client.get('/stream').data, self.data)
+        response = self.client.get('/stream', headers={'Range': 'bytes=0-65535'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, self.data[:65536])
+        response = self.client.get('/stream', headers={'Range': 'bytes=100000-131071'})
+        self.assertEqual(response.data, self.data[100000:131072])
+        # Ranges reaching past the head are sent from the file
+        response = self.client.get('/stream', headers={'Range': 'bytes=100000-200000'})
+        self.assertEqual(response.data, self.data[100000:200001])
+        self.assertEqual(self.cache.stats()['blocks'], 2)
+
+    def test_ranges_past_the_head_keep_the_file_wrapper(self):
+        for range_header in ('bytes=0-', 'bytes=4096-200000', None):
+            headers = {'Range': range_header} if range_header else {}
+            with self.app.test_request_context('/stream', headers=headers,
+                                               environ_overrides={'wsgi.file_wrapper': FileWrapper}):
+                response = self.app.view_functions['stream']()
+                self.assertIsInstance(response.response, FileWrapper)
+                response.close()
+        self.assertEqual(self.cache.stats()['blocks'], 0)
+
+    def test_hot_head_is_served_from_memory(self):
+        self.client.get('/stream', headers={'Range': 'bytes=0-1023'})
+        # Same ETag, different bytes on disk: only a cache hit still returns the old ones
+        with open(self.path, 'r+b') as f:
+            f.write(b'\x00' * 1024)
+        response = self.client.get('/stream', headers={'Range': 'bytes=0-1023'})
+        self.assertEqual(response.data, self.data[:1024])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+if __name__ == '__main__':
+    unittest.main()
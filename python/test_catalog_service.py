@@ -0,0 +1,112 @@
+'''
+Tests for the keyset-paginated file and video catalog.
+'''
+import unittest
+import json
+from datetime import datetime, timedelta
+from flask import Flask
+from models.video_model import db, Video
+from models.file_model import File
+from services.catalog_service import CatalogService, encode_cursor, decode_cursor, catalog_response
+
+class CatalogServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.service = CatalogService()
+
+        base = datetime(2024, 1, 1)
+        # Timestamps collide across and within tables to exercise the tie-breakers
+        for i in range(7):
+            db.session.add(Video(key=f'v{i}.mp4', title=f'V{i}', size_bytes=i, mime_type='video/mp4',
+                                 uploaded_at=base + timedelta(minutes=i // 2)))
+        for i in range(6):
+            db.session.add(File(key=f'f{i}', original_name=f'F{i}', filepath='x', size=i, uploaded_by='alice',
+                                uploaded_at=base + timedelta(minutes=i // 3)))
+        db.session.commit()
+        # Rows from before uploaded_at was recorded
+        db.session.execute(File.__table__.insert(), [
+            {'key': f'old{i}', 'original_name': f'Old{i}', 'filepath': 'x', 'uploaded_by': 'alice', 'uploaded_at': None}
+            for i in range(3)
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def expected_order(self):
+        rows = [(v.uploaded_at, 'video', v.id) for v in Video.query] + \
+               [(f.uploaded_at, 'file', f.id) for f in File.query]
+        dated = sorted((r for r in rows if r[0]), reverse=True)
+        undated = sorted((r for r in rows if not r[0]), reverse=True)
+        return [(kind, item_id) for _, kind, item_id in dated + undated]
+
+    def test_pages_walk_the_whole_catalog_in_order(self):
+        for limit in (1, 2, 5, 100):
+            seen, cursor = [], None
+            while True:
+                items, cursor = self.service.list_page(limit, cursor)
+                self.assertLessEqual(len(items), limit)
+                seen.extend((item['type'], item['id']) for item in items)
+                if cursor is None:
+                    break
+            self.assertEqual(seen, self.expected_order(), f'limit={limit}')
+
+    def test_cursor_round_trip(self):
+        items, _ = self.service.list_page(1)
+        uploaded_at, kind, item_id = decode_cursor(encode_cursor(items[0]))
+        self.assertEqual((kind, item_id), (items[0]['type'], items[0]['id']))
+        self.assertEqual(uploaded_at.isoformat(), items[0]['uploaded_at'])
+        for bad in ('', 'not-a-cursor', encode_cursor({'uploaded_at': None, 'type': 'user', 'id': 1})):
+            with self.assertRaises(ValueError):
+                decode_cursor(bad)
+
+    def test_counters_follow_orm_changes(self):
+        # The three undated files were inserted with raw SQL, bypassing the hooks
+        self.assertEqual(self.service.totals(), {'video': 7, 'file': 6})
+        changes = self.service.reconcile_counters()
+        self.assertEqual(changes[('file', 'all', '')], (6, 9))
+        self.assertEqual(self.service.totals(), {'video': 7, 'file': 9})
+
+        video = Video.query.filter_by(key='v0.mp4').first()
+        video.mime_type = 'audio/mpeg'
+        video.uploaded_by = 'bob'
+        db.session.delete(File.query.filter_by(key='f0').first())
+        db.session.commit()
+        stats = self.service.stats()
+        self.assertEqual(stats['video']['byMimeClass'], {'video': 6, 'audio': 1})
+        self.assertEqual(stats['video']['byUploader'], {'bob': 1})
+        self.assertEqual(stats['file']['total'], 8)
+        self.assertEqual(stats['file']['byUploader'], {'alice': 8})
+        self.assertEqual(self.service.reconcile_counters(), {})
+
+    def test_iter_items_in_batches(self):
+        batches = []
+        items = list(self.service.iter_items(kinds=('file',), batch_size=4,
+                                             between_batches=lambda: batches.append(1)))
+        expected = [entry for entry in self.expected_order() if entry[0] == 'file']
+        self.assertEqual([(item['type'], item['id']) for item in items], expected)
+        self.assertEqual(len(batches), 3)
+
+    def test_listing_modes(self):
+        @self.app.route('/videos')
+        def videos():
+            return catalog_response(('video',), 'videos')
+
+        client = self.app.test_client()
+        expected = [item_id for kind, item_id in self.expected_order() if kind == 'video']
+        self.assertEqual([v['id'] for v in client.get('/videos').json['videos']], expected)
+
+        page = client.get('/videos?per_page=3').json
+        self.assertEqual([v['id'] for v in page['videos']], expected[:3])
+        response = client.get(f"/videos?cursor={page['next_cursor']}", headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], expected[3:])
+        self.assertEqual(client.get('/videos?cursor=bogus').status_code, 400)
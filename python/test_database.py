@@ -0,0 +1,58 @@
+'''
+Tests for the SQLite pragma profile and background database maintenance.
+'''
+import os
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+from models.video_model import db, Video
+from models.database import engine_options, sqlite_pragmas, install_pragmas
+from services.db_maintenance import DatabaseMaintenance
+
+class SQLiteProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        uri = 'sqlite:///' + os.path.join(self.folder, 'media.db')
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = uri
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        install_pragmas(db.engine, sqlite_pragmas(busy_timeout=1234))
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.context.pop()
+        shutil.rmtree(self.folder)
+
+    def pragma(self, name):
+        with db.engine.connect() as connection:
+            return connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+    def test_connections_get_the_profile(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 1234)
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+    def test_rejects_values_that_are_not_words_or_numbers(self):
+        with self.assertRaises(ValueError):
+            install_pragmas(db.engine, sqlite_pragmas(journal_mode='WAL; DROP TABLE videos'))
+
+    def test_maintenance_checkpoints_the_wal(self):
+        db.session.add(Video(key='a.mp4', title='A', mime_type='video/mp4', size_bytes=1))
+        db.session.commit()
+        db.session.close()
+
+        maintenance = DatabaseMaintenance(interval=0)
+        result = maintenance.run_once()
+        self.assertEqual(result['busy'], 0)
+        self.assertEqual(result['checkpointedPages'], result['walPages'])
+        self.assertGreater(result['walPages'], 0)
+        self.assertEqual(maintenance.stats()['runs'], 1)
+        self.assertFalse(maintenance.stats()['running'])
@@ -0,0 +1,157 @@
+'''
+Tests for the background job queue and post-upload video processing.
+'''
+import io
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+from models.video_model import db, Video
+from models.job_model import Job, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED
+from services.job_queue import JobQueue, job_queue
+from services.video_service import VideoService, PROCESS_VIDEO_JOB
+from test_mp4_faststart import build_mp4
+
+class JobQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        # A file database, so worker threads share it
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.tmp, 'jobs.db')
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+        self.queue = JobQueue(workers=2, poll_interval=5, max_attempts=2, retry_delay=0)
+        self.ran = []
+        self.queue.register('record', lambda job: self.ran.append(job.video_id))
+
+    def tearDown(self):
+        self.queue.stop()
+        with self.app.app_context():
+            db.session.remove()
+            db.get_engine(self.app).dispose()
+        shutil.rmtree(self.tmp)
+
+    def test_jobs_run_by_priority_then_age(self):
+        with self.app.app_context():
+            self.queue.enqueue('record', video_id=1)
+            self.queue.enqueue('record', video_id=2, priority=5)
+            self.queue.enqueue('record', video_id=3)
+            db.session.commit()
+            while self.queue.run_next():
+                pass
+            self.assertEqual(self.ran, [2, 1, 3])
+            self.assertEqual(self.queue.counts(), {JOB_DONE: 3})
+
+    def test_failed_jobs_are_retried_then_fail(self):
+        failed = []
+
+        def flaky(job):
+            raise RuntimeError('boom')
+
+        self.queue.register('flaky', flaky, on_failure=lambda job: failed.append(job.id))
+        with self.app.app_context():
+            job = self.queue.enqueue('flaky')
+            db.session.commit()
+            job_id = job.id
+            self.assertEqual(self.queue.run_next().status, JOB_QUEUED)
+            self.assertEqual(self.queue.run_next().status, JOB_FAILED)
+            self.assertIsNone(self.queue.run_next())
+            job = Job.query.get(job_id)
+            self.assertEqual((job.attempts, job.last_error), (2, 'boom'))
+            self.assertEqual(failed, [job_id])
+
+    def test_retries_wait_for_their_delay(self):
+        self.queue.configure(retry_delay=60)
+        self.queue.register('flaky', lambda job: 1 / 0)
+        with self.app.app_context():
+            self.queue.enqueue('flaky')
+            db.session.commit()
+            self.queue.run_next()
+            self.assertIsNone(self.queue.run_next())
+            self.assertGreater(Job.query.first().run_after, datetime.utcnow() + timedelta(seconds=50))
+
+    def test_stale_running_jobs_are_requeued(self):
+        with self.app.app_context():
+            db.session.add(Job(kind='record', video_id=7, status=JOB_RUNNING,
+                               started_at=datetime.utcnow() - timedelta(hours=2)))
+            db.session.add(Job(kind='record', video_id=8, status=JOB_RUNNING, started_at=datetime.utcnow()))
+            db.session.commit()
+            self.assertEqual(self.queue.requeue_stale(), 1)
+            self.queue.run_next()
+            self.assertEqual(self.ran, [7])
+
+    def test_rolled_back_jobs_never_run(self):
+        with self.app.app_context():
+            self.queue.enqueue('record', video_id=1)
+            db.session.rollback()
+            self.assertIsNone(self.queue.run_next())
+
+    def test_worker_threads_wake_on_commit(self):
+        self.queue.start(self.app)
+        with self.app.app_context():
+            for i in range(4):
+                self.queue.enqueue('record', video_id=i)
+            db.session.commit()
+        deadline = time.time() + 3
+        while len(self.ran) < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        # Woken by the commit, well before the 5 second poll interval
+        self.assertEqual(sorted(self.ran), [0, 1, 2, 3])
+        self.assertTrue(self.queue.stats()['running'])
+
+    def test_unknown_kinds_are_refused(self):
+        with self.app.app_context():
+            with self.assertRaises(ValueError):
+                self.queue.enqueue('nope')
+
+class VideoProcessingJobTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+        self.source = build_mp4([os.urandom(3000), os.urandom(1000)])
+        self.service = VideoService(self.upload_dir, max_storage_bytes=10 ** 9, job_queue=job_queue)
+
+    def tearDown(self):
+        shutil.rmtree(self.upload_dir)
+
+    def test_upload_returns_before_processing(self):
+        with self.app.app_context():
+            upload = FileStorage(stream=io.BytesIO(self.source), filename='a.mp4', content_type='video/mp4')
+            video = self.service.upload_video(upload, 'a.mp4', 'A')
+            self.assertEqual(video.processing_status, 'pending')
+            self.assertIsNone(video.keyframe_index)
+            received = video.blob_sha256
+            job = Job.query.filter_by(video_id=video.id).one()
+            self.assertEqual((job.kind, job.status), (PROCESS_VIDEO_JOB, JOB_QUEUED))
+
+            self.assertEqual(job_queue.run_next().status, JOB_DONE)
+            video = Video.query.get(video.id)
+            self.assertEqual(video.processing_status, 'ready')
+            # The received blob was replaced by its faststart rewrite and removed
+            self.assertNotEqual(video.blob_sha256, received)
+            self.assertFalse(os.path.exists(self.service.blob_store.path_for(received)))
+            with open(self.service.video_path(video), 'rb') as f:
+                data = f.read()
+            self.assertLess(data.index(b'moov'), data.index(b'mdat'))
+
+    def test_videos_deleted_before_processing(self):
+        with self.app.app_context():
+            upload = FileStorage(stream=io.BytesIO(self.source), filename='b.mp4', content_type='video/mp4')
+            video = self.service.upload_video(upload, 'b.mp4', 'B')
+            self.service.delete_video(video.id)
+            self.assertEqual(job_queue.run_next().status, JOB_DONE)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+'''
+Tests for the TTL/LRU cache and the media descriptor cache.
+'''
+import unittest
+import tempfile
+import shutil
+import os
+from flask import Flask
+from models.video_model import db, Video
+from services.cache import TTLCache
+from services.media_cache import MediaCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TTLCacheTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=None)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expiry(self):
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+        cache.set('a', 1)
+        cache.set('b', 2, expires_at=100)
+        clock.now = 6
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+class MediaCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+        self.cache = MediaCache(maxsize=16, ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.upload_dir)
+
+    def test_video_descriptor_is_cached_and_invalidated(self):
+        with self.app.app_context():
+            with open(os.path.join(self.upload_dir, 'clip.mp4'), 'wb') as f:
+                f.write(b'\x00' * 2048)
+            video = Video(key='clip.mp4', title='Clip', size_bytes=2048, mime_type='video/mp4')
+            db.session.add(video)
+            db.session.commit()
+
+            media = self.cache.get_video(video.id)
+            self.assertEqual(media.size, 2048)
+            self.assertEqual(media.mimetype, 'video/mp4')
+            self.assertEqual(media.path, os.path.join(self.upload_dir, 'clip.mp4'))
+
+            # Served from the cache even once the row is gone
+            db.session.delete(video)
+            db.session.commit()
+            self.assertEqual(self.cache.get_video(video.id), media)
+
+            self.cache.invalidate_path(media.path)
+            self.assertIsNone(self.cache.get_video(video.id))
+
+    def test_missing_blob(self):
+        with self.app.app_context():
+            video = Video(key='gone.mp4', title='Gone', size_bytes=1, mime_type='video/mp4')
+            db.session.add(video)
+            db.session.commit()
+            with self.assertRaises(FileNotFoundError):
+                self.cache.get_video(video.id)
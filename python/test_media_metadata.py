@@ -0,0 +1,155 @@
+'''
+Tests for container metadata extraction and its backfill.
+'''
+import os
+import struct
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+from models.video_model import db, Video
+from services.catalog_service import catalog_service
+from services.media_metadata import MediaMetadataError, extract_metadata, probe
+from services.video_service import VideoService
+
+def box(box_type, payload):
+    '''Encode one box with a 32-bit size.'''
+    return struct.pack('>I4s', len(payload) + 8, box_type) + payload
+
+def track(handler, entry):
+    '''Encode a trak whose stsd holds one sample entry.'''
+    stsd = box(b'stsd', struct.pack('>II', 0, 1) + entry)
+    hdlr = box(b'hdlr', b'\x00' * 8 + handler + b'\x00' * 13)
+    return box(b'trak', box(b'mdia', hdlr + box(b'minf', box(b'stbl', stsd))))
+
+def build_mp4(timescale=1000, duration=12500, width=1280, height=720, version=0):
+    '''Build ftyp + moov + mdat with an H.264 video track and an AAC audio track.'''
+    if version == 1:
+        mvhd = box(b'mvhd', b'\x01\x00\x00\x00' + b'\x00' * 16 + struct.pack('>IQ', timescale, duration) + b'\x00' * 80)
+    else:
+        mvhd = box(b'mvhd', b'\x00' * 12 + struct.pack('>II', timescale, duration) + b'\x00' * 80)
+    # Visual sample entry: 8 bytes of reserved and reference index, 16 of predefined fields, then the size
+    avc1 = box(b'avc1', b'\x00' * 6 + b'\x00\x01' + b'\x00' * 16 + struct.pack('>HH', width, height) + b'\x00' * 50)
+    mp4a = box(b'mp4a', b'\x00' * 28)
+    moov = box(b'moov', mvhd + track(b'vide', avc1) + track(b'soun', mp4a))
+    return box(b'ftyp', b'isom\x00\x00\x02\x00isom') + moov + box(b'mdat', os.urandom(5000))
+
+def element(element_id, payload):
+    '''Encode one EBML element with an 8-byte size.'''
+    return element_id + b'\x01' + len(payload).to_bytes(7, 'big') + payload
+
+def build_webm(duration_ms=4500.0, width=640, height=360):
+    '''Build an EBML header and an open-ended Segment with Info, Tracks and one Cluster.'''
+    header = element(b'\x1a\x45\xdf\xa3', element(b'\x42\x82', b'webm'))
+    info = element(b'\x15\x49\xa9\x66',
+                   element(b'\x2a\xd7\xb1', (1000000).to_bytes(3, 'big')) +
+                   element(b'\x44\x89', struct.pack('>d', duration_ms)))
+    video = element(b'\xae', element(b'\x83', b'\x01') + element(b'\x86', b'V_VP9') +
+                    element(b'\xe0', element(b'\xb0', width.to_bytes(2, 'big')) +
+                            element(b'\xba', height.to_bytes(2, 'big'))))
+    audio = element(b'\xae', element(b'\x83', b'\x02') + element(b'\x86', b'A_OPUS'))
+    cluster = element(b'\x1f\x43\xb6\x75', os.urandom(3000))
+    # A Segment of unknown size, as written by live encoders
+    segment = b'\x18\x53\x80\x67' + b'\x01\xff\xff\xff\xff\xff\xff\xff' + info + \
+        element(b'\x16\x54\xae\x6b', video + audio) + cluster
+    return header + segment
+
+class MediaMetadataTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_mp4_metadata(self):
+        data = build_mp4()
+        metadata = extract_metadata(self.write('a.mp4', data))
+        self.assertEqual(metadata, {
+            'container': 'mp4', 'duration_seconds': 12.5, 'width': 1280, 'height': 720,
+            'bitrate': int(len(data) * 8 / 12.5), 'video_codec': 'h264', 'audio_codec': 'aac'
+        })
+
+    def test_mp4_version_1_header(self):
+        metadata = extract_metadata(self.write('b.mp4', build_mp4(timescale=90000, duration=900000, version=1)))
+        self.assertEqual((metadata['duration_seconds'], metadata['width']), (10.0, 1280))
+
+    def test_webm_metadata(self):
+        data = build_webm()
+        metadata = extract_metadata(self.write('c.webm', data))
+        self.assertEqual(metadata, {
+            'container': 'webm', 'duration_seconds': 4.5, 'width': 640, 'height': 360,
+            'bitrate': int(len(data) * 8 / 4.5), 'video_codec': 'vp9', 'audio_codec': 'opus'
+        })
+
+    def test_unrecognized_files(self):
+        path = self.write('d.bin', os.urandom(100))
+        with self.assertRaises(MediaMetadataError):
+            extract_metadata(path)
+        self.assertEqual(probe(path)['container'], 'unknown')
+        self.assertIsNone(probe(os.path.join(self.tmp, 'missing.mp4')))
+
+    def test_truncated_webm(self):
+        path = self.write('e.webm', build_webm()[:60])
+        self.assertEqual(probe(path)['container'], 'unknown')
+
+class MetadataBackfillTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        self.service = VideoService(self.upload_dir, max_storage_bytes=10 ** 9)
+        with self.app.app_context():
+            db.create_all()
+            # Legacy videos stored under their key, examined before metadata existed
+            for key, data in (('a.mp4', build_mp4()), ('b.webm', build_webm()), ('c.bin', b'junk' * 10)):
+                with open(os.path.join(self.upload_dir, key), 'wb') as f:
+                    f.write(data)
+                db.session.add(Video(key=key, title=key, size_bytes=len(data), mime_type='video/mp4'))
+            db.session.add(Video(key='gone.mp4', title='gone', size_bytes=1, mime_type='video/mp4'))
+            db.session.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.upload_dir)
+
+    def backfill(self, **kwargs):
+        with self.app.app_context():
+            result = self.service.backfill_metadata(**kwargs)
+            rows = {v.key: (v.container, v.height, v.video_codec) for v in Video.query}
+            return result, rows
+
+    def test_backfill_in_batches(self):
+        seen = []
+        result, rows = self.backfill(batch_size=3, workers=0, progress=seen.append)
+        self.assertEqual(result, (4, 1))
+        self.assertEqual(seen, [3, 4])
+        self.assertEqual(rows, {
+            'a.mp4': ('mp4', 720, 'h264'), 'b.webm': ('webm', 360, 'vp9'),
+            'c.bin': ('unknown', None, None), 'gone.mp4': (None, None, None)
+        })
+        # Only the unreadable video is examined again
+        self.assertEqual(self.backfill(workers=0)[0], (1, 1))
+        self.assertEqual(self.backfill(workers=0, everything=True)[0], (4, 1))
+
+    def test_backfill_with_process_pool(self):
+        result, rows = self.backfill(batch_size=2, workers=2)
+        self.assertEqual(result, (4, 1))
+        self.assertEqual(rows['b.webm'], ('webm', 360, 'vp9'))
+
+    def test_listing_carries_metadata(self):
+        self.backfill(workers=0)
+        with self.app.app_context():
+            items, _ = catalog_service.list_page(kinds=('video',))
+        item = next(item for item in items if item['filename'] == 'a.mp4')
+        self.assertEqual((item['duration'], item['width'], item['height'], item['videoCodec']),
+                         (12.5, 1280, 720, 'h264'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+'''
+Tests for the ASGI media server and its WSGI bridge.
+'''
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+import unittest
+from flask import Flask, request
+from models.video_model import db, Video
+from services.media_cache import media_cache
+from services.media_server import MediaServer
+
+def call(server, method, path, headers=(), body=b''):
+    '''Run one request through an ASGI app and collect the response.'''
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'http_version': '1.1',
+        'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000), 'root_path': '',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+    messages = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                {'type': 'http.request', 'body': body[3:], 'more_body': False}]
+    response = {'headers': {}, 'body': b''}
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {k.decode(): v.decode() for k, v in message['headers']}
+        else:
+            response['body'] += message.get('body', b'')
+
+    asyncio.run(server(scope, receive, send))
+    return response
+
+class MediaServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        db.init_app(self.app)
+
+        @self.app.route('/echo', methods=['POST'])
+        def echo():
+            return {'length': len(request.get_data()), 'query': request.args.get('q')}
+
+        self.content = os.urandom(200000)
+        with open(os.path.join(self.upload_dir, 'clip.mp4'), 'wb') as f:
+            f.write(self.content)
+        with self.app.app_context():
+            db.create_all()
+            video = Video(key='clip.mp4', title='Clip', size_bytes=len(self.content), mime_type='video/mp4')
+            db.session.add(video)
+            db.session.commit()
+            self.video_id = video.id
+        media_cache.clear()
+        self.server = MediaServer(self.app)
+
+    def tearDown(self):
+        media_cache.clear()
+        shutil.rmtree(self.upload_dir)
+
+    def test_streams_whole_video(self):
+        response = call(self.server, 'GET', f'/api/videos/stream/{self.video_id}')
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(response['headers']['content-length'], str(len(self.content)))
+        self.assertEqual(response['headers']['content-type'], 'video/mp4')
+        self.assertEqual(response['body'], self.content)
+
+    def test_range_and_conditional_requests(self):
+        path = f'/api/videos/stream/{self.video_id}'
+        response = call(self.server, 'GET', path, [('Range', 'bytes=100000-100009')])
+        self.assertEqual(response['status'], 206)
+        self.assertEqual(response['headers']['content-range'], f'bytes 100000-100009/{len(self.content)}')
+        self.assertEqual(response['body'], self.content[100000:100010])
+
+        etag = response['headers']['etag']
+        self.assertEqual(call(self.server, 'GET', path, [('If-None-Match', etag)])['status'], 304)
+
+        response = call(self.server, 'GET', path, [('Range', 'bytes=0-1,10-11')])
+        self.assertEqual(response['status'], 206)
+        self.assertIn(b'Content-Range: bytes 10-11/', response['body'])
+        self.assertEqual(int(response['headers']['content-length']), len(response['body']))
+
+        response = call(self.server, 'HEAD', path)
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(response['body'], b'')
+
+    def test_errors_match_the_flask_routes(self):
+        response = call(self.server, 'GET', '/api/videos/stream/999')
+        self.assertEqual(response['status'], 404)
+        self.assertEqual(json.loads(response['body']), {'error': 'Video not found'})
+
+        response = call(self.server, 'GET', '/api/files/1')
+        self.assertEqual(response['status'], 401)
+        self.assertEqual(json.loads(response['body']), {'error': 'No token provided'})
+
+        os.remove(os.path.join(self.upload_dir, 'clip.mp4'))
+        response = call(self.server, 'GET', f'/api/videos/stream/{self.video_id}')
+        self.assertEqual(response['status'], 404)
+
+    def test_other_routes_run_in_flask(self):
+        body = b'x' * 10000
+        response = call(self.server, 'POST', '/echo', [('Content-Length', str(len(body)))], body)
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(json.loads(response['body']), {'length': 10000, 'query': None})
+        self.assertEqual(call(self.server, 'GET', '/missing')['status'], 404)
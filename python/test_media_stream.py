@@ -0,0 +1,100 @@
+'''
+Tests for the byte range streaming engine.
+'''
+import unittest
+import tempfile
+import os
+from flask import Flask
+from services.media_stream import RangeFile, RangeNotSatisfiable, parse_byte_ranges, stream_file
+
+class MediaStreamTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.mp4')
+        self.data = bytes(range(256)) * 1024  # 256KB
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.data)
+        self.app = Flask(__name__)
+
+        @self.app.route('/stream')
+        def stream():
+            return stream_file(self.path, 'video/mp4')
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_parse_byte_ranges(self):
+        self.assertEqual(parse_byte_ranges('bytes=0-', 1000), [(0, 999)])
+        self.assertEqual(parse_byte_ranges('bytes=10-19', 1000), [(10, 19)])
+        self.assertEqual(parse_byte_ranges('bytes=990-5000', 1000), [(990, 999)])
+        self.assertEqual(parse_byte_ranges('bytes=-100', 1000), [(900, 999)])
+        self.assertEqual(parse_byte_ranges('bytes=-5000', 1000), [(0, 999)])
+        self.assertEqual(parse_byte_ranges('bytes=500-599, 0-9', 1000), [(0, 9), (500, 599)])
+        self.assertEqual(parse_byte_ranges('bytes=0-9,5-20,21-30', 1000), [(0, 30)])
+        self.assertEqual(parse_byte_ranges('bytes=0-9,2000-', 1000), [(0, 9)])
+        self.assertIsNone(parse_byte_ranges('bytes=20-10', 1000))
+        self.assertIsNone(parse_byte_ranges('items=0-10', 1000))
+        self.assertIsNone(parse_byte_ranges(None, 1000))
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_byte_ranges('bytes=1000-', 1000)
+
+    def test_range_file_is_bounded(self):
+        reader = RangeFile(self.path, 100, 50)
+        try:
+            self.assertEqual(os.lseek(reader.fileno(), 0, os.SEEK_CUR), 100)
+            self.assertEqual(reader.read(30), self.data[100:130])
+            self.assertEqual(reader.read(), self.data[130:150])
+            self.assertEqual(reader.read(), b'')
+        finally:
+            reader.close()
+
+    def test_full_response(self):
+        response = self.client.get('/stream')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Length'], str(len(self.data)))
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(response.data, self.data)
+
+    def test_partial_response(self):
+        response = self.client.get('/stream', headers={'Range': 'bytes=1000-'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], f'bytes 1000-{len(self.data) - 1}/{len(self.data)}')
+        self.assertEqual(response.data, self.data[1000:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get('/stream', headers={'Range': f'bytes={len(self.data)}-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_multiple_ranges(self):
+        response = self.client.get('/stream', headers={'Range': 'bytes=0-9,100-199'})
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.content_type.startswith('multipart/byteranges; boundary='))
+        self.assertEqual(response.headers['Content-Length'], str(len(response.data)))
+        boundary = response.content_type.split('boundary=')[1]
+        parts = response.data.split(f'--{boundary}'.encode())
+        self.assertEqual(len(parts), 4)
+        self.assertIn(f'Content-Range: bytes 100-199/{len(self.data)}'.encode(), parts[2])
+        self.assertTrue(parts[1].endswith(b'\r\n\r\n' + self.data[0:10] + b'\r\n'))
+        self.assertTrue(parts[2].endswith(self.data[100:200] + b'\r\n'))
+        self.assertEqual(parts[3], b'--\r\n')
+
+    def test_conditional_get(self):
+        etag = self.client.get('/stream').headers['ETag']
+        last_modified = self.client.get('/stream').headers['Last-Modified']
+        response = self.client.get('/stream', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        response = self.client.get('/stream', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/stream', headers={'If-None-Match': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_range(self):
+        etag = self.client.get('/stream').headers['ETag']
+        response = self.client.get('/stream', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get('/stream', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.data)
@@ -0,0 +1,195 @@
+'''
+Tests for the MP4 faststart rewriter and its use on upload.
+'''
+import io
+import os
+import struct
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+from models.video_model import db, Video
+from services.mp4_faststart import MP4Error, faststart, needs_faststart, read_boxes
+from services.video_service import VideoService
+
+def box(box_type, payload):
+    '''Encode one box with a 32-bit size.'''
+    return struct.pack('>I4s', len(payload) + 8, box_type) + payload
+
+def offset_table(box_type, offsets):
+    '''Encode a stco or co64 box.'''
+    fmt = 'Q' if box_type == b'co64' else 'I'
+    return box(box_type, struct.pack(f'>II{len(offsets)}{fmt}', 0, len(offsets), *offsets))
+
+def build_mp4(chunks, table_type=b'stco', moov_first=False):
+    '''Build ftyp + mdat + moov with one track whose chunk offsets point into mdat.'''
+    ftyp = box(b'ftyp', b'isom\x00\x00\x02\x00isomiso2mp41')
+    mdat_payload = b''.join(chunks)
+
+    def moov(mdat_start):
+        offsets, position = [], mdat_start + 8
+        for chunk in chunks:
+            offsets.append(position)
+            position += len(chunk)
+        stbl = box(b'stbl', box(b'stsd', b'\x00' * 8) + offset_table(table_type, offsets))
+        trak = box(b'trak', box(b'tkhd', b'\x00' * 84) + box(b'mdia', box(b'minf', stbl)))
+        return box(b'moov', box(b'mvhd', b'\x00' * 100) + trak)
+
+    if moov_first:
+        size = len(moov(0))
+        return ftyp + moov(len(ftyp) + size) + box(b'mdat', mdat_payload)
+    return ftyp + box(b'mdat', mdat_payload) + moov(len(ftyp))
+
+def chunk_offsets(data):
+    '''Return the chunk offsets of the first stco/co64 box in a file.'''
+    for box_type, width in ((b'stco', 'I'), (b'co64', 'Q')):
+        at = data.find(box_type)
+        if at != -1:
+            count = struct.unpack_from('>I', data, at + 8)[0]
+            return box_type, list(struct.unpack_from(f'>{count}{width}', data, at + 12))
+    return None, []
+
+class FaststartTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.chunks = [os.urandom(3000), os.urandom(5000), os.urandom(100)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def rewrite(self, data):
+        src = self.write('in.mp4', data)
+        dst = os.path.join(self.tmp, 'out.mp4')
+        self.assertTrue(faststart(src, dst, block_size=1000))
+        with open(dst, 'rb') as f:
+            return f.read()
+
+    def assert_chunks_intact(self, data):
+        _, offsets = chunk_offsets(data)
+        self.assertEqual([data[o:o + len(c)] for o, c in zip(offsets, self.chunks)], self.chunks)
+
+    def test_moves_moov_before_mdat(self):
+        source = build_mp4(self.chunks)
+        self.assert_chunks_intact(source)
+        self.assertTrue(needs_faststart(self.write('in.mp4', source)))
+
+        out = self.rewrite(source)
+        with open(os.path.join(self.tmp, 'out.mp4'), 'rb') as f:
+            types = [b.type for b in read_boxes(f, 0, len(out))]
+        self.assertEqual(types, [b'ftyp', b'moov', b'mdat'])
+        self.assertEqual(len(out), len(source))
+        self.assert_chunks_intact(out)
+        self.assertFalse(needs_faststart(os.path.join(self.tmp, 'out.mp4')))
+
+    def test_co64_offsets_are_patched(self):
+        out = self.rewrite(build_mp4(self.chunks, table_type=b'co64'))
+        self.assertEqual(chunk_offsets(out)[0], b'co64')
+        self.assert_chunks_intact(out)
+
+    def test_stco_widened_when_offsets_overflow(self):
+        # Offsets near 4 GiB cannot be materialized, so check the table rewrite directly
+        from services.mp4_faststart import parse_children, _relocate
+        stbl = box(b'stbl', offset_table(b'stco', [100, 0xFFFFFFE0]))
+        moov = parse_children(box(b'trak', box(b'mdia', box(b'minf', stbl))))
+        relocated = _relocate(moov, 50, 0xFFFFFFF0, len(stbl) + 32)
+        box_type, offsets = chunk_offsets(relocated)
+        self.assertEqual(box_type, b'co64')
+        self.assertEqual(offsets, [100 + len(relocated), 0xFFFFFFE0 + len(relocated)])
+
+    def test_media_after_moov_moves_by_the_change_in_moov_size(self):
+        # ftyp + mdat + moov + mdat, with moov written with a 64-bit size header
+        # that the rewrite shrinks to 32 bits, so the trailing mdat moves back 8 bytes
+        ftyp = box(b'ftyp', b'isom\x00\x00\x02\x00isomiso2mp41')
+        head, tail = self.chunks[:2], self.chunks[2:]
+        first_mdat = box(b'mdat', b''.join(head))
+
+        def moov(tail_start):
+            offsets, position = [], len(ftyp) + 8
+            for chunk in head:
+                offsets.append(position)
+                position += len(chunk)
+            offsets.append(tail_start + 8)
+            stbl = box(b'stbl', box(b'stsd', b'\x00' * 8) + offset_table(b'stco', offsets))
+            payload = box(b'mvhd', b'\x00' * 100) + box(b'trak', box(b'mdia', box(b'minf', stbl)))
+            return struct.pack('>I4sQ', 1, b'moov', len(payload) + 16) + payload
+
+        moov_size = len(moov(0))
+        source = ftyp + first_mdat + moov(len(ftyp) + len(first_mdat) + moov_size) + box(b'mdat', b''.join(tail))
+        self.assert_chunks_intact(source)
+        out = self.rewrite(source)
+        self.assertEqual(len(out), len(source) - 8)
+        self.assert_chunks_intact(out)
+
+    def test_files_already_faststart_are_left_alone(self):
+        src = self.write('in.mp4', build_mp4(self.chunks, moov_first=True))
+        self.assertFalse(faststart(src, os.path.join(self.tmp, 'out.mp4')))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'out.mp4')))
+
+    def test_malformed_files_raise(self):
+        src = self.write('in.mp4', build_mp4(self.chunks)[:-10])
+        with self.assertRaises(MP4Error):
+            faststart(src, os.path.join(self.tmp, 'out.mp4'))
+        self.assertFalse(needs_faststart(src))
+
+class FaststartUploadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+        self.chunks = [os.urandom(4000), os.urandom(2000)]
+        self.source = build_mp4(self.chunks)
+
+    def tearDown(self):
+        shutil.rmtree(self.upload_dir)
+
+    def stored(self, service, video):
+        with open(service.blob_store.path_for(video.blob_sha256), 'rb') as f:
+            return f.read()
+
+    def test_upload_is_stored_faststart(self):
+        service = VideoService(self.upload_dir, max_storage_bytes=10 ** 9)
+        with self.app.app_context():
+            upload = FileStorage(stream=io.BytesIO(self.source), filename='a.mp4', content_type='video/mp4')
+            video = service.upload_video(upload, 'a.mp4', 'A')
+            data = self.stored(service, video)
+            self.assertEqual(data[28:36], struct.pack('>I', data.index(b'mdat') - 32) + b'moov')
+            self.assertEqual(video.size_bytes, len(data))
+            _, offsets = chunk_offsets(data)
+            self.assertEqual(data[offsets[1]:offsets[1] + 2000], self.chunks[1])
+        self.assertEqual(os.listdir(os.path.join(self.upload_dir, '.incoming')), [])
+
+    def test_resumable_upload_is_stored_faststart(self):
+        service = VideoService(self.upload_dir, max_storage_bytes=10 ** 9)
+        with self.app.app_context():
+            session = service.create_upload_session('b.mp4', 'B', 'video/mp4', len(self.source))
+            service.write_upload_chunk(session.id, 0, io.BytesIO(self.source), len(self.source))
+            video = service.finalize_upload(session.id)
+            data = self.stored(service, video)
+            self.assertLess(data.index(b'moov'), data.index(b'mdat'))
+            _, offsets = chunk_offsets(data)
+            self.assertEqual(data[offsets[0]:offsets[0] + 4000], self.chunks[0])
+
+    def test_disabled_or_unparsable_uploads_are_stored_as_received(self):
+        service = VideoService(self.upload_dir, max_storage_bytes=10 ** 9, faststart=False)
+        with self.app.app_context():
+            upload = FileStorage(stream=io.BytesIO(self.source), filename='c.mp4', content_type='video/mp4')
+            self.assertEqual(self.stored(service, service.upload_video(upload, 'c.mp4', 'C')), self.source)
+
+            service.faststart = True
+            junk = os.urandom(5000)
+            upload = FileStorage(stream=io.BytesIO(junk), filename='d.mp4', content_type='video/mp4')
+            self.assertEqual(self.stored(service, service.upload_video(upload, 'd.mp4', 'D')), junk)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+'''
+Tests for the MP4 keyframe index and the keyframes endpoint.
+'''
+import io
+import os
+import struct
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+from models.video_model import db, Video
+from controllers.video_controller import video_bp
+from services.media_cache import media_cache
+from services.mp4_faststart import MP4Error
+from services.mp4_index import KeyframeIndex, build_keyframe_index
+from services.video_service import VideoService
+
+def box(box_type, payload):
+    '''Encode one box with a 32-bit size.'''
+    return struct.pack('>I4s', len(payload) + 8, box_type) + payload
+
+def full_box(box_type, fmt, *values):
+    '''Encode a full box (version 0) whose body is a count followed by entries.'''
+    return box(box_type, b'\x00' * 4 + struct.pack('>' + fmt, *values))
+
+def build_mp4(sample_sizes, sync, samples_per_chunk=3, delta=100, timescale=1000):
+    '''
+    Build ftyp + moov + mdat with an audio track and a video track.
+
+    Returns the file bytes and the offset of every video sample.
+    '''
+    ftyp = box(b'ftyp', b'isom\x00\x00\x02\x00isom')
+    samples = [os.urandom(size) for size in sample_sizes]
+    chunks = [samples[i:i + samples_per_chunk] for i in range(0, len(samples), samples_per_chunk)]
+
+    def moov(mdat_start):
+        offsets, position = [], mdat_start + 8
+        for chunk in chunks:
+            offsets.append(position)
+            position += sum(len(s) for s in chunk)
+        n = len(samples)
+        stbl = box(b'stbl',
+                   full_box(b'stts', 'III', 1, n, delta) +
+                   full_box(b'stss', f'I{len(sync)}I', len(sync), *sync) +
+                   full_box(b'stsc', 'IIII', 1, 1, samples_per_chunk, 1) +
+                   full_box(b'stsz', f'II{n}I', 0, n, *sample_sizes) +
+                   full_box(b'stco', f'I{len(offsets)}I', len(offsets), *offsets))
+        mdhd = box(b'mdhd', b'\x00' * 12 + struct.pack('>II', timescale, n * delta) + b'\x00' * 4)
+        video = box(b'trak', box(b'mdia', mdhd + box(b'hdlr', b'\x00' * 8 + b'vide' + b'\x00' * 13) +
+                                 box(b'minf', stbl)))
+        audio = box(b'trak', box(b'mdia', mdhd + box(b'hdlr', b'\x00' * 8 + b'soun' + b'\x00' * 13)))
+        return box(b'moov', audio + video)
+
+    header = ftyp + moov(len(ftyp) + len(moov(0)))
+    data = header + box(b'mdat', b''.join(samples))
+    sample_offsets, position = [], len(header) + 8
+    for sample in samples:
+        sample_offsets.append(position)
+        position += len(sample)
+    return data, sample_offsets
+
+class KeyframeIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.sizes = [500, 120, 130, 140, 480, 110, 90, 95, 510, 100]
+        self.data, self.sample_offsets = build_mp4(self.sizes, [1, 5, 9])
+        self.path = os.path.join(self.tmp, 'clip.mp4')
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_indexes_sync_samples_of_video_track(self):
+        index = build_keyframe_index(self.path)
+        self.assertEqual(index.timescale, 1000)
+        self.assertEqual(list(index.times), [0, 400, 800])
+        self.assertEqual(list(index.offsets), [self.sample_offsets[i] for i in (0, 4, 8)])
+        self.assertEqual(index.to_list(), [[0.0, self.sample_offsets[0]], [0.4, self.sample_offsets[4]],
+                                           [0.8, self.sample_offsets[8]]])
+
+    def test_find_and_byte_range(self):
+        index = build_keyframe_index(self.path)
+        self.assertEqual(index.find(0.55), 1)
+        self.assertEqual(index.find(-3), 0)
+        self.assertEqual(index.find(99), 2)
+        self.assertEqual(index.byte_range(1, len(self.data)),
+                         (self.sample_offsets[4], self.sample_offsets[8] - 1))
+        self.assertEqual(index.byte_range(2, len(self.data)), (self.sample_offsets[8], len(self.data) - 1))
+
+    def test_serialization_round_trip(self):
+        index = build_keyframe_index(self.path)
+        data = index.to_bytes()
+        self.assertEqual(len(data), 12 + 16 * 3)
+        loaded = KeyframeIndex.from_bytes(data)
+        self.assertEqual((loaded.timescale, list(loaded.times), list(loaded.offsets)),
+                         (index.timescale, list(index.times), list(index.offsets)))
+        with self.assertRaises(ValueError):
+            KeyframeIndex.from_bytes(data[:-1])
+
+    def test_files_without_video_track(self):
+        with open(self.path, 'wb') as f:
+            f.write(box(b'ftyp', b'isom') + box(b'mdat', b'x' * 10))
+        self.assertIsNone(build_keyframe_index(self.path))
+
+    def test_oversized_sample_counts_are_refused(self):
+        # A uniform sample size makes the count the only bound on the arrays built
+        stsz = self.data.index(b'stsz') + 8
+        for count in (0xFFFFFFFF, 100000):
+            with open(self.path, 'wb') as f:
+                f.write(self.data[:stsz] + struct.pack('>II', 100, count) + self.data[stsz + 8:])
+            with self.assertRaises(MP4Error):
+                build_keyframe_index(self.path)
+
+class KeyframeEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        db.init_app(self.app)
+        self.app.register_blueprint(video_bp, url_prefix='/api/videos')
+        self.client = self.app.test_client()
+        media_cache.clear()
+        with self.app.app_context():
+            db.create_all()
+        self.data, self.sample_offsets = build_mp4([300] * 12, [1, 4, 7, 10])
+
+    def tearDown(self):
+        media_cache.clear()
+        shutil.rmtree(self.upload_dir)
+
+    def upload(self):
+        service = VideoService(self.upload_dir, max_storage_bytes=10 ** 9)
+        with self.app.app_context():
+            upload = FileStorage(stream=io.BytesIO(self.data), filename='k.mp4', content_type='video/mp4')
+            video = service.upload_video(upload, 'k.mp4', 'K')
+            self.assertTrue(video.keyframe_index)
+            return video.id
+
+    def test_keyframe_table_and_seek_range(self):
+        video_id = self.upload()
+        response = self.client.get(f'/api/videos/keyframes/{video_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([k[1] for k in response.get_json()['keyframes']],
+                         [self.sample_offsets[i] for i in (0, 3, 6, 9)])
+
+        response = self.client.get(f'/api/videos/keyframes/{video_id}?t=0.65')
+        body = response.get_json()
+        self.assertEqual(body['time'], 0.6)
+        self.assertEqual(body['range'], f'bytes={self.sample_offsets[6]}-{self.sample_offsets[9] - 1}')
+
+        etag = response.headers['ETag']
+        response = self.client.get(f'/api/videos/keyframes/{video_id}?t=0.65', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_videos_stored_before_indexing_are_indexed_on_first_request(self):
+        video_id = self.upload()
+        with self.app.app_context():
+            Video.query.get(video_id).keyframe_index = None
+            db.session.commit()
+        self.assertEqual(self.client.get(f'/api/videos/keyframes/{video_id}').status_code, 200)
+        with self.app.app_context():
+            self.assertTrue(Video.query.get(video_id).keyframe_index)
+
+    def test_video_deleted_by_another_worker(self):
+        video_id = self.upload()
+        self.assertEqual(self.client.get(f'/api/videos/keyframes/{video_id}').status_code, 200)
+        # The row goes without this process's cache hearing about it
+        with self.app.app_context():
+            db.session.delete(Video.query.get(video_id))
+            db.session.commit()
+        self.assertIsNotNone(media_cache.cache.get(('video', video_id)))
+        self.assertEqual(self.client.get(f'/api/videos/keyframes/{video_id}').status_code, 404)
+        self.assertIsNone(media_cache.cache.get(('video', video_id)))
+
+    def test_videos_without_index(self):
+        service = VideoService(self.upload_dir, max_storage_bytes=10 ** 9)
+        with self.app.app_context():
+            upload = FileStorage(stream=io.BytesIO(b'webm' * 100), filename='w.webm', content_type='video/webm')
+            video_id = service.upload_video(upload, 'w.webm', 'W').id
+            self.assertEqual(Video.query.get(video_id).keyframe_index, b'')
+        self.assertEqual(self.client.get(f'/api/videos/keyframes/{video_id}').status_code, 404)
+        self.assertEqual(self.client.get('/api/videos/keyframes/999').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
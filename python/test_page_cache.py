@@ -0,0 +1,71 @@
+'''
+Tests for the rendered-page cache of the UI routes.
+'''
+import os
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+from services.page_cache import PageCache
+
+class PageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.template_folder = tempfile.mkdtemp()
+        self.write('index.html', '<h1>Welcome</h1><a href="{{ url_for(\'page\') }}">home</a>')
+        self.cache = PageCache()
+        self.app = Flask(__name__, template_folder=self.template_folder)
+
+        @self.app.route('/page')
+        def page():
+            return self.cache.send('index.html')
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.template_folder)
+
+    def write(self, name, text):
+        path = os.path.join(self.template_folder, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        # Bump the mtime past the filesystem's resolution
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 5 * 10 ** 9))
+
+    def test_pages_are_rendered_once(self):
+        first = self.client.get('/page')
+        self.assertEqual(first.get_data(as_text=True), '<h1>Welcome</h1><a href="/page">home</a>')
+        self.write('index.html', '<h1>Edited</h1>')
+        second = self.client.get('/page')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'renders': 1, 'notModified': 0})
+
+    def test_etag_revalidation(self):
+        response = self.client.get('/page')
+        etag = response.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        response = self.client.get('/page', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        response = self.client.get('/page', headers={'If-None-Match': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cache.stats()['notModified'], 1)
+
+    def test_script_root_is_part_of_the_key(self):
+        self.client.get('/page')
+        response = self.client.get('/page', base_url='http://localhost/app/')
+        self.assertIn('href="/app/page"', response.get_data(as_text=True))
+
+    def test_edits_are_picked_up_when_templates_reload(self):
+        self.app.config['TEMPLATES_AUTO_RELOAD'] = True
+        first = self.client.get('/page')
+        self.assertEqual(self.client.get('/page').headers['ETag'], first.headers['ETag'])
+        self.write('index.html', '<h1>Edited</h1>')
+        response = self.client.get('/page', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(as_text=True), '<h1>Edited</h1>')
+        self.assertEqual(self.cache.renders, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+'''
+Tests for the bounded bcrypt executor.
+'''
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, jsonify
+from services.password_hasher import PasswordHasher, HasherBusy
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher(workers=1, queue_limit=1, rounds=4)
+
+    def test_hash_and_verify(self):
+        hashed = self.hasher.hash('secret')
+        self.assertTrue(hashed.startswith('$2b$04$'))
+        self.assertTrue(self.hasher.verify('secret', hashed))
+        self.assertFalse(self.hasher.verify('wrong', hashed))
+        self.assertEqual(self.hasher.stats()['completed'], 3)
+        self.assertEqual(self.hasher.stats()['inFlight'], 0)
+
+    def test_needs_rehash_when_cost_changes(self):
+        hashed = self.hasher.hash('secret')
+        self.assertFalse(self.hasher.needs_rehash(hashed))
+        self.hasher.configure(rounds=5)
+        self.assertTrue(self.hasher.needs_rehash(hashed))
+        self.assertTrue(self.hasher.verify('secret', hashed))
+        self.assertTrue(self.hasher.needs_rehash('not a bcrypt hash'))
+
+    def test_refuses_work_when_queue_is_full(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def blocked():
+            started.set()
+            release.wait()
+
+        # One call running and one queued fill the pool
+        callers = [threading.Thread(target=self.hasher._run, args=(blocked,)) for _ in range(2)]
+        for caller in callers:
+            caller.start()
+        started.wait()
+        while self.hasher.stats()['inFlight'] < 2:
+            time.sleep(0.001)
+        with self.assertRaises(HasherBusy) as busy:
+            self.hasher.hash('secret')
+        self.assertGreaterEqual(busy.exception.retry_after, 1)
+        self.assertEqual(self.hasher.stats()['rejected'], 1)
+
+        release.set()
+        for caller in callers:
+            caller.join()
+        self.assertTrue(self.hasher.verify('secret', self.hasher.hash('secret')))
+
+    def test_login_burst_leaves_threads_for_streams(self):
+        request_threads = 8
+        hasher = PasswordHasher(workers=1, queue_limit=8, rounds=4, request_threads=request_threads)
+        self.assertEqual(hasher.admission_limit(), request_threads // 2)
+        release = threading.Event()
+        app = Flask(__name__)
+
+        @app.route('/login')
+        def login():
+            try:
+                hasher._run(release.wait)
+            except HasherBusy as busy:
+                return jsonify({'error': str(busy)}), 503, {'Retry-After': str(busy.retry_after)}
+            return jsonify({'ok': True}), 200
+
+        @app.route('/stream')
+        def stream():
+            return b'video bytes'
+
+        # A threaded server's request threads, all hit by a burst of logins
+        server = ThreadPoolExecutor(max_workers=request_threads)
+        try:
+            logins = [server.submit(app.test_client().get, '/login') for _ in range(2 * request_threads)]
+            deadline = time.monotonic() + 5
+            while hasher.stats()['rejected'] < len(logins) - hasher.admission_limit():
+                self.assertLess(time.monotonic(), deadline, 'logins took every request thread')
+                time.sleep(0.001)
+            stream = server.submit(app.test_client().get, '/stream').result(timeout=5)
+            self.assertEqual(stream.data, b'video bytes')
+            release.set()
+            statuses = [login.result(timeout=5).status_code for login in logins]
+        finally:
+            release.set()
+            server.shutdown()
+        self.assertEqual(statuses.count(503), len(logins) - request_threads // 2)
+        self.assertEqual(statuses.count(200), request_threads // 2)
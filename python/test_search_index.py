@@ -0,0 +1,89 @@
+'''
+Tests for the full-text media search index.
+'''
+import unittest
+from flask import Flask
+from models.video_model import db, Video
+from models.file_model import File, FileModel
+from services.search_index import SearchIndex, match_query
+
+class MatchQueryTestCase(unittest.TestCase):
+    def test_words_become_quoted_prefixes(self):
+        self.assertEqual(match_query('holi vid'), '"holi"* "vid"*')
+        self.assertEqual(match_query('NOT "x" OR y-z'), '"NOT"* "x"* "OR"* "y"* "z"*')
+        self.assertIsNone(match_query(' -*" '))
+
+class SearchIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.index = SearchIndex()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def add_video(self, title):
+        video = Video(key=f'{title}.mp4', title=title, size_bytes=1, mime_type='video/mp4')
+        db.session.add(video)
+        db.session.commit()
+        return video
+
+    def add_file(self, name):
+        file = File(key=name, original_name=name, filepath=name, size=1, uploaded_by='alice')
+        db.session.add(file)
+        db.session.commit()
+        return file
+
+    def test_existing_rows_are_indexed_on_install(self):
+        self.add_video('Holiday Video')
+        self.assertTrue(self.index.install())
+        self.assertTrue(self.index.available())
+        self.assertEqual([v.title for v in self.index.search_videos('holi vid').items], ['Holiday Video'])
+
+    def test_triggers_follow_changes(self):
+        self.index.install()
+        video = self.add_video('Beach day')
+        self.add_file('beach_notes.txt')
+        self.assertEqual(self.index.search_videos('beach').total, 1)
+        self.assertEqual([f.original_name for f in self.index.search_files('beach').items], ['beach_notes.txt'])
+
+        video.title = 'Mountain day'
+        db.session.commit()
+        self.assertEqual(self.index.search_videos('beach').total, 0)
+        self.assertEqual(self.index.search_videos('mount').items, [video])
+
+        db.session.delete(video)
+        db.session.commit()
+        self.assertEqual(self.index.search_videos('mount').total, 0)
+
+    def test_ranking_and_pagination(self):
+        self.index.install()
+        for i in range(5):
+            self.add_video(f'cat clip {i} with a much longer title than the best match')
+        best = self.add_video('cat')
+        first = self.index.search_videos('cat', page=1, per_page=2)
+        self.assertEqual(first.total, 6)
+        self.assertEqual(first.pages, 3)
+        self.assertEqual(first.items[0], best)
+        seen = {v.id for page in (1, 2, 3) for v in self.index.search_videos('cat', page=page, per_page=2).items}
+        self.assertEqual(len(seen), 6)
+
+    def test_like_fallback_without_index(self):
+        self.add_video('Holiday Video')
+        self.add_file('holiday.txt')
+        self.assertFalse(self.index.available())
+        self.assertEqual(self.index.search_videos('liday').total, 1)
+        self.assertEqual(self.index.search_files('holiday').total, 1)
+        self.assertEqual(self.index.search_files('').total, 0)
+
+    def test_file_model_search(self):
+        from services.search_index import search_index
+        search_index.install()
+        self.add_file('report.pdf')
+        self.assertEqual([f.key for f in FileModel().search_files('rep').items], ['report.pdf'])
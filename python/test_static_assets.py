@@ -0,0 +1,99 @@
+'''
+Tests for the fingerprinted, precompressed static assets.
+'''
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+from flask import Flask, url_for
+from services import static_assets
+from services.static_assets import StaticAssets, build_assets, fingerprint
+
+class StaticAssetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.static_folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.static_folder, 'css'))
+        self.css = b'body { color: #333; }\n' * 200
+        self.write('css/main.css', self.css)
+        self.write('logo.png', os.urandom(2000))
+
+    def tearDown(self):
+        shutil.rmtree(self.static_folder)
+
+    def write(self, name, data):
+        with open(os.path.join(self.static_folder, name), 'wb') as f:
+            f.write(data)
+
+    def create_app(self, auto_reload=None):
+        app = Flask(__name__, static_folder=self.static_folder, static_url_path='/static')
+        StaticAssets(self.static_folder, auto_reload=auto_reload).init_app(app)
+
+        @app.route('/link/<path:filename>')
+        def link(filename):
+            return url_for('static', filename=filename)
+
+        return app
+
+    def test_build_writes_manifest_and_variants(self):
+        manifest = build_assets(self.static_folder)
+        digest = fingerprint(os.path.join(self.static_folder, 'css/main.css'))
+        self.assertEqual(manifest['css/main.css'], f'dist/css/main.{digest}.css')
+        with open(os.path.join(self.static_folder, 'dist', 'manifest.json')) as f:
+            self.assertEqual(json.load(f), manifest)
+        target = os.path.join(self.static_folder, manifest['css/main.css'])
+        with open(target + '.gz', 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), self.css)
+        # Images are not compressed again
+        self.assertFalse(os.path.exists(os.path.join(self.static_folder, manifest['logo.png']) + '.gz'))
+        # A rebuild does not fingerprint its own output
+        self.assertEqual(build_assets(self.static_folder), manifest)
+
+    def test_fingerprinted_links_and_responses(self):
+        manifest = build_assets(self.static_folder)
+        client = self.create_app().test_client()
+        url = client.get('/link/css/main.css').get_data(as_text=True)
+        self.assertEqual(url, '/static/' + manifest['css/main.css'])
+
+        response = client.get(url, headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(response.data, self.css)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn(f'max-age={static_assets.IMMUTABLE_MAX_AGE}', response.headers['Cache-Control'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertNotIn('Content-Encoding', response.headers)
+
+        response = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertEqual(gzip.decompress(response.data), self.css)
+
+    def test_unbuilt_assets_are_served_as_before(self):
+        client = self.create_app().test_client()
+        self.assertEqual(client.get('/link/css/main.css').get_data(as_text=True), '/static/css/main.css')
+        response = client.get('/static/css/main.css')
+        self.assertEqual(response.data, self.css)
+        self.assertNotIn('immutable', response.headers.get('Cache-Control', ''))
+
+    def test_edited_assets_fall_back_to_their_source(self):
+        build_assets(self.static_folder)
+        client = self.create_app(auto_reload=True).test_client()
+        self.assertIn('/dist/', client.get('/link/css/main.css').get_data(as_text=True))
+        self.write('css/main.css', b'body { color: red; }\n')
+        # Bump the mtime past the filesystem's resolution
+        stat = os.stat(os.path.join(self.static_folder, 'css/main.css'))
+        os.utime(os.path.join(self.static_folder, 'css/main.css'), (stat.st_atime, stat.st_mtime + 5))
+        self.assertEqual(client.get('/link/css/main.css').get_data(as_text=True), '/static/css/main.css')
+        # The image was not edited and keeps its fingerprint
+        self.assertIn('/dist/', client.get('/link/logo.png').get_data(as_text=True))
+
+    @unittest.skipUnless(static_assets.brotli, 'Brotli is not installed')
+    def test_brotli_is_preferred(self):
+        manifest = build_assets(self.static_folder)
+        client = self.create_app().test_client()
+        response = client.get('/static/' + manifest['css/main.css'], headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(static_assets.brotli.decompress(response.data), self.css)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+'''
+Tests for the mmap stream backend and its read-ahead and drop-behind hints.
+'''
+import os
+import mmap
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from flask import Flask
+from models.video_model import db, Video
+from services.media_cache import media_cache
+from services.block_cache import block_cache
+from services.media_server import MediaServer
+from services.media_stream import stream_file
+from services.stream_backend import StreamBackend, MappedRange, stream_backend
+from test_media_server import call
+
+class MappedRangeTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        self.data = os.urandom(64 * mmap.PAGESIZE)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.data)
+        self.fd = os.open(self.path, os.O_RDONLY)
+
+    def tearDown(self):
+        os.close(self.fd)
+        os.remove(self.path)
+
+    def test_views_of_an_unaligned_range(self):
+        mapped = MappedRange(self.fd, 5000, 20000, readahead=8192)
+        view = mapped.view(5000, 100)
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(view.tobytes(), self.data[5000:5100])
+        self.assertEqual(mapped.view(24990, 100).tobytes(), self.data[24990:25000])
+        self.assertEqual(len(mapped.view(25000, 100)), 0)
+        mapped.fault_in(view)
+        # A slice still held by a server does not stop the range from closing
+        mapped.close()
+        self.assertEqual(view.tobytes(), self.data[5000:5100])
+
+    def test_hints_follow_the_reader(self):
+        page = mmap.PAGESIZE
+        advice = []
+        with mock.patch('os.posix_fadvise', lambda fd, offset, length, hint: advice.append((hint, offset, length))):
+            mapped = MappedRange(self.fd, 0, len(self.data), readahead=4 * page, keep_head=8 * page)
+            for position in range(0, len(self.data), page):
+                mapped.view(position, page)
+            mapped.close()
+        self.assertEqual(advice[0], (os.POSIX_FADV_SEQUENTIAL, 0, len(self.data)))
+        ahead = [(offset, length) for hint, offset, length in advice if hint == os.POSIX_FADV_WILLNEED]
+        # The windows asked for cover the file once, without gaps
+        self.assertEqual(ahead[0][0], 0)
+        self.assertEqual(sum(length for _, length in ahead), len(self.data))
+        dropped = [(offset, length) for hint, offset, length in advice if hint == os.POSIX_FADV_DONTNEED]
+        self.assertTrue(dropped)
+        # The head is kept, and nothing within a window of the reader is dropped
+        self.assertEqual(dropped[0][0], 8 * page)
+        self.assertLessEqual(sum(dropped[-1]), len(self.data) - 4 * page)
+
+    def test_no_drop_behind_when_disabled(self):
+        advice = []
+        with mock.patch('os.posix_fadvise', lambda fd, offset, length, hint: advice.append(hint)):
+            mapped = MappedRange(self.fd, 0, len(self.data), readahead=mmap.PAGESIZE, drop_behind=False)
+            for position in range(0, len(self.data), mmap.PAGESIZE):
+                mapped.view(position, mmap.PAGESIZE)
+            mapped.close()
+        self.assertNotIn(os.POSIX_FADV_DONTNEED, advice)
+
+    def test_unknown_backends_are_refused(self):
+        with self.assertRaises(ValueError):
+            StreamBackend().configure(name='splice')
+
+class MappedStreamTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.content = os.urandom(300000)
+        self.path = os.path.join(self.upload_dir, 'clip.mp4')
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        db.init_app(self.app)
+        backend = StreamBackend('mmap', readahead_bytes=64 * 1024)
+
+        @self.app.route('/stream')
+        def stream():
+            return stream_file(self.path, 'video/mp4', backend=backend)
+
+        with self.app.app_context():
+            db.create_all()
+            video = Video(key='clip.mp4', title='Clip', size_bytes=len(self.content), mime_type='video/mp4')
+            db.session.add(video)
+            db.session.commit()
+            self.video_id = video.id
+        media_cache.clear()
+
+    def tearDown(self):
+        stream_backend.configure(name='sendfile')
+        media_cache.clear()
+        shutil.rmtree(self.upload_dir)
+
+    def test_wsgi_responses(self):
+        client = self.app.test_client()
+        self.assertEqual(client.get('/stream').data, self.content)
+        response = client.get('/stream', headers={'Range': 'bytes=70000-270000'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, self.content[70000:270001])
+        response = client.get('/stream', headers={'Range': 'bytes=0-9,200000-200009'})
+        self.assertIn(self.content[200000:200010], response.data)
+
+    def test_asgi_responses(self):
+        stream_backend.configure(name='mmap')
+        # Past the cached head every range is read through the mapping
+        self.addCleanup(block_cache.configure, max_bytes=block_cache.max_bytes)
+        block_cache.configure(max_bytes=0)
+        map_range = mock.patch.object(stream_backend, 'map_range', wraps=stream_backend.map_range).start()
+        self.addCleanup(mock.patch.stopall)
+        server = MediaServer(self.app)
+        path = f'/api/videos/stream/{self.video_id}'
+        self.assertEqual(call(server, 'GET', path)['body'], self.content)
+        response = call(server, 'GET', path, [('Range', 'bytes=123-299999')])
+        self.assertEqual((response['status'], response['body']), (206, self.content[123:]))
+        self.assertEqual(map_range.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+'''
+Tests for the user model on the shared Flask-SQLAlchemy engine.
+'''
+import unittest
+from flask import Flask
+from sqlalchemy.pool import QueuePool
+from models.video_model import db
+from models.user_model import User, UserModel
+from models.database import engine_options
+
+class UserModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.model = UserModel()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def test_users_live_in_the_shared_database(self):
+        user = self.model.create('alice', 'alice@example.com', 'hash', is_admin=1, is_approved=1)
+        self.model.create('bob', 'bob@example.com', 'hash')
+        self.assertEqual(db.session.query(User).count(), 2)
+        self.assertEqual(self.model.get_by_username('alice').id, user.id)
+        self.assertEqual([u.username for u in self.model.get_users_by_approval_status(0)], ['bob'])
+        self.assertTrue(self.model.approve_user(self.model.get_by_username('bob').id))
+        self.assertEqual(self.model.count_users(), 2)
+        self.assertTrue(self.model.delete_user(user.id))
+        self.assertIsNone(self.model.get_user_by_id(user.id))
+
+    def test_engine_options(self):
+        options = engine_options('sqlite:////tmp/media.db', pool_size=3)
+        self.assertIs(options['poolclass'], QueuePool)
+        self.assertEqual(options['pool_size'], 3)
+        self.assertFalse(options['connect_args']['check_same_thread'])
+        self.assertEqual(engine_options('sqlite:///:memory:'), {})
+        self.assertTrue(engine_options('postgresql://db/media')['pool_pre_ping'])
@@ -2,13 +2,24 @@
 Basic tests for VideoService and Video model.
 '''
 import unittest
-from flask import Flask
+from flask import Flask, request
 from flask_sqlalchemy import SQLAlchemy
 from models.video_model import db, Video
+from models.blob_model import Blob
+from models.file_model import File
+from services.usage_ledger import usage_ledger, QuotaExceeded
 from services.video_service import VideoService
+from services.upload_stream import StreamingUploadRequest, StagedUpload, staging_dir
 import tempfile
+import shutil
+import io
+import hashlib
 import os
+import time
+import threading
+from unittest import mock
 from werkzeug.datastructures import FileStorage
+from services.blob_store import BlobStore
 
 class VideoServiceTestCase(unittest.TestCase):
     def setUp(self):
@@ -27,9 +38,7 @@ class VideoServiceTestCase(unittest.TestCase):
 
     def tearDown(self):
         # Remove temp upload dir
-        for f in os.listdir(self.upload_dir):
-            os.remove(os.path.join(self.upload_dir, f))
-        os.rmdir(self.upload_dir)
+        shutil.rmtree(self.upload_dir)
 
     def test_add_dummy_video(self):
         # Add a dummy video row directly
@@ -72,4 +81,203 @@ class VideoServiceTestCase(unittest.TestCase):
                 self.assertEqual(video.mime_type, 'video/mp4')
                 
                 # Check if the file exists in the upload directory
-                self.assertTrue(os.path.exists(os.path.join(self.upload_dir, 'test_video.mp4')))
\ No newline at end of file
+                self.assertTrue(os.path.exists(os.path.join(self.upload_dir, 'test_video.mp4')))
+
+    def test_resumable_upload(self):
+        # Send chunks out of order, then finalize into a Video record
+        with self.app.app_context():
+            payload = os.urandom(300 * 1024)
+            session = self.service.create_upload_session('resumed.mp4', 'Resumed', 'video/mp4', len(payload))
+            self.assertEqual(session.received_offset(), 0)
+
+            session = self.service.write_upload_chunk(session.id, 200 * 1024, io.BytesIO(payload[200 * 1024:]), 100 * 1024)
+            self.assertEqual(session.received_offset(), 0)
+            with self.assertRaises(ValueError):
+                self.service.finalize_upload(session.id)
+
+            session = self.service.write_upload_chunk(session.id, 0, io.BytesIO(payload[:100 * 1024]), 100 * 1024)
+            self.assertEqual(session.received_offset(), 100 * 1024)
+            session = self.service.write_upload_chunk(session.id, 100 * 1024, io.BytesIO(payload[100 * 1024:200 * 1024]), 100 * 1024)
+            self.assertEqual(session.received_offset(), len(payload))
+
+            video = self.service.finalize_upload(session.id)
+            self.assertEqual(video.size_bytes, len(payload))
+            self.assertEqual(video.blob_sha256, hashlib.sha256(payload).hexdigest())
+            with open(self.service.blob_store.path_for(video.blob_sha256), 'rb') as f:
+                self.assertEqual(f.read(), payload)
+            with self.assertRaises(LookupError):
+                self.service.get_upload_session(session.id)
+
+    def test_finalize_can_be_retried_after_a_failed_commit(self):
+        with self.app.app_context():
+            payload = os.urandom(64 * 1024)
+            session = self.service.create_upload_session('retried.mp4', 'Retried', 'video/mp4', len(payload))
+            self.service.write_upload_chunk(session.id, 0, io.BytesIO(payload), len(payload))
+            digest = hashlib.sha256(payload).hexdigest()
+
+            commit = db.session.commit
+            failures = []
+
+            def fail_once():
+                if not failures:
+                    failures.append(True)
+                    raise RuntimeError("database is locked")
+                commit()
+
+            with mock.patch.object(db.session, 'commit', side_effect=fail_once):
+                with self.assertRaises(RuntimeError):
+                    self.service.finalize_upload(session.id)
+            # Nothing was stored, and the session still holds every byte
+            self.assertIsNone(Blob.query.get(digest))
+            self.assertFalse(os.path.exists(self.service.blob_store.path_for(digest)))
+            self.assertEqual(self.service.get_upload_session(session.id).received_offset(), len(payload))
+
+            video = self.service.finalize_upload(session.id)
+            with open(self.service.blob_store.path_for(video.blob_sha256), 'rb') as f:
+                self.assertEqual(f.read(), payload)
+            self.assertEqual(os.listdir(os.path.join(self.upload_dir, '.partial')), [])
+
+    def test_streamed_request_upload(self):
+        # Multipart bodies parsed by StreamingUploadRequest are staged in the upload folder
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app.request_class = StreamingUploadRequest
+        payload = os.urandom(64 * 1024)
+
+        @self.app.route('/upload', methods=['POST'])
+        def upload():
+            file = request.files['file']
+            self.assertIsInstance(file.stream, StagedUpload)
+            self.assertEqual(os.path.dirname(file.stream.path), staging_dir(self.upload_dir))
+            video = self.service.upload_video(file, 'streamed.mp4', 'Streamed')
+            return {'size': video.size_bytes, 'sha256': file.stream.hexdigest()}
+
+        response = self.app.test_client().post('/upload', data={
+            'file': (io.BytesIO(payload), 'streamed.mp4', 'video/mp4')
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['size'], len(payload))
+        self.assertEqual(response.json['sha256'], hashlib.sha256(payload).hexdigest())
+        with open(self.service.blob_store.path_for(response.json['sha256']), 'rb') as f:
+            self.assertEqual(f.read(), payload)
+        self.assertEqual(os.listdir(staging_dir(self.upload_dir)), [])
+
+    def test_duplicate_content_shares_blob(self):
+        # Identical uploads reference one blob, which outlives all but the last reference
+        with self.app.app_context():
+            payload = os.urandom(4096)
+            first = self.service.upload_video(FileStorage(io.BytesIO(payload), 'a.mp4', content_type='video/mp4'), 'a.mp4', 'A')
+            second = self.service.upload_video(FileStorage(io.BytesIO(payload), 'b.mp4', content_type='video/mp4'), 'b.mp4', 'B')
+            self.assertEqual(first.blob_sha256, second.blob_sha256)
+            blob = Blob.query.get(first.blob_sha256)
+            self.assertEqual(blob.ref_count, 2)
+            blob_path = self.service.blob_store.path_for(first.blob_sha256)
+
+            with self.assertRaises(ValueError):
+                self.service.upload_video(FileStorage(io.BytesIO(b'other'), 'a.mp4', content_type='video/mp4'), 'a.mp4', 'A')
+
+            self.assertTrue(self.service.delete_video(first.id))
+            self.assertTrue(os.path.exists(blob_path))
+            self.assertTrue(self.service.delete_video(second.id))
+            self.assertFalse(os.path.exists(blob_path))
+            self.assertIsNone(Blob.query.get(first.blob_sha256))
+
+    def test_usage_ledger(self):
+        # Counters follow uploads, deletes and reservations without summing rows
+        with self.app.app_context():
+            video = self.service.upload_video(FileStorage(io.BytesIO(b'v' * 1000), 'v.mp4', content_type='video/mp4'),
+                                              'v.mp4', 'V', uploaded_by='alice')
+            db.session.add(File(key='f.bin', original_name='f.bin', filepath='f.bin', size=500, uploaded_by='bob'))
+            db.session.commit()
+            self.assertEqual(usage_ledger.get_usage().used_bytes, 1500)
+            self.assertEqual(usage_ledger.get_usage('alice').used_bytes, 1000)
+            self.assertEqual(usage_ledger.get_usage('bob').used_bytes, 500)
+
+            session = self.service.create_upload_session('r.mp4', 'R', 'video/mp4', 2000, uploaded_by='alice')
+            self.assertEqual(usage_ledger.get_usage('alice').reserved_bytes, 2000)
+            self.service.abort_upload(session.id)
+            self.assertEqual(usage_ledger.get_usage('alice').reserved_bytes, 0)
+
+            self.service.delete_video(video.id)
+            self.assertEqual(usage_ledger.get_usage().used_bytes, 500)
+            self.assertEqual(usage_ledger.get_usage('alice').used_bytes, 0)
+
+    def test_quota_reservation(self):
+        # A reservation counts against the limit until it is released
+        with self.app.app_context():
+            service = VideoService(self.upload_dir, max_storage_bytes=3000, max_user_bytes=1500)
+            service.create_upload_session('a.mp4', 'A', 'video/mp4', 1000, uploaded_by='alice')
+            with self.assertRaises(QuotaExceeded):
+                service.create_upload_session('b.mp4', 'B', 'video/mp4', 1000, uploaded_by='alice')
+            service.create_upload_session('c.mp4', 'C', 'video/mp4', 1000, uploaded_by='bob')
+            with self.assertRaises(QuotaExceeded):
+                service.upload_video(FileStorage(io.BytesIO(b'x' * 1001), 'd.mp4', content_type='video/mp4'), 'd.mp4', 'D')
+            self.assertEqual(os.listdir(staging_dir(self.upload_dir)), [])
+            service.upload_video(FileStorage(io.BytesIO(b'x' * 1000), 'd.mp4', content_type='video/mp4'), 'd.mp4', 'D')
+            total = usage_ledger.get_usage()
+            self.assertEqual((total.used_bytes, total.reserved_bytes), (1000, 2000))
+
+    def test_reconcile_usage(self):
+        # Reconciling rebuilds counters after changes that bypassed the ORM hooks
+        with self.app.app_context():
+            self.service.upload_video(FileStorage(io.BytesIO(b'v' * 700), 'v.mp4', content_type='video/mp4'),
+                                      'v.mp4', 'V', uploaded_by='alice')
+            self.service.create_upload_session('r.mp4', 'R', 'video/mp4', 300)
+            Video.query.filter_by(key='v.mp4').update({'size_bytes': 900})
+            db.session.commit()
+            changes = usage_ledger.reconcile()
+            self.assertEqual(changes['*'], ((700, 300), (900, 300)))
+            self.assertEqual(usage_ledger.get_usage('alice').used_bytes, 900)
+            self.assertEqual(usage_ledger.reconcile(), {})
+
+class BlobStoreRaceTestCase(unittest.TestCase):
+    def setUp(self):
+        # Two sessions need a database file they both see
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.upload_dir, 'media.db')
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        self.store = BlobStore(self.upload_dir)
+        self.payload = b'same bytes' * 1000
+        with self.app.app_context():
+            db.create_all()
+            self.digest = self.store.ingest_path(self.write_copy())
+            db.session.commit()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(self.upload_dir)
+
+    def write_copy(self):
+        fd, path = tempfile.mkstemp(dir=self.upload_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.payload)
+        return path
+
+    def test_purge_waits_for_an_uncommitted_ingest(self):
+        ingested = threading.Event()
+
+        def ingest():
+            with self.app.app_context():
+                # The blob file still exists, so this copy is discarded
+                self.store.ingest_path(self.write_copy())
+                ingested.set()
+                time.sleep(0.2)
+                db.session.commit()
+
+        with self.app.app_context():
+            # The last reference goes, then an identical upload arrives before the purge
+            self.store.release(self.digest)
+            db.session.commit()
+            uploader = threading.Thread(target=ingest)
+            uploader.start()
+            ingested.wait()
+            try:
+                self.assertFalse(self.store.purge(self.digest))
+            finally:
+                uploader.join()
+            self.assertEqual(Blob.query.get(self.digest).ref_count, 1)
+            with open(self.store.path_for(self.digest), 'rb') as f:
+                self.assertEqual(f.read(), self.payload)